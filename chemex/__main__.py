@@ -1,15 +1,26 @@
 #!/usr/bin/env python
 
+import multiprocessing
 import os
 import shutil
 import random
-from copy import deepcopy
+import sys
+from contextlib import contextmanager
 from math import log10
 
-from . import fitting, writing, parsing, reading, utils
+import numpy as np
+import scipy as sp
+
+from . import caching, fitting, writing, parsing, reading, utils
+from .aggregation import ReplicateAggregator
 from .experiments.reading import read_file_exp
 from .experiments.misc import format_experiment_help
 
+# Everything the bootstrap/Monte-Carlo replicates need (arguments, best-fit
+# parameters, dataset). It is set before the worker processes are forked so
+# that they share the dataset rather than receiving a pickled copy per task.
+_REPLICATES = None
+
 
 def print_logo():
     """ Prints ChemEx logo"""
@@ -34,10 +45,12 @@ def print_logo():
     )
 
 
-def make_bootstrap_dataset(data):
-    """Creates a new dataset to run a bootstrap simulation"""
-
-    from random import choice
+def get_profiles(data):
+    """
+    Groups the data points by profile for the bootstrap simulations. Returns
+    the points reordered so that every profile is contiguous, along with the
+    position of the first point and the size of the profile of each point.
+    """
 
     profiles = {}
 
@@ -50,25 +63,59 @@ def make_bootstrap_dataset(data):
 
         profiles.setdefault(profile_id, []).append(data_point)
 
-    data_bs = []
+    points = [data_point
+              for profile in profiles.values() for data_point in profile]
+    sizes = sp.asarray([len(profile) for profile in profiles.values()],
+                       dtype=int)
+    starts = sp.cumsum(sizes) - sizes
+
+    return points, sp.repeat(starts, sizes), sp.repeat(sizes, sizes)
+
+
+def make_bootstrap_dataset(profiles, rng=None):
+    """
+    Creates a new dataset to run a bootstrap simulation: the points of every
+    profile are drawn with replacement (one draw for the whole dataset). The
+    data points are shared with the original dataset, not copied.
+    """
+
+    if rng is None:
+        rng = np.random
+
+    points, starts, sizes = profiles
+
+    indexes = starts + (rng.random_sample(len(points)) * sizes).astype(int)
+
+    return [points[index] for index in indexes]
+
 
-    for profile in profiles.values():
-        data_bs.extend(
-            [choice(profile) for _ in xrange(len(profile))]
-        )
+def make_montecarlo_values(cals, errs, rng=None):
+    """
+    Draws the values of a Monte-Carlo simulation around the back-calculated
+    ones. The dataset itself is the original one with these values swapped
+    in (see swap_values).
+    """
 
-    return data_bs
+    if rng is None:
+        rng = np.random
 
+    return rng.normal(cals, errs)
 
-def make_montecarlo_dataset(data):
-    """Creates a new dataset to run a Monte-Carlo simulation"""
 
-    data_mc = deepcopy(data)
+@contextmanager
+def swap_values(data, vals):
+    """Sets the values of the data points for the duration of the block."""
 
-    for data_pt in data_mc:
-        data_pt.val = random.gauss(data_pt.cal, data_pt.err)
+    vals_orig = [data_pt.val for data_pt in data]
 
-    return data_mc
+    for data_pt, val in zip(data, vals):
+        data_pt.val = val
+
+    try:
+        yield data
+    finally:
+        for data_pt, val in zip(data, vals_orig):
+            data_pt.val = val
 
 
 def read_data(args):
@@ -92,9 +139,10 @@ def read_data(args):
 
 
 def write_results(par, par_err, par_indexes, par_fixed, data, method,
-                  output_dir):
+                  output_dir, replicate=False):
     """Writes the the chi2 of the fit, fitted parameters and the
-    back-calculated points"""
+    back-calculated points (and, for the main fit only, the error of the
+    sampling of the B1 inhomogeneity)"""
 
     utils.header1("Writing Results")
 
@@ -107,6 +155,9 @@ def write_results(par, par_err, par_indexes, par_fixed, data, method,
                        output_dir=output_dir)
     writing.write_par(par, par_err, par_indexes, par_fixed,
                       output_dir=output_dir)
+    if not replicate:
+        writing.write_b1_inh_error(par, par_indexes, par_fixed, data,
+                                   output_dir=output_dir)
     writing.write_dat(data, output_dir=output_dir)
 
 
@@ -129,10 +180,36 @@ def plot_results(par, par_indexes, par_fixed, data, output_dir):
         print(" - Plotting cancelled")
 
 
-def fit_write_plot(args, par, par_indexes, par_fixed, data, output_dir):
+def print_cache_report():
+    """Prints the statistics of the caches by experiment type"""
+
+    utils.header1("Cache Statistics")
+
+    budget = caching.get_memory_budget()
+    used = caching.get_cache_nbytes()
+
+    print("\nMemory budget: {}".format(
+        'none' if budget is None else '{:.1f} MB'.format(budget / 2.0 ** 20)))
+    print("Memory used  : {:.1f} MB\n".format(used / 2.0 ** 20))
+
+    print("  {:<24s} {:>10s} {:>10s} {:>8s} {:>10s}".format(
+        'Group', 'Hits', 'Misses', 'Entries', 'MB'))
+
+    for group, info in caching.get_cache_report().items():
+        print("  {:<24s} {:>10d} {:>10d} {:>8d} {:>10.1f}".format(
+            group, info.hits, info.misses, info.currsize,
+            info.nbytes / 2.0 ** 20))
+
+
+def fit_write_plot(args, par, par_indexes, par_fixed, data, output_dir,
+                   nproc=None, replicate=False):
     # Fit the data to the model
+    if nproc is None:
+        nproc = args.nproc
+
     par_fit, par_err, par_indexes, par_fixed = \
-        fitting.run_fit(args.method, par, par_indexes, par_fixed, data)
+        fitting.run_fit(args.method, par, par_indexes, par_fixed, data,
+                        nproc=nproc)
 
     utils.make_dir(output_dir)
 
@@ -143,7 +220,8 @@ def fit_write_plot(args, par, par_indexes, par_fixed, data, output_dir):
         par_fixed,
         data,
         args.method,
-        output_dir
+        output_dir,
+        replicate=replicate
     )
 
     # Plot results
@@ -153,6 +231,194 @@ def fit_write_plot(args, par, par_indexes, par_fixed, data, output_dir):
     return par_fit, par_err, par_indexes, par_fixed
 
 
+def get_replicate_dir(output_dir, index, n):
+    """Returns the output directory of the replicate number 'index'."""
+
+    formatter_output_dir = ''.join(['{:0', str(int(log10(n)) + 1), 'd}'])
+
+    return os.path.join(output_dir, formatter_output_dir.format(index))
+
+
+def fit_replicate(index, nproc=None):
+    """
+    Fits the bootstrap/Monte-Carlo replicate number 'index'. Its dataset is
+    drawn from a random generator seeded with 'seed + index', so every
+    replicate is reproducible whatever the process running it.
+
+    Returns the output directory of the replicate or, with --aggregate, the
+    vector of fitted parameters (ordered as in the best fit) without writing
+    or plotting anything.
+    """
+
+    args, par, par_indexes, par_fixed, data, resampling, output_dir, n = \
+        _REPLICATES
+
+    rng = np.random.RandomState(args.seed + index)
+
+    output_dir_ = get_replicate_dir(output_dir, index, n)
+
+    if args.bs:
+        data_bs = make_bootstrap_dataset(resampling, rng)
+        return _fit_dataset(args, par, par_indexes, par_fixed, data_bs,
+                            output_dir_, index, nproc)
+
+    with swap_values(data, make_montecarlo_values(*resampling, rng=rng)):
+        return _fit_dataset(args, par, par_indexes, par_fixed, data,
+                            output_dir_, index, nproc)
+
+
+def _fit_dataset(args, par, par_indexes, par_fixed, data, output_dir, index,
+                 nproc):
+    """Fits (and writes and plots unless --aggregate) a replicate dataset."""
+
+    if args.aggregate:
+        par_fit, _par_err, par_indexes_fit, _par_fixed = fitting.run_fit(
+            args.method, par, par_indexes, par_fixed, data, nproc=nproc)
+
+        return index, [par_fit[par_indexes_fit[par_name]]
+                       for par_name in get_par_names(par_indexes)]
+
+    fit_write_plot(
+        args,
+        par,
+        par_indexes,
+        par_fixed,
+        data,
+        output_dir,
+        nproc=nproc,
+        replicate=True
+    )
+
+    return index, output_dir
+
+
+def _fit_replicate_quiet(index):
+    """Fits a replicate in a worker process, logging to a file (or nowhere
+    with --aggregate) rather than to the terminal."""
+
+    args, _par, _par_indexes, _par_fixed, _data, _resampling, output_dir, n = \
+        _REPLICATES
+
+    if args.aggregate:
+        log_filename = os.devnull
+    else:
+        output_dir_ = get_replicate_dir(output_dir, index, n)
+        utils.make_dir(output_dir_)
+        log_filename = os.path.join(output_dir_, 'fit.log')
+
+    stdout = sys.stdout
+
+    with open(log_filename, 'w') as sys.stdout:
+        try:
+            return fit_replicate(index, nproc=1)
+
+        except SystemExit as error:
+            # SystemExit is not sent back to the parent process by the pool,
+            # which would then wait for the result forever
+            raise RuntimeError('Replicate {} stopped: {}'
+                               .format(index, error.code))
+
+        finally:
+            sys.stdout = stdout
+
+
+def get_par_names(par_indexes):
+    """Returns the names of the fitted parameters, ordered by index."""
+
+    return sorted(par_indexes, key=par_indexes.get)
+
+
+def run_replicates(args, par, par_indexes, par_fixed, data, output_dir):
+    """
+    Runs the bootstrap/Monte-Carlo replicates, starting from the best-fit
+    parameters, in parallel over 'args.nproc' processes (defaults to the
+    number of cores).
+
+    With --aggregate, the fitted parameters of the replicates are streamed
+    into a ReplicateAggregator and only their statistics are written.
+    """
+
+    global _REPLICATES
+
+    n = int(args.bs) if args.bs else int(args.mc)
+    simulation = 'bootstrap' if args.bs else 'montecarlo'
+
+    nproc = args.nproc if args.nproc else multiprocessing.cpu_count()
+    nproc = max(1, min(nproc, n))
+
+    if args.seed is None:
+        args.seed = random.SystemRandom().randint(0, 2 ** 31 - 1)
+
+    # Everything the replicates are drawn from is computed once: the grouping
+    # of the points by profile (bootstrap) or the best-fit values and errors
+    # (Monte-Carlo, the back-calculated values of the points are overwritten
+    # by the replicate fits)
+    if args.bs:
+        resampling = get_profiles(data)
+    else:
+        resampling = (sp.asarray([data_pt.cal for data_pt in data]),
+                      sp.asarray([data_pt.err for data_pt in data]))
+
+    _REPLICATES = (args, par, par_indexes, par_fixed, data, resampling,
+                   output_dir, n)
+
+    aggregator = ReplicateAggregator(get_par_names(par_indexes))
+
+    if nproc == 1:
+
+        print("\nRandom seed: {}".format(args.seed))
+
+        results = (fit_replicate(index) for index in range(1, n + 1))
+
+    else:
+
+        utils.header1("Running {} {} Replicates".format(
+            n, 'Bootstrap' if args.bs else 'Monte-Carlo'))
+
+        print("\nRandom seed: {}".format(args.seed))
+        print("Processes  : {}\n".format(nproc))
+
+        pool = multiprocessing.Pool(processes=nproc)
+        results = pool.imap_unordered(_fit_replicate_quiet, range(1, n + 1))
+
+    try:
+        for done, (index, result) in enumerate(results, 1):
+
+            if args.aggregate:
+                aggregator.update(result)
+                if nproc > 1:
+                    print("  * [{}/{}] replicate {}".format(done, n, index))
+
+            elif nproc > 1:
+                print("  * [{}/{}] {}".format(done, n, result))
+
+        if nproc > 1:
+            pool.close()
+
+    except KeyboardInterrupt:
+        if nproc > 1:
+            pool.terminate()
+        exit("\n -- Keyboard Interrupt: replicates stopped")
+
+    except Exception:
+        # The workers must be stopped before being joined, or join would
+        # fail and hide the error of the worker
+        if nproc > 1:
+            pool.terminate()
+        raise
+
+    finally:
+        if nproc > 1:
+            pool.join()
+        _REPLICATES = None
+
+    if args.aggregate:
+        utils.header1("Writing Statistics")
+        print("\nFile(s):")
+        writing.write_statistics(aggregator, simulation, args.seed,
+                                 output_dir=output_dir)
+
+
 def main():
     """All the magic"""
 
@@ -166,6 +432,9 @@ def main():
 
     elif args.commands == 'fit':
 
+        if args.cache_mb is not None:
+            caching.set_memory_budget(args.cache_mb * 2 ** 20)
+
         # Read experimental points
         data = read_data(args)
 
@@ -180,41 +449,23 @@ def main():
             if len(args.res_incl) == 1:
                 output_dir = os.path.join(output_dir, args.res_incl[0].upper())
 
-        if not args.bs:
-            par, par_err, par_indexes, par_fixed = \
-                fit_write_plot(
-                    args,
-                    par,
-                    par_indexes,
-                    par_fixed,
-                    data,
-                    output_dir
-                )
-
-        if args.bs or args.mc:
-
-            n = int(args.bs) if args.bs else int(args.mc)
-            formatter_output_dir = \
-                ''.join(['{:0', str(int(log10(n)) + 1), 'd}'])
-
-            for index in range(1, n + 1):
+        # The replicates are warm-started from the best-fit parameters
+        par, par_err, par_indexes, par_fixed = \
+            fit_write_plot(
+                args,
+                par,
+                par_indexes,
+                par_fixed,
+                data,
+                output_dir
+            )
 
-                if args.bs:
-                    data_index = make_bootstrap_dataset(data)
-                else:
-                    data_index = make_montecarlo_dataset(data)
+        if args.cache_stats:
+            print_cache_report()
 
-                output_dir_ = \
-                    os.path.join(output_dir, formatter_output_dir.format(index))
-
-                fit_write_plot(
-                    args,
-                    par,
-                    par_indexes,
-                    par_fixed,
-                    data_index,
-                    output_dir_
-                )
+        if args.bs or args.mc:
+            run_replicates(args, par, par_indexes, par_fixed, data,
+                           output_dir)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,55 @@
+"""
+Streaming aggregation of the parameters fitted on bootstrap/Monte-Carlo
+replicates.
+"""
+
+import scipy as sp
+
+
+class ReplicateAggregator(object):
+    """
+    Accumulates the fitted parameter vectors of the replicates as they
+    arrive: running mean and co-moment matrix (Welford's algorithm), plus
+    the vectors themselves (one float per parameter and replicate) for the
+    quantiles.
+    """
+
+    def __init__(self, par_names):
+
+        self.par_names = list(par_names)
+        self.count = 0
+        self.mean = sp.zeros(len(self.par_names))
+        self.comoment = sp.zeros((len(self.par_names), len(self.par_names)))
+        self.values = list()
+
+    def update(self, par_vector):
+        """Adds the parameter vector of one replicate."""
+
+        par_vector = sp.asarray(par_vector, dtype=float)
+
+        self.count += 1
+        delta = par_vector - self.mean
+        self.mean += delta / self.count
+        self.comoment += sp.outer(delta, par_vector - self.mean)
+        self.values.append(par_vector)
+
+    def get_covariance(self):
+        """Returns the sample covariance matrix of the parameters."""
+
+        if self.count < 2:
+            return sp.zeros_like(self.comoment)
+
+        return self.comoment / (self.count - 1)
+
+    def get_std(self):
+        """Returns the sample standard deviation of the parameters."""
+
+        return sp.sqrt(sp.diag(self.get_covariance()))
+
+    def get_quantiles(self, percents=(2.5, 50.0, 97.5)):
+        """Returns the quantiles of the parameters, one row per percent."""
+
+        if not self.values:
+            return sp.zeros((len(percents), len(self.par_names)))
+
+        return sp.percentile(sp.asarray(self.values), percents, axis=0)
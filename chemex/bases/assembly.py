@@ -0,0 +1,73 @@
+"""
+Assembly of Liouvillians by tensor contraction.
+
+Each basis module stacks its matrices into a basis tensor BASIS, of shape
+(k, n, n), and lists their names in TERMS. A Liouvillian is a linear
+combination of these matrices, so rather than summing the scaled matrices one
+at a time, it is obtained in one contraction of the vector of coefficients
+with the basis tensor:
+
+    L = sum_i c_i * BASIS[i] = tensordot(c, BASIS, axes=1)
+
+make_assembler selects the terms an experiment needs once, at import time.
+The coefficients can be arrays (e.g. one value per profile), giving a stack of
+Liouvillians of shape (..., n, n).
+"""
+
+import numpy as np
+
+
+def stack_basis(*matrices):
+    """
+    Stacks the matrices of a basis into a basis tensor of shape (k, n, n),
+    real unless some of the matrices are complex.
+    """
+
+    basis = np.array(matrices)
+
+    return basis.astype(np.result_type(basis, float))
+
+
+def make_assembler(basis, terms, names):
+    """
+    Factory to make an "assemble" function building Liouvillians out of some
+    terms of a basis.
+
+    Parameters
+    ----------
+    basis : ndarray, shape (k, n, n)
+        The basis tensor (e.g. chemex.bases.two_states.iph.BASIS).
+    terms : tuple of str
+        The names of the matrices of the basis tensor (e.g.
+        chemex.bases.two_states.iph.TERMS).
+    names : tuple of str
+        The names of the terms used, in the order of the coefficients.
+
+    Returns
+    -------
+    out : function
+        assemble(*coefficients) returns the Liouvillian(s)
+        sum(coefficient * matrix), of shape broadcast(coefficients) + (n, n).
+
+    """
+
+    try:
+        indexes = [terms.index(name) for name in names]
+    except ValueError:
+        raise ValueError('Unknown basis term(s): {}'.format(
+            ', '.join(sorted(set(names) - set(terms)))))
+
+    size = basis.shape[-1]
+    matrices = basis[indexes].reshape(len(indexes), size * size)
+
+    def assemble(*coefficients):
+        """Builds the Liouvillian(s) from the coefficients of the terms."""
+
+        coefficients = np.stack(np.broadcast_arrays(*coefficients), axis=-1)
+        liouvillians = np.dot(coefficients, matrices)
+
+        return liouvillians.reshape(coefficients.shape[:-1] + (size, size))
+
+    assemble.names = tuple(names)
+
+    return assemble
@@ -0,0 +1,190 @@
+"""
+Helpers to propagate parameter derivatives along with the magnetization.
+
+A Liouvillian L and its derivatives dL/dp_1, ..., dL/dp_n are packed into the
+block lower-triangular matrix:
+
+    [ L       0   ...  0 ]
+    [ dL/dp_1 L   ...  0 ]
+    [ ...         ...    ]
+    [ dL/dp_n 0   ...  L ]
+
+The exponential of this matrix contains exp(L) on its diagonal and the Frechet
+derivatives of exp(L) in the directions dL/dp_i in its first block column
+(Van Loan's block-triangular identity). Products and powers of such matrices
+follow the product rule, so an entire pulse sequence can be differentiated by
+simply running it on augmented matrices and vectors.
+
+The augmented matrices are (n + 1) times larger than the original ones, so
+multiplying or exponentiating them directly costs about (n + 1)^3 times more.
+The costly steps can instead work on the "split" form of the augmented
+matrices, a (matrix, derivatives) pair, with the derivatives stacked along a
+first axis (see split_matrix and pack_matrix): products follow the product
+rule and exponentials are obtained from the eigendecomposition of the
+Liouvillian alone.
+"""
+
+import numpy as np
+from scipy import asarray, eye, kron, vstack, zeros
+
+from chemex.bases.expm import expm_frechet_batch
+
+
+def augment_liouvillian(liouvillian, d_liouvillians):
+    """Packs a Liouvillian and its derivatives as described above."""
+
+    size = len(liouvillian)
+    par_nb = len(d_liouvillians)
+
+    augmented = kron(eye(par_nb + 1), liouvillian)
+
+    for index, d_liouvillian in enumerate(d_liouvillians, 1):
+        augmented[index * size:(index + 1) * size, :size] = d_liouvillian
+
+    return augmented
+
+
+def augment_matrix(matrix, par_nb):
+    """Packs a parameter-independent matrix (e.g. a perfect pulse)."""
+
+    return kron(eye(par_nb + 1), matrix)
+
+
+def augment_vector(vector, d_vectors):
+    """Packs a magnetization vector and its derivatives."""
+
+    return vstack([vector] + list(d_vectors))
+
+
+def augment_constant_vector(vector, par_nb):
+    """Packs a parameter-independent magnetization vector."""
+
+    vector = asarray(vector)
+
+    return vstack([vector] + [zeros(vector.shape)] * par_nb)
+
+
+def split_vector(augmented, par_nb):
+    """Unpacks a magnetization vector (or a stack of them, shape
+    (..., n, 1)) and its derivatives."""
+
+    size = augmented.shape[-2] // (par_nb + 1)
+
+    return [augmented[..., index * size:(index + 1) * size, :]
+            for index in range(par_nb + 1)]
+
+
+def split_matrix(augmented, par_nb):
+    """Unpacks an augmented matrix (or a stack of them, shape (..., n, n))
+    into its split form."""
+
+    augmented = np.asarray(augmented)
+    size = augmented.shape[-1] // (par_nb + 1)
+
+    matrix = augmented[..., :size, :size]
+    d_matrices = np.array([augmented[..., index * size:(index + 1) * size,
+                                     :size]
+                           for index in range(1, par_nb + 1)])
+
+    return matrix, d_matrices.reshape((par_nb,) + matrix.shape)
+
+
+def pack_matrix(matrix, d_matrices):
+    """Packs a matrix (or a stack of them) and its derivatives into an
+    augmented matrix, the reverse of split_matrix."""
+
+    matrix = np.asarray(matrix)
+    size = matrix.shape[-1]
+    par_nb = len(d_matrices)
+
+    shape = np.broadcast(matrix, *d_matrices).shape[:-2]
+    augmented = np.zeros(shape + ((par_nb + 1) * size,) * 2,
+                         dtype=np.result_type(matrix, *d_matrices))
+
+    for index in range(par_nb + 1):
+        block = slice(index * size, (index + 1) * size)
+        augmented[..., block, block] = matrix
+
+    for index, d_matrix in enumerate(d_matrices, 1):
+        augmented[..., index * size:(index + 1) * size, :size] = d_matrix
+
+    return augmented
+
+
+def expm_split(split, times=None):
+    """
+    Calculates the exponentials of a Liouvillian in split form (or a stack of
+    them) multiplied by the durations 'times', in split form (see
+    chemex.bases.expm.expm_frechet_batch).
+    """
+
+    return expm_frechet_batch(split[0], split[1], times)
+
+
+def expm_augmented(augmented, par_nb, times=None):
+    """Same as expm_split, for an augmented Liouvillian."""
+
+    return pack_matrix(*expm_split(split_matrix(augmented, par_nb), times))
+
+
+def dot_split(split_a, split_b):
+    """Multiplies two matrices in split form (or stacks of them)."""
+
+    (a, d_a), (b, d_b) = split_a, split_b
+
+    ndim = max(np.ndim(a), np.ndim(b))
+
+    return (np.matmul(a, b),
+            np.matmul(_align(d_a, ndim), b) + np.matmul(a, _align(d_b, ndim)))
+
+
+def matrix_power_split(split, powers):
+    """
+    Raises a matrix in split form (or a stack of them) to non-negative integer
+    powers (see chemex.bases.expm.matrix_power_batch), by binary
+    exponentiation.
+    """
+
+    matrix, d_matrices = split
+    powers = np.asarray(powers, dtype=int)
+
+    par_nb = len(d_matrices)
+    shape = np.broadcast(matrix[..., 0, 0], powers).shape
+    size = matrix.shape[-1]
+
+    squares = np.array(np.broadcast_to(matrix, shape + (size, size)))
+    d_squares = np.array(np.broadcast_to(_align(d_matrices, matrix.ndim),
+                                         (par_nb,) + shape + (size, size)))
+    powers = np.array(np.broadcast_to(powers, shape))
+
+    results = np.zeros_like(squares)
+    results[...] = np.eye(size)
+    d_results = np.zeros_like(d_squares)
+
+    while True:
+
+        odd = (powers & 1).astype(bool)
+        d_results[:, odd] = (np.matmul(d_results[:, odd], squares[odd]) +
+                             np.matmul(results[odd], d_squares[:, odd]))
+        results[odd] = np.matmul(results[odd], squares[odd])
+        powers >>= 1
+
+        if not powers.any():
+            break
+
+        d_squares = (np.matmul(d_squares, squares) +
+                     np.matmul(squares, d_squares))
+        squares = np.matmul(squares, squares)
+
+    return results, d_results
+
+
+def _align(d_matrices, ndim):
+    """Inserts axes after the parameter axis of stacked derivatives, so that
+    they broadcast against matrices with 'ndim' dimensions."""
+
+    d_matrices = np.asarray(d_matrices)
+    extra = ndim + 1 - d_matrices.ndim
+
+    return d_matrices.reshape(d_matrices.shape[:1] + (1,) * extra +
+                              d_matrices.shape[1:])
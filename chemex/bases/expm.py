@@ -0,0 +1,401 @@
+"""
+Batched exponentials of small matrices (Liouvillians).
+
+The propagators of the back-calculations are exponentials of 4x4 to 18x18
+matrices. Computing them one at a time with scipy.linalg.expm is dominated by
+the call overhead rather than the arithmetic, so the functions below
+exponentiate whole stacks of matrices (shape (..., n, n)) in one vectorized
+call:
+
+    expm_batch(l, t)        exp(l * t)
+    expm_apply(l, v, t)     exp(l * t) . v
+    expm_frechet_batch(l, e, t)
+                            exp(l * t) and its derivatives in the
+                            directions e (see chemex.bases.derivatives)
+
+along with batched integer powers of matrices (matrix_power_batch).
+
+The durations 't' are broadcast against the leading dimensions of the stack.
+A stack of shape (N, 1, n, n) with durations of shape (M,) gives propagators
+of shape (N, M, n, n) from only N eigendecompositions, as
+
+    exp(l * t) = V . diag(exp(w * t)) . V^-1
+
+where w and V are the eigenvalues and eigenvectors of l. Matrices whose
+eigenvectors are (nearly) linearly dependent (defective or close to) are
+exponentiated with a batched Pade approximant with scaling and squaring
+instead.
+"""
+
+import numpy as np
+
+# Coefficients and threshold of the [13/13] Pade approximant (Higham, SIAM J.
+# Matrix Anal. Appl. 26, 1179, 2005)
+PADE_13 = (64764752532480000.0, 32382376266240000.0, 7771770303897600.0,
+           1187353796428800.0, 129060195264000.0, 10559470521600.0,
+           670442572800.0, 33522128640.0, 1323241920.0, 40840800.0,
+           960960.0, 16380.0, 182.0, 1.0)
+THETA_13 = 5.371920351148152
+
+# Above this condition number of the eigenvectors, the eigendecomposition is
+# not trusted and the Pade approximant is used instead
+COND_MAX = 1.0e8
+
+
+def expm_batch(liouvillians, times=None, method='eig'):
+    """
+    Calculates the exponentials of a stack of matrices.
+
+    Parameters
+    ----------
+    liouvillians : array_like, shape (..., n, n)
+        The matrices to exponentiate.
+    times : array_like, optional
+        Durations by which the matrices are multiplied, broadcast against the
+        leading dimensions of 'liouvillians'.
+    method : {'eig', 'pade'}
+        Batched eigendecomposition (with a Pade fallback for the defective
+        matrices) or Pade approximant for all the matrices.
+
+    Returns
+    -------
+    out : ndarray, shape (..., n, n)
+        The exponentials. They are real if the inputs are.
+
+    """
+
+    liouvillians = np.asarray(liouvillians)
+    times = _get_times(liouvillians, times)
+
+    if method == 'pade':
+        return _expm_pade(liouvillians * times[..., np.newaxis, np.newaxis])
+
+    values, vectors, vectors_inv, defective = _eig(liouvillians)
+
+    exponentials = np.exp(values * times[..., np.newaxis])
+    propagators = np.matmul(vectors * exponentials[..., np.newaxis, :],
+                            vectors_inv)
+
+    propagators = _real_if_real(propagators, liouvillians, times)
+
+    return _fix_defective(propagators, liouvillians, times, defective)
+
+
+def expm_apply(liouvillians, vectors, times=None, method='eig'):
+    """
+    Calculates the product of the exponentials of a stack of matrices with
+    (a stack of) vectors, without forming the exponentials.
+
+    Parameters
+    ----------
+    liouvillians : array_like, shape (..., n, n)
+        The matrices to exponentiate.
+    vectors : array_like, shape (..., n, 1)
+        The vectors (e.g. the equilibrium magnetization), broadcast against
+        the stack of matrices.
+    times : array_like, optional
+        Durations by which the matrices are multiplied, broadcast against the
+        leading dimensions of 'liouvillians'.
+    method : {'eig', 'pade'}
+        See expm_batch.
+
+    Returns
+    -------
+    out : ndarray, shape (..., n, 1)
+        The propagated vectors.
+
+    """
+
+    liouvillians = np.asarray(liouvillians)
+    vectors = np.asarray(vectors)
+    times = _get_times(liouvillians, times)
+
+    if method == 'pade':
+        return np.matmul(expm_batch(liouvillians, times, method), vectors)
+
+    values, eig_vectors, eig_vectors_inv, defective = _eig(liouvillians)
+
+    exponentials = np.exp(values * times[..., np.newaxis])
+    propagated = np.matmul(
+        eig_vectors,
+        exponentials[..., np.newaxis] * np.matmul(eig_vectors_inv, vectors)
+    )
+
+    propagated = _real_if_real(propagated, liouvillians, times, vectors)
+
+    if defective.any():
+        shape = propagated.shape[:-2]
+        defective = np.broadcast_to(defective, shape)
+        liouvillians = np.broadcast_to(liouvillians,
+                                       shape + liouvillians.shape[-2:])
+        times = np.broadcast_to(times, shape)
+        vectors = np.broadcast_to(vectors, propagated.shape)
+        propagated = np.array(propagated)
+        propagated[defective] = np.matmul(
+            _expm_pade(liouvillians[defective] *
+                       times[defective][..., np.newaxis, np.newaxis]),
+            vectors[defective]
+        )
+
+    return propagated
+
+
+def expm_frechet_batch(liouvillians, directions, times=None):
+    """
+    Calculates the exponentials of a stack of matrices along with their
+    Frechet derivatives, i.e. the derivatives of exp(l * t) when l varies in
+    the given directions.
+
+    With the eigendecomposition l = V . diag(w) . V^-1, the derivative in
+    the direction e is V . ((V^-1 . e . V) o F) . V^-1, with the divided
+    differences F_ij = (exp(w_i * t) - exp(w_j * t)) / (w_i - w_j) (and
+    t * exp(w_i * t) if w_i = w_j) of the eigenvalues w. The defective matrices are handled with
+    the Pade approximant of Van Loan's block-triangular matrices instead.
+
+    Parameters
+    ----------
+    liouvillians : array_like, shape (..., n, n)
+        The matrices to exponentiate.
+    directions : array_like, shape (p, ..., n, n)
+        The directions of the derivatives, stacked along a first axis.
+    times : array_like, optional
+        Durations by which the matrices are multiplied, broadcast against the
+        leading dimensions of 'liouvillians'.
+
+    Returns
+    -------
+    out : ndarray, shape (..., n, n), and ndarray, shape (p, ..., n, n)
+        The exponentials and their derivatives.
+
+    """
+
+    liouvillians = np.asarray(liouvillians)
+    directions = np.asarray(directions)
+    times = _get_times(liouvillians, times)
+
+    values, vectors, vectors_inv, defective = _eig(liouvillians)
+
+    if defective.any():
+        return _expm_frechet_pade(liouvillians, directions, times)
+
+    scaled = values * times[..., np.newaxis]
+    exponentials = np.exp(scaled)
+
+    propagators = np.matmul(vectors * exponentials[..., np.newaxis, :],
+                            vectors_inv)
+
+    # exp(w_i * t) * t * (exp(d) - 1) / d, with d = (w_j - w_i) * t and
+    # w_i the eigenvalue with the larger real part, so that exp(d) does not
+    # overflow. This is also accurate for close eigenvalues.
+    upper = scaled.real[..., :, np.newaxis] >= scaled.real[..., np.newaxis, :]
+    differences = scaled[..., np.newaxis, :] - scaled[..., :, np.newaxis]
+    differences = np.where(upper, differences, -differences)
+    pivots = np.where(upper, exponentials[..., :, np.newaxis],
+                      exponentials[..., np.newaxis, :])
+    close = differences == 0.0
+    differences[close] = 1.0
+    ratios = np.where(close, 1.0, np.expm1(differences) / differences)
+    divided = pivots * ratios * times[..., np.newaxis, np.newaxis]
+
+    rotated = np.matmul(np.matmul(vectors_inv, directions), vectors)
+    rotated = _align(rotated, divided.ndim)
+    derivatives = np.matmul(np.matmul(vectors, rotated * divided),
+                            vectors_inv)
+
+    return (_real_if_real(propagators, liouvillians, times),
+            _real_if_real(derivatives, liouvillians, directions, times))
+
+
+def matrix_power_batch(matrices, powers):
+    """
+    Raises a stack of matrices to (different) non-negative integer powers, by
+    binary exponentiation: about log2(max(powers)) batched products.
+
+    Parameters
+    ----------
+    matrices : array_like, shape (..., n, n)
+        The matrices.
+    powers : array_like of int
+        The powers, broadcast against the leading dimensions of 'matrices'.
+
+    Returns
+    -------
+    out : ndarray, shape (..., n, n)
+        The matrix powers.
+
+    """
+
+    matrices = np.asarray(matrices)
+    powers = np.asarray(powers, dtype=int)
+
+    shape = np.broadcast(matrices[..., 0, 0], powers).shape
+    squares = np.array(np.broadcast_to(matrices,
+                                       shape + matrices.shape[-2:]))
+    powers = np.array(np.broadcast_to(powers, shape))
+
+    results = np.zeros_like(squares)
+    results[...] = np.eye(matrices.shape[-1])
+
+    while True:
+
+        odd = (powers & 1).astype(bool)
+        results[odd] = np.matmul(results[odd], squares[odd])
+        powers >>= 1
+
+        if not powers.any():
+            break
+
+        squares = np.matmul(squares, squares)
+
+    return results
+
+
+def _get_times(liouvillians, times):
+    """Returns the durations as an array (1.0 if not given)."""
+
+    if times is None:
+        return np.ones(liouvillians.shape[:-2])
+
+    return np.asarray(times)
+
+
+def _eig(liouvillians):
+    """
+    Batched eigendecomposition. Also returns the inverses of the eigenvector
+    matrices and a mask of the (numerically) defective matrices.
+    """
+
+    values, vectors = np.linalg.eig(liouvillians)
+
+    # Cheap bound on the condition number: |V|_F * |V^-1|_F
+    norms = np.sqrt((abs(vectors) ** 2).sum(axis=(-2, -1)))
+
+    vectors_inv = np.empty_like(vectors)
+    defective = ~np.isfinite(norms)
+
+    invertible = ~defective
+
+    try:
+        vectors_inv[invertible] = np.linalg.inv(vectors[invertible])
+    except np.linalg.LinAlgError:
+        for index in np.ndindex(invertible.shape):
+            if defective[index]:
+                continue
+            try:
+                vectors_inv[index] = np.linalg.inv(vectors[index])
+            except np.linalg.LinAlgError:
+                defective[index] = True
+
+    norms_inv = np.sqrt((abs(vectors_inv) ** 2).sum(axis=(-2, -1)))
+    conds = norms * np.where(defective, 0.0, norms_inv)
+    defective |= ~np.isfinite(conds) | (conds > COND_MAX)
+
+    # Keeps the defective entries harmless until they are replaced
+    vectors[defective] = np.eye(liouvillians.shape[-1])
+    vectors_inv[defective] = np.eye(liouvillians.shape[-1])
+    values[defective] = 0.0
+
+    return values, vectors, vectors_inv, defective
+
+
+def _real_if_real(result, *inputs):
+    """Drops the imaginary part if all the inputs are real."""
+
+    if any(np.iscomplexobj(array) for array in inputs):
+        return result
+
+    return result.real
+
+
+def _fix_defective(propagators, liouvillians, times, defective):
+    """Recalculates the exponentials of the defective matrices with the Pade
+    approximant."""
+
+    if not defective.any():
+        return propagators
+
+    shape = propagators.shape[:-2]
+    defective = np.broadcast_to(defective, shape)
+    liouvillians = np.broadcast_to(liouvillians,
+                                   shape + liouvillians.shape[-2:])
+    times = np.broadcast_to(times, shape)
+
+    propagators = np.array(propagators)
+    propagators[defective] = _expm_pade(
+        liouvillians[defective] * times[defective][..., np.newaxis, np.newaxis]
+    )
+
+    return propagators
+
+
+def _expm_frechet_pade(liouvillians, directions, times):
+    """Same as expm_frechet_batch, with the Pade approximant of the
+    block-triangular matrices [[l, 0], [e, l]] * t."""
+
+    times = times[..., np.newaxis, np.newaxis]
+    liouvillians = liouvillians * times
+    directions = _align(directions, liouvillians.ndim) * times
+
+    size = liouvillians.shape[-1]
+
+    blocks = np.zeros(np.broadcast(directions, liouvillians).shape[:-2] +
+                      (2 * size, 2 * size),
+                      dtype=np.result_type(liouvillians, directions))
+    blocks[..., :size, :size] = liouvillians
+    blocks[..., size:, size:] = liouvillians
+    blocks[..., size:, :size] = directions
+
+    exponentials = _expm_pade(blocks)
+
+    return (exponentials[0, ..., :size, :size],
+            exponentials[..., size:, :size])
+
+
+def _align(stacked, ndim):
+    """Inserts axes after the first axis of a stack of matrices, so that the
+    matrices broadcast against arrays with 'ndim' dimensions."""
+
+    extra = ndim + 1 - stacked.ndim
+
+    return stacked.reshape(stacked.shape[:1] + (1,) * extra +
+                           stacked.shape[1:])
+
+
+def _expm_pade(matrices):
+    """Batched [13/13] Pade approximant with scaling and squaring."""
+
+    matrices = np.asarray(matrices)
+
+    if matrices.size == 0:
+        return np.array(matrices, dtype=np.result_type(matrices, float))
+
+    size = matrices.shape[-1]
+    identity = np.eye(size)
+
+    # One scaling per matrix, based on its 1-norm
+    norms = abs(matrices).sum(axis=-2).max(axis=-1)
+    with np.errstate(divide='ignore'):
+        squarings = np.maximum(
+            0, np.ceil(np.log2(norms / THETA_13))).astype(int)
+    squarings[norms == 0.0] = 0
+
+    a1 = matrices / (2.0 ** squarings)[..., np.newaxis, np.newaxis]
+    a2 = np.matmul(a1, a1)
+    a4 = np.matmul(a2, a2)
+    a6 = np.matmul(a4, a2)
+
+    b = PADE_13
+
+    u = np.matmul(a6, b[13] * a6 + b[11] * a4 + b[9] * a2)
+    u = np.matmul(a1, u + b[7] * a6 + b[5] * a4 + b[3] * a2 + b[1] * identity)
+    v = np.matmul(a6, b[12] * a6 + b[10] * a4 + b[8] * a2)
+    v = v + b[6] * a6 + b[4] * a4 + b[2] * a2 + b[0] * identity
+
+    propagators = np.linalg.solve(v - u, v + u)
+
+    for squaring in range(squarings.max()):
+        to_square = squarings > squaring
+        propagators[to_square] = np.matmul(propagators[to_square],
+                                           propagators[to_square])
+
+    return propagators
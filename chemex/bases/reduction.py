@@ -0,0 +1,144 @@
+"""
+Reduction of the Liouvillians to the part of the basis that matters.
+
+Only the basis elements that are reachable from the initial magnetization
+under the Liouvillians and pulses of an experiment, and that lead to the
+detected magnetization, contribute to the back-calculated signal. When some
+couplings vanish (e.g. kex = 0, or pc = 0 in the three-state models), the
+other elements can be dropped and the back-calculation run with smaller
+matrices:
+
+    indexes = get_reduced_indexes(vectors, matrices, detected)
+    l_free, p_180 = reduce_matrices(indexes, l_free, p_180)
+    mag_eq, = reduce_vectors(indexes, mag_eq)
+    ...
+    mag = expand_vectors(indexes, mag, size)
+
+The reduction is exact: the elements selected are only coupled to each other,
+so the reduced matrices propagate them exactly as the full ones do.
+
+The indexes only depend on the non-zero patterns of the vectors and matrices,
+which only change when some parameters become zero (or stop being so). They
+are therefore calculated once per pattern and cached.
+"""
+
+import numpy as np
+
+from chemex.caching import lru_cache
+
+
+def get_reduced_indexes(vectors, matrices, detected):
+    """
+    Returns the indexes of the basis elements that are reachable from the
+    vectors and lead to the detected magnetization, through the non-zero
+    elements of the matrices.
+
+    Parameters
+    ----------
+    vectors : sequence of ndarray, shape (..., n, 1)
+        The initial magnetization vectors.
+    matrices : sequence of ndarray, shape (..., n, n)
+        All the Liouvillians and propagators (e.g. pulses) of the experiment.
+    detected : ndarray, shape (n,)
+        The detection vector (see get_detection_vector).
+
+    Returns
+    -------
+    out : ndarray of int
+        The indexes of the basis elements to keep.
+
+    """
+
+    couplings = sum(_get_non_zero(matrix) for matrix in matrices) > 0
+    elements = sum(_get_non_zero(vector)[:, 0] for vector in vectors) > 0
+    detected = np.asarray(detected) != 0.0
+
+    return _get_reduced_indexes(couplings.tobytes(), elements.tobytes(),
+                                detected.tobytes())
+
+
+@lru_cache(100)
+def _get_reduced_indexes(couplings, elements, detected):
+    """Same as get_reduced_indexes, from the non-zero patterns of the
+    matrices, vectors and detection vector (as bytes, to be hashable)."""
+
+    elements = np.frombuffer(elements, dtype=bool)
+    detected = np.frombuffer(detected, dtype=bool)
+    couplings = np.frombuffer(couplings, dtype=bool).reshape(
+        (len(elements), len(elements)))
+
+    reachable = _close(couplings, elements)
+    detectable = _close(couplings.T, detected)
+
+    return np.flatnonzero(reachable & detectable)
+
+
+def get_detection_vector(get_mag, size):
+    """
+    Returns the detection vector of a (linear) function returning the detected
+    magnetization (e.g. get_2hznz), as the first of the values it returns.
+    """
+
+    return get_mag(np.eye(size)[..., np.newaxis])[0]
+
+
+def reduce_matrices(indexes, *matrices):
+    """Restricts the matrices to the basis elements with the given indexes."""
+
+    return [_reduce(matrix, indexes, indexes[:, np.newaxis], indexes)
+            for matrix in matrices]
+
+
+def reduce_vectors(indexes, *vectors):
+    """Restricts the vectors to the basis elements with the given indexes."""
+
+    return [_reduce(vector, indexes, indexes, slice(None))
+            for vector in vectors]
+
+
+def expand_vectors(indexes, vectors, size):
+    """Brings back reduced vectors to the full basis of the given size."""
+
+    vectors = np.asarray(vectors)
+
+    if len(indexes) == size:
+        return vectors
+
+    expanded = np.zeros(vectors.shape[:-2] + (size, vectors.shape[-1]),
+                        dtype=vectors.dtype)
+    expanded[..., indexes, :] = vectors
+
+    return expanded
+
+
+def _get_non_zero(array):
+    """Non-zero pattern of an array, merged over its leading dimensions."""
+
+    non_zero = np.asarray(array) != 0.0
+
+    if non_zero.ndim == 2:
+        return non_zero
+
+    return non_zero.reshape((-1,) + non_zero.shape[-2:]).any(axis=0)
+
+
+def _close(couplings, elements):
+    """All the elements reachable from the given ones through the couplings
+    (couplings[i, j] is True if element j feeds element i)."""
+
+    while True:
+        closed = elements | couplings.dot(elements)
+        if (closed == elements).all():
+            return elements
+        elements = closed
+
+
+def _reduce(array, indexes, rows, columns):
+    """Restricts an array, left untouched if all the indexes are kept."""
+
+    array = np.asarray(array)
+
+    if len(indexes) == array.shape[-2]:
+        return array
+
+    return array[..., rows, columns]
@@ -7,6 +7,8 @@ Created on 2013-10-03
 # Imports
 from scipy import eye, kron, diag
 
+from chemex.bases.assembly import stack_basis
+
 
 # Define the basis for the liouvillian
 # States: B, C or all states
@@ -57,3 +59,10 @@ KCA = kron([[+0.0, +0.0, +1.0],
 
 # 180 degree y pulse
 P_180Y = diag([1.0, -1.0, 1.0, -1.0, 1.0, -1.0])
+
+
+# Stacked basis tensor (see chemex.bases.assembly)
+TERMS = ('R_IXY', 'DR_IXY_AB', 'DR_IXY_AC', 'DW_AB', 'DW_AC', 'KAB', 'KBA',
+         'KBC', 'KCB', 'KAC', 'KCA')
+BASIS = stack_basis(R_IXY, DR_IXY_AB, DR_IXY_AC, DW_AB, DW_AC, KAB, KBA, KBC,
+                    KCB, KAC, KCA)
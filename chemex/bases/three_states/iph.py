@@ -1,5 +1,7 @@
 from scipy import eye, kron, diag
 
+from chemex.bases.assembly import stack_basis
+
 
 # Define the basis for the liouvillian
 # Axes: _XY, __Z
@@ -63,3 +65,10 @@ KCA = kron([[+0.0, +0.0, +1.0],
 W1X = kron(_ABC, [[+0.0, +0.0, +0.0],
                   [+0.0, +0.0, -1.0],
                   [+0.0, +1.0, +0.0]])
+
+
+# Stacked basis tensor (see chemex.bases.assembly)
+TERMS = ('R_IXY', 'R_IZ', 'DR_IXY_AB', 'DR_IXY_AC', 'CS', 'DW_AB', 'DW_AC',
+         'KAB', 'KBA', 'KBC', 'KCB', 'KAC', 'KCA', 'W1X')
+BASIS = stack_basis(R_IXY, R_IZ, DR_IXY_AB, DR_IXY_AC, CS, DW_AB, DW_AC, KAB,
+                    KBA, KBC, KCB, KAC, KCA, W1X)
@@ -7,6 +7,8 @@ Created on 2013-10-03
 # Imports
 from scipy import eye, kron, diag
 
+from chemex.bases.assembly import stack_basis
+
 
 # Define the basis for the liouvillian
 # Axes: _XY, __Z
@@ -104,3 +106,10 @@ W1Y = kron(_ABC, kron(_IA, [[+0.0, +0.0, +1.0],
 P180_S = kron(eye(3), kron(diag([+1.0, -1.0]), eye(3)))
 
 
+# Stacked basis tensor (see chemex.bases.assembly)
+TERMS = ('R_IXY', 'R_2SZIXY', 'R_IZ', 'R_2SZIZ', 'DR_IXY_AB', 'DR_IXY_AC',
+         'CS', 'DW_AB', 'DW_AC', 'J', 'DJ_AB', 'DJ_AC', 'ETAXY', 'ETAZ', 'KAB',
+         'KBA', 'KBC', 'KCB', 'KAC', 'KCA', 'W1X', 'W1Y')
+BASIS = stack_basis(R_IXY, R_2SZIXY, R_IZ, R_2SZIZ, DR_IXY_AB, DR_IXY_AC, CS,
+                    DW_AB, DW_AC, J, DJ_AB, DJ_AC, ETAXY, ETAZ, KAB, KBA, KBC,
+                    KCB, KAC, KCA, W1X, W1Y)
@@ -1,5 +1,7 @@
 from scipy import eye, kron, diag
 
+from chemex.bases.assembly import stack_basis
+
 
 # Define the basis for the liouvillian
 # States: B or both A & B
@@ -28,3 +30,8 @@ KBA = kron([[0.0, +1.0],
 
 # 180 degree y pulse
 P_180Y = diag([1.0, -1.0, 1.0, -1.0])
+
+
+# Stacked basis tensor (see chemex.bases.assembly)
+TERMS = ('R_IXY', 'DR_IXY', 'DW', 'KAB', 'KBA')
+BASIS = stack_basis(R_IXY, DR_IXY, DW, KAB, KBA)
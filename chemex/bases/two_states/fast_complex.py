@@ -0,0 +1,45 @@
+"""
+Complex reduced basis for the transverse magnetization of one isolated spin
+in presence of two-site exchange (see chemex.bases.two_states.fast).
+
+The magnetization of each state is described by the single complex coefficient
+of I+ = Ix + i*Iy, which halves the size of the Liouvillian: {I+}{a,b}.
+
+In this basis, the 180 degree pulses are antilinear: they map the
+magnetization vector c to P_180 . c*, where P_180 is given below.
+"""
+
+from scipy import eye, diag
+
+from chemex.bases.assembly import stack_basis
+
+
+# Define the basis for the liouvillian
+# States: B or both A & B
+__B, _AB = (
+    diag([0.0, 1.0]),
+    diag([1.0, 1.0]),
+)
+
+# Auto-relaxation rates
+R_IXY, DR_IXY = (
+    -_AB,
+    -__B,
+)
+# Chemical shifts
+DW = 1j * __B
+
+# Exchange rates
+KAB = [[-1.0, 0.0],
+       [+1.0, 0.0]]
+
+KBA = [[0.0, +1.0],
+       [0.0, -1.0]]
+
+# 180 degree y pulse: I+ -> -I-
+P_180Y = -eye(2)
+
+
+# Stacked basis tensor (see chemex.bases.assembly)
+TERMS = ('R_IXY', 'DR_IXY', 'DW', 'KAB', 'KBA')
+BASIS = stack_basis(R_IXY, DR_IXY, DW, KAB, KBA)
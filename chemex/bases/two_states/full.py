@@ -1,5 +1,7 @@
 from scipy import array, zeros, ones, kron, eye
 
+from chemex.bases.assembly import stack_basis
+
 # Temporary matrices to help build the liouvillian basis
 TMP1 = array([[+0.0, -1.0],
               [+1.0, +0.0]])
@@ -116,3 +118,14 @@ W1Y_N[15:30, 15:30] += W1Y_N[0:15, 0:15]
 # Some cleaning
 del TMP1
 del TMP2
+
+
+# Stacked basis tensor (see chemex.bases.assembly)
+TERMS = ('R_HXY', 'R_HZ', 'R_NXY_A', 'R_NXY_B', 'R_NZ', 'R_2HXYNZ',
+         'R_2HZNXY_A', 'R_2HZNXY_B', 'R_2HXYNXY', 'R_2HZNZ', 'CS_H_A',
+         'CS_H_B', 'CS_N_A', 'CS_N_B', 'J_HN', 'ETAZ', 'ETAXY', 'KAB', 'KBA',
+         'W1X_H', 'W1Y_H', 'W1X_N', 'W1Y_N')
+BASIS = stack_basis(R_HXY, R_HZ, R_NXY_A, R_NXY_B, R_NZ, R_2HXYNZ, R_2HZNXY_A,
+                    R_2HZNXY_B, R_2HXYNXY, R_2HZNZ, CS_H_A, CS_H_B, CS_N_A,
+                    CS_N_B, J_HN, ETAZ, ETAXY, KAB, KBA, W1X_H, W1Y_H, W1X_N,
+                    W1Y_N)
@@ -7,6 +7,8 @@ Created on 2013-10-03
 # Imports
 from scipy import eye, kron, diag
 
+from chemex.bases.assembly import stack_basis
+
 
 # Define the basis for the liouvillian
 # Axes: _XY, __Z
@@ -56,3 +58,6 @@ W1Y = kron(eye(2), [[+0.0, +0.0, +1.0],
                     [-1.0, +0.0, +0.0]])
 
 
+# Stacked basis tensor (see chemex.bases.assembly)
+TERMS = ('R_IXY', 'R_IZ', 'DR_IXY', 'CS', 'DW', 'KAB', 'KBA', 'W1X', 'W1Y')
+BASIS = stack_basis(R_IXY, R_IZ, DR_IXY, CS, DW, KAB, KBA, W1X, W1Y)
@@ -7,6 +7,8 @@ Created on 2013-10-03
 # Imports
 from scipy import eye, kron, diag
 
+from chemex.bases.assembly import stack_basis
+
 
 # Define the basis for the liouvillian
 # Axes: _XY, __Z
@@ -70,3 +72,8 @@ W1Y = kron(_AB, kron(_IA, [[+0.0, +0.0, +1.0],
 P180_S = kron(eye(2), kron(diag([+1.0, -1.0]), eye(3)))
 
 
+# Stacked basis tensor (see chemex.bases.assembly)
+TERMS = ('R_IXY', 'R_2SZIXY', 'R_IZ', 'R_2SZIZ', 'DR_XY', 'CS', 'DW', 'J',
+         'DJ', 'ETAXY', 'ETAZ', 'KAB', 'KBA', 'W1X', 'W1Y')
+BASIS = stack_basis(R_IXY, R_2SZIXY, R_IZ, R_2SZIZ, DR_XY, CS, DW, J, DJ,
+                    ETAXY, ETAZ, KAB, KBA, W1X, W1Y)
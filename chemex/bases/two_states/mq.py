@@ -7,6 +7,8 @@ Created on 2013-10-03
 # Imports
 from scipy import eye, kron, diag
 
+from chemex.bases.assembly import stack_basis
+
 
 # Define the basis for the liouvillian
 # States: B or both A & B
@@ -34,3 +36,7 @@ KAB = kron([[-1.0, 0.0],
 KBA = kron([[0.0, +1.0],
             [0.0, -1.0]], eye(4))
 
+
+# Stacked basis tensor (see chemex.bases.assembly)
+TERMS = ('R_2HXYCXY', 'DR_2HXYCXY', 'DWI', 'DWS', 'KAB', 'KBA')
+BASIS = stack_basis(R_2HXYCXY, DR_2HXYCXY, DWI, DWS, KAB, KBA)
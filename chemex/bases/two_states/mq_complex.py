@@ -0,0 +1,58 @@
+"""
+Complex reduced basis for the multiple-quantum coherences of an H-C spin pair
+in presence of two-site exchange (see chemex.bases.two_states.mq).
+
+The four real coherences {2HxCx, 2HxCy, 2HyCx, 2HyCy} of each state are
+described by the complex coefficients of the double- and zero-quantum
+coherences 2H+C+ and 2H+C-, which halves the size of the Liouvillian:
+{DQ, ZQ}{a,b}, with
+
+    DQ = (2HxCx - 2HyCy) + i*(2HxCy + 2HyCx)
+    ZQ = (2HxCx + 2HyCy) + i*(2HyCx - 2HxCy)
+
+The 13C 180 degree pulses are linear in this basis, but the 1H ones are
+antilinear: they map the magnetization vector c to P180_H . c*, where P180_H
+is given below.
+"""
+
+from scipy import eye, kron, diag
+
+from chemex.bases.assembly import stack_basis
+
+
+# Define the basis for the liouvillian
+# States: B or both A & B
+__B, _AB = (
+    diag([0.0, 1.0]),
+    diag([1.0, 1.0]),
+)
+
+# Auto-relaxation rates
+R_2HXYCXY, DR_2HXYCXY = (
+    kron(_AB, -eye(2)),
+    kron(__B, -eye(2)),
+)
+# Chemical shifts: DQ and ZQ evolve at dwh + dwc and dwh - dwc
+DWI = kron(__B, diag([1j, +1j]))
+DWS = kron(__B, diag([1j, -1j]))
+
+# Exchange rates
+KAB = kron([[-1.0, 0.0],
+            [+1.0, 0.0]], eye(2))
+
+KBA = kron([[0.0, +1.0],
+            [0.0, -1.0]], eye(2))
+
+# 180 degree pulses: they exchange the DQ and ZQ coherences
+_SWAP = [[0.0, 1.0],
+         [1.0, 0.0]]
+
+P180_CX = kron(eye(2), _SWAP)
+P180_CY = -P180_CX
+P180_HX = kron(eye(2), _SWAP)
+P180_HY = -P180_HX
+
+
+# Stacked basis tensor (see chemex.bases.assembly)
+TERMS = ('R_2HXYCXY', 'DR_2HXYCXY', 'DWI', 'DWS', 'KAB', 'KBA')
+BASIS = stack_basis(R_2HXYCXY, DR_2HXYCXY, DWI, DWS, KAB, KBA)
@@ -1,10 +1,186 @@
-# # {{{ http://code.activestate.com/recipes/578078-py26-and-py30-backport-of-python-33s-lru-cache/
-from collections import namedtuple
+"""
+Caching of the back-calculations.
+
+The lru_cache decorator below (a backport of Python 3.3's functools.lru_cache)
+is used at several levels of the back-calculations: factories of
+calc_observable functions, propagators, profiles. Each decorated function owns
+its cache, bounded by a number of entries, but all the caches also take part
+in a process-wide accounting of the memory they hold:
+
+- the size in bytes of every cached result holding arrays is recorded;
+- a memory budget can be set with set_memory_budget, in which case the least
+  recently used results, whatever the cache they belong to, are evicted until
+  the cached arrays fit in the budget;
+- the hits, misses and bytes are gathered per group of caches (one group per
+  experiment type) and returned by get_cache_report.
+"""
+
+from collections import namedtuple, OrderedDict
 from functools import update_wrapper
+from itertools import count
 from threading import RLock
+import weakref
+
+import numpy as np
 
 _CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+_GroupInfo = namedtuple("GroupInfo", ["hits", "misses", "currsize", "nbytes"])
+
+# Names for the fields of the group statistics
+HITS, MISSES, CURRSIZE, NBYTES = 0, 1, 2, 3
+
+# Process-wide accounting: the cached results holding arrays, from the least
+# to the most recently used, as (token of the cache, key) -> (nbytes, group
+# statistics), along with the keys, eviction functions and weak references of
+# the caches by token
+_LOCK = RLock()
+_MEMORY = {'budget': None, 'nbytes': 0}
+_ENTRIES = OrderedDict()
+_KEYS = {}
+_EVICTS = {}
+_REFS = {}
+_GROUPS = {}
+_TOKENS = count()
+
+
+def set_memory_budget(nbytes=None):
+    """
+    Sets the maximum number of bytes of arrays held by all the caches
+    together (None for no limit), evicting results right away if needed.
+    """
+
+    with _LOCK:
+        _MEMORY['budget'] = None if nbytes is None else int(nbytes)
+        _enforce_budget()
+
+
+def get_memory_budget():
+    """Returns the memory budget of the caches in bytes (None for no limit)."""
+
+    return _MEMORY['budget']
+
+
+def get_cache_report():
+    """
+    Returns the statistics of the caches, gathered by group (the experiment
+    type for the caches of the back-calculations), as an ordered dictionary
+    group -> GroupInfo(hits, misses, currsize, nbytes), where currsize is the
+    number of cached results holding arrays and nbytes their size in bytes.
+    """
+
+    with _LOCK:
+        return OrderedDict((group, _GroupInfo(*_GROUPS[group]))
+                           for group in sorted(_GROUPS))
+
+
+def get_cache_nbytes():
+    """Returns the number of bytes of arrays held by all the caches."""
+
+    return _MEMORY['nbytes']
+
+
+def _get_group(user_function):
+    """Name of the group of the cache of a function, e.g. 'cpmg.n_trosy' for
+    the functions of chemex.experiments.cpmg.n_trosy.back_calculation."""
+
+    module = getattr(user_function, '__module__', None) or '?'
+
+    if module.startswith('chemex.experiments.'):
+        module = module[len('chemex.experiments.'):]
+        module = module.rsplit('.', 1)[0] if module.count('.') > 1 else module
+
+    return module
+
+
+def _get_nbytes(result):
+    """Number of bytes of the arrays held by a result (0 for functions,
+    scalars...)."""
+
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+
+    if isinstance(result, (tuple, list)):
+        return sum(_get_nbytes(item) for item in result)
+
+    if isinstance(result, dict):
+        return sum(_get_nbytes(item) for item in result.values())
+
+    return 0
+
+
+def _track(token, key, result, group_stats):
+    """Records a new cached result. Returns whether it holds arrays and is
+    thus accounted for."""
+
+    nbytes = _get_nbytes(result)
+
+    if not nbytes:
+        return False
+
+    _ENTRIES[token, key] = nbytes, group_stats
+    _KEYS[token].add(key)
+    group_stats[CURRSIZE] += 1
+    group_stats[NBYTES] += nbytes
+    _MEMORY['nbytes'] += nbytes
+
+    _enforce_budget()
 
+    return True
+
+
+def _touch(token, key):
+    """Marks a cached result as the most recently used."""
+
+    entry = _ENTRIES.pop((token, key), None)
+
+    if entry is not None:
+        _ENTRIES[token, key] = entry
+
+
+def _untrack(token, key):
+    """Forgets a cached result evicted by its cache."""
+
+    entry = _ENTRIES.pop((token, key), None)
+
+    if entry is not None:
+        nbytes, group_stats = entry
+        _KEYS[token].discard(key)
+        group_stats[CURRSIZE] -= 1
+        group_stats[NBYTES] -= nbytes
+        _MEMORY['nbytes'] -= nbytes
+
+
+def _untrack_all(token):
+    """Forgets all the cached results of a cache."""
+
+    for key in list(_KEYS[token]):
+        _untrack(token, key)
+
+
+def _drop(token):
+    """Called when the function owning a cache is garbage collected."""
+
+    with _LOCK:
+        _untrack_all(token)
+        del _KEYS[token], _EVICTS[token], _REFS[token]
+
+
+def _enforce_budget():
+    """Evicts the least recently used results until the cached arrays fit in
+    the budget, always keeping the last one."""
+
+    budget = _MEMORY['budget']
+
+    if budget is None:
+        return
+
+    while _MEMORY['nbytes'] > budget and len(_ENTRIES) > 1:
+        token, key = next(iter(_ENTRIES))
+        _untrack(token, key)
+        _EVICTS[token](key)
+
+
+# # {{{ http://code.activestate.com/recipes/578078-py26-and-py30-backport-of-python-33s-lru-cache/
 
 class _HashedSeq(list):
     __slots__ = 'hashvalue'
@@ -38,7 +214,7 @@ def _make_key(args, kwds, typed,
     return _HashedSeq(key)
 
 
-def lru_cache(maxsize=100, typed=False):
+def lru_cache(maxsize=100, typed=False, thread_safe=False):
     """Least-recently-used cache decorator.
 
     If *maxsize* is set to None, the LRU features are disabled and the cache
@@ -48,12 +224,21 @@ def lru_cache(maxsize=100, typed=False):
     For example, f(3.0) and f(3) will be treated as distinct calls with
     distinct results.
 
-    Arguments to the cached function must be hashable.
+    Arguments to the cached function must be hashable. Calls with positional
+    arguments only are the cheapest: the tuple of arguments is the key.
 
     View the cache statistics named tuple (hits, misses, maxsize, currsize) with
     f.cache_info().  Clear the cache and statistics with f.cache_clear().
     Access the underlying function with f.__wrapped__.
 
+    Whatever *maxsize*, the results holding arrays are also accounted for in
+    the process-wide memory budget (see set_memory_budget), and may be evicted
+    to make room for the results of other caches.
+
+    The caches are not locked unless *thread_safe* is True: ChemEx runs its
+    parallel fits in separate processes, and the lookups are on the hot path
+    of the fits. With *thread_safe*, the calls are serialized by a lock.
+
     See:  http://en.wikipedia.org/wiki/Cache_algorithms#Least_Recently_Used
 
     """
@@ -71,11 +256,15 @@ def lru_cache(maxsize=100, typed=False):
         make_key = _make_key
         cache_get = cache.get  # bound method to lookup key or return None
         _len = len  # localize the global len() function
-        lock = RLock()  # because linkedlist updates aren't threadsafe
         root = []  # root of the circular doubly linked list
-        root[:] = [root, root, None, None]  # initialize by pointing to self
+        root[:] = [root, root, None, None, False]  # initialize by pointing to self
         nonlocal_root = [root]  # make updateable non-locally
-        PREV, NEXT, KEY, RESULT = 0, 1, 2, 3  # names for the link fields
+        PREV, NEXT, KEY, RESULT, TRACKED = 0, 1, 2, 3, 4  # names for the link fields
+
+        token = next(_TOKENS)
+        tracked_keys = _KEYS[token] = set()
+        group_stats = _GROUPS.setdefault(_get_group(user_function),
+                                         [0, 0, 0, 0])
 
         if maxsize == 0:
 
@@ -83,89 +272,130 @@ def lru_cache(maxsize=100, typed=False):
                 # no caching, just do a statistics update after a successful call
                 result = user_function(*args, **kwds)
                 stats[MISSES] += 1
+                group_stats[MISSES] += 1
                 return result
 
+            def evict(key):
+                pass
+
         elif maxsize is None:
 
             def wrapper(*args, **kwds):
                 # simple caching without ordering or size limit
-                key = make_key(args, kwds, typed)
+                key = make_key(args, kwds, typed) if kwds or typed else args
                 result = cache_get(key,
                                    root)  # root used here as a unique not-found sentinel
                 if result is not root:
+                    if key in tracked_keys:
+                        _touch(token, key)
                     stats[HITS] += 1
+                    group_stats[HITS] += 1
                     return result
                 result = user_function(*args, **kwds)
                 cache[key] = result
+                _track(token, key, result, group_stats)
                 stats[MISSES] += 1
+                group_stats[MISSES] += 1
                 return result
 
+            def evict(key):
+                # drop a result to fit in the memory budget
+                del cache[key]
+
         else:
 
             def wrapper(*args, **kwds):
                 # size limited caching that tracks accesses by recency
                 key = make_key(args, kwds, typed) if kwds or typed else args
-                with lock:
-                    link = cache_get(key)
-                    if link is not None:
-                        # record recent use of the key by moving it to the front of the list
-                        root, = nonlocal_root
-                        link_prev, link_next, key, result = link
-                        link_prev[NEXT] = link_next
-                        link_next[PREV] = link_prev
-                        last = root[PREV]
-                        last[NEXT] = root[PREV] = link
-                        link[PREV] = last
-                        link[NEXT] = root
-                        stats[HITS] += 1
-                        return result
-                result = user_function(*args, **kwds)
-                with lock:
+                link = cache_get(key)
+                if link is not None:
+                    # record recent use of the key by moving it to the front of the list
                     root, = nonlocal_root
-                    if key in cache:
-                        # getting here means that this same key was added to the
-                        # cache while the lock was released.  since the link
-                        # update is already done, we need only return the
-                        # computed result and update the count of misses.
-                        pass
-                    elif _len(cache) >= maxsize:
-                        # use the old root to store the new key and result
-                        oldroot = root
-                        oldroot[KEY] = key
-                        oldroot[RESULT] = result
-                        # empty the oldest link and make it the new root
-                        root = nonlocal_root[0] = oldroot[NEXT]
-                        oldkey = root[KEY]
-                        oldvalue = root[RESULT]
-                        root[KEY] = root[RESULT] = None
-                        # now update the cache dictionary for the new links
-                        del cache[oldkey]
-                        cache[key] = oldroot
-                    else:
-                        # put result in a new link at the front of the list
-                        last = root[PREV]
-                        link = [last, root, key, result]
-                        last[NEXT] = root[PREV] = cache[key] = link
-                    stats[MISSES] += 1
+                    link_prev, link_next, key, result, tracked = link
+                    link_prev[NEXT] = link_next
+                    link_next[PREV] = link_prev
+                    last = root[PREV]
+                    last[NEXT] = root[PREV] = link
+                    link[PREV] = last
+                    link[NEXT] = root
+                    if tracked:
+                        _touch(token, key)
+                    stats[HITS] += 1
+                    group_stats[HITS] += 1
+                    return result
+                result = user_function(*args, **kwds)
+                root, = nonlocal_root
+                if key in cache:
+                    # getting here means that this same key was added to the
+                    # cache by a recursive call.  since the link update is
+                    # already done, we need only return the computed result
+                    # and update the count of misses.
+                    pass
+                elif _len(cache) >= maxsize:
+                    # use the old root to store the new key and result
+                    oldroot = root
+                    oldroot[KEY] = key
+                    oldroot[RESULT] = result
+                    # empty the oldest link and make it the new root
+                    root = nonlocal_root[0] = oldroot[NEXT]
+                    oldkey = root[KEY]
+                    if root[TRACKED]:
+                        _untrack(token, oldkey)
+                    root[KEY] = root[RESULT] = None
+                    root[TRACKED] = False
+                    # now update the cache dictionary for the new links
+                    del cache[oldkey]
+                    cache[key] = oldroot
+                    oldroot[TRACKED] = _track(token, key, result, group_stats)
+                else:
+                    # put result in a new link at the front of the list
+                    last = root[PREV]
+                    link = [last, root, key, result, False]
+                    last[NEXT] = root[PREV] = cache[key] = link
+                    link[TRACKED] = _track(token, key, result, group_stats)
+                stats[MISSES] += 1
+                group_stats[MISSES] += 1
                 return result
 
+            def evict(key):
+                # unlink a result to fit in the memory budget
+                link = cache.pop(key)
+                link[PREV][NEXT] = link[NEXT]
+                link[NEXT][PREV] = link[PREV]
+
+        if thread_safe:
+
+            unlocked_wrapper = wrapper
+
+            def wrapper(*args, **kwds):
+                with _LOCK:
+                    return unlocked_wrapper(*args, **kwds)
+
         def cache_info():
             """Report cache statistics"""
-            with lock:
+            with _LOCK:
                 return _CacheInfo(stats[HITS], stats[MISSES], maxsize,
                                   len(cache))
 
         def cache_clear():
             """Clear the cache and cache statistics"""
-            with lock:
+            with _LOCK:
+                _untrack_all(token)
                 cache.clear()
                 root = nonlocal_root[0]
-                root[:] = [root, root, None, None]
+                root[:] = [root, root, None, None, False]
                 stats[:] = [0, 0]
 
         wrapper.__wrapped__ = user_function
         wrapper.cache_info = cache_info
         wrapper.cache_clear = cache_clear
+
+        # The accounting forgets the results of the cache along with it (e.g.
+        # the caches of the closures made by a factory that was evicted)
+        _EVICTS[token] = evict
+        _REFS[token] = weakref.ref(wrapper,
+                                   lambda _ref, token=token: _drop(token))
+
         return update_wrapper(wrapper, user_function)
 
     return decorating_function
@@ -5,31 +5,40 @@ Created on Mar 30, 2011
 """
 
 import sys
-import scipy as sc
 
 # ChemEx Libraries
+from chemex.experiments.dataset import get_column
+from chemex.experiments.profile import make_calc_vals
 from chemex.writing import dump_parameters
 
 
 def make_calc_residuals(verbose=True, threshold=1e-3):
     def calc_residuals(par, par_indexes, par_fixed, data):
         """
-        Calculate the residuals for all values knowing the parameters par
+        Calculate the residuals for all values knowing the parameters par.
+        The profiles of the residues sharing an experiment are calculated
+        together (see chemex.experiments.profile.make_calc_vals).
         """
 
+        if data is not calc_residuals.data:
+            calc_residuals.data = data
+            calc_residuals.calc_vals = make_calc_vals(data)
+            calc_residuals.vals = get_column(data, 'val')
+            calc_residuals.errs = get_column(data, 'err')
+
         try:
-            residuals = [
-                a_data_point.calc_residual(par, par_indexes, par_fixed)
-                for a_data_point in data]
+            cals = calc_residuals.calc_vals(par, par_indexes, par_fixed)
 
         except KeyboardInterrupt:
             sys.stderr.write("\n -- Keyboard Interrupt: calculation stopped")
             dump_parameters(par, par_indexes, par_fixed, data)
             sys.exit()
 
+        residuals = (calc_residuals.vals - cals) / calc_residuals.errs
+
         if verbose:
 
-            chi2 = sum(sc.asarray(residuals) ** 2)
+            chi2 = sum(residuals ** 2)
 
             if (
                 calc_residuals.old_chi2 - chi2) / calc_residuals.old_chi2 > \
@@ -46,6 +55,7 @@ def make_calc_residuals(verbose=True, threshold=1e-3):
         return residuals
 
     calc_residuals.old_chi2 = sys.float_info.max
+    calc_residuals.data = None
 
     return calc_residuals
 
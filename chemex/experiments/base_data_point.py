@@ -4,26 +4,86 @@ Created on 2012-02-21
 @author: guillaume
 """
 
+import numpy as np
+
+from chemex.experiments.dataset import Dataset, Parameters
+
 
 class BaseDataPoint(object):
-    """Base class defining an experimental point."""
+    """
+    Base class defining an experimental point.
+
+    The point is a view on a row of a dataset (see
+    chemex.experiments.dataset): its value, uncertainty, back-calculated
+    value and parameters are stored there, with those of the other points of
+    the experiment.
+    """
+
+    __slots__ = ('par', 'short_long_par_names', 'fitting_parameter_names',
+                 'fixed_parameter_names', 'kwargs_default', 'calc_observable',
+                 'calc_compiled', 'arg_names', 'long_names', 'args_default',
+                 'plot_data')
 
     def __init__(self, val=0.0, err=0.0, par=None, par_conv=None, plot_data=None, calc_observable=None):
         """Constructor"""
 
+        if not isinstance(par, Parameters):
+            # A point on its own, stored in a dataset of its own
+            par, = Dataset().add_profile(par)
+
+        self.par = par
         self.val = float(val)
         self.err = float(err)
-        self.par = par.copy()
         self.cal = None
         self.short_long_par_names = None
         self.fitting_parameter_names = set()
         self.fixed_parameter_names = set()
         self.kwargs_default = dict()
         self.calc_observable = calc_observable
+        self.calc_compiled = None
         self.plot_data = plot_data
 
         self.check_parameters(par_conv)
 
+    @property
+    def dataset(self):
+        """Dataset the point belongs to."""
+
+        return self.par.dataset
+
+    @property
+    def index(self):
+        """Row of the point in the dataset."""
+
+        return self.par.index
+
+    @property
+    def val(self):
+        return float(self.par.dataset['val'][self.par.index])
+
+    @val.setter
+    def val(self, value):
+        self.par.dataset['val'][self.par.index] = value
+
+    @property
+    def err(self):
+        return float(self.par.dataset['err'][self.par.index])
+
+    @err.setter
+    def err(self, value):
+        self.par.dataset['err'][self.par.index] = value
+
+    @property
+    def cal(self):
+        cal = self.par.dataset['cal'][self.par.index]
+        return None if np.isnan(cal) else float(cal)
+
+    @cal.setter
+    def cal(self, value):
+        self.par.dataset['cal'][self.par.index] = (
+            np.nan if value is None else value
+        )
+
     def __repr__(self):
         """Prints the data point"""
 
@@ -54,14 +114,62 @@ class BaseDataPoint(object):
 
         return None
 
-    def calc_val(self, par, par_indexes, par_fixed=None):
+    def calc_kwargs(self, par, par_indexes, par_fixed=None):
+        """Gathers the arguments of calc_observable from the parameters."""
 
         kwargs = dict((short_name, get_par(long_name, par, par_indexes, par_fixed))
                       for short_name, long_name in self.short_long_par_names)
 
         kwargs.update(self.kwargs_default)
 
-        self.cal = self.calc_observable(**kwargs)
+        return kwargs
+
+    def compile_calc(self):
+        """
+        Fixes the order of the arguments of calc_observable once for all (the
+        parameters, then the default arguments), so that the back-calculation
+        can be called positionally, without building keyword arguments for
+        every evaluation. Called on the first evaluation of the point.
+        """
+
+        names_default = tuple(sorted(self.kwargs_default))
+        short_long_par_names = [(short_name, long_name)
+                                for short_name, long_name in self.short_long_par_names
+                                if short_name not in self.kwargs_default]
+
+        names = tuple(short_name for short_name, _ in short_long_par_names) + names_default
+
+        self.arg_names = names
+        self.long_names = tuple(long_name for _, long_name in short_long_par_names)
+        self.args_default = tuple(self.kwargs_default[name] for name in names_default)
+
+        calc_observable = self.calc_observable
+
+        if hasattr(calc_observable, 'make_positional'):
+            calc = calc_observable.make_positional(names)
+        else:
+            def calc(*args):
+                return calc_observable(**dict(zip(names, args)))
+
+        self.calc_compiled = calc
+
+    def calc_args(self, par, par_indexes, par_fixed=None):
+        """Gathers the arguments of calc_observable from the parameters, in the
+        order fixed by compile_calc. The default arguments are read again, as
+        they can be updated (e.g. b1_offset when plotting)."""
+
+        names_default = self.arg_names[len(self.long_names):]
+
+        return (tuple([get_par(long_name, par, par_indexes, par_fixed)
+                       for long_name in self.long_names]) +
+                tuple([self.kwargs_default[name] for name in names_default]))
+
+    def calc_val(self, par, par_indexes, par_fixed=None):
+
+        if self.calc_compiled is None:
+            self.compile_calc()
+
+        self.cal = self.calc_compiled(*self.calc_args(par, par_indexes, par_fixed))
 
     def calc_residual(self, par, par_indexes, par_fixed=None):
         """Calculates the residual between the experimental and back-calculated values."""
@@ -70,6 +178,12 @@ class BaseDataPoint(object):
 
         return (self.val - self.cal) / self.err
 
+    def has_derivatives(self):
+        """Tells whether the back-calculation provides analytic derivatives
+        (see chemex.jacobian.make_calc_derivatives)."""
+
+        return hasattr(self.calc_observable, 'calc_profile_derivatives')
+
     def get_fitting_parameter_names(self):
         """Provide the parameters that are needed to back-calculate the experimental value."""
 
@@ -100,3 +214,57 @@ def get_par(par_name, par, par_indexes, par_fixed=list()):
         return par_fixed[par_name]
 
 
+def make_gather(long_names):
+    """
+    Factory to make a "gather" function extracting the values of a sequence
+    of parameters (long names, possibly repeated) from the fitted and fixed
+    parameters, as one NumPy gather.
+
+    The positions of the parameters are looked up once per couple of
+    'par_indexes' and 'par_fixed' dictionaries, i.e. once per fitting step,
+    rather than on every evaluation. These dictionaries (and the fixed
+    values) should therefore not be modified in place between two calls.
+
+    Returns
+    -------
+    out : function
+        gather(par, par_indexes, par_fixed) returns the values of the
+        parameters as an ndarray, in the order of 'long_names'.
+
+    """
+
+    long_names = list(long_names)
+    compiled = {'par_indexes': None, 'par_fixed': None}
+
+    def gather(par, par_indexes, par_fixed=None):
+        """Returns the values of the parameters."""
+
+        if (par_indexes is not compiled['par_indexes'] or
+                par_fixed is not compiled['par_fixed']):
+
+            fixed_names = []
+            slots = {}
+
+            for long_name in long_names:
+                if long_name not in par_indexes and long_name not in slots:
+                    slots[long_name] = len(fixed_names)
+                    fixed_names.append(long_name)
+
+            # The fixed values come first, then the fitted ones
+            indexes = [slots[long_name] if long_name in slots
+                       else len(slots) + par_indexes[long_name]
+                       for long_name in long_names]
+
+            compiled.update(
+                par_indexes=par_indexes,
+                par_fixed=par_fixed,
+                fixed=np.array([par_fixed[long_name]
+                                for long_name in fixed_names], dtype=float),
+                indexes=np.array(indexes, dtype=int),
+            )
+
+        values = np.concatenate((compiled['fixed'], par))
+
+        return values[compiled['indexes']]
+
+    return gather
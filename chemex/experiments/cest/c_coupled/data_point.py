@@ -12,7 +12,8 @@ from math import pi
 from chemex.parsing import parse_assignment
 from chemex.experiments.base_data_point import BaseDataPoint
 from chemex.constants import xi_ratio
-from chemex.experiments.misc import calc_multiplet
+from chemex.experiments.misc import calc_multiplet, get_b1_inh_scheme, \
+    make_calc_observable_ref
 from .back_calculation import make_calc_observable
 from ..plotting import plot_data
 
@@ -49,6 +50,7 @@ PAR_DICT = {
         'b1_offset',
         'b1_inh',
         'b1_inh_res',
+        'b1_inh_scheme',
     ),
     'fit': (
         'pb',
@@ -197,13 +199,13 @@ J_COUPLINGS = {
 class DataPoint(BaseDataPoint):
     """Intensity measured during a cpmg pulse train of frequency frq"""
 
+    __slots__ = ('calc_observable_ref',)
+
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'], plot_data)
 
         self.par['ppm_to_rads'] = TWO_PI * self.par['h_larmor_frq'] * RATIO_C
 
-        self.kwargs_default = dict()
-
         temperature = self.par['temperature']
         resonance_id = self.par['resonance_id']
         h_larmor_frq = self.par['h_larmor_frq']
@@ -218,8 +220,14 @@ class DataPoint(BaseDataPoint):
 
         self.par['_id'] = tuple((temperature, nucleus_name, h_larmor_frq))
 
+        self.par['b1_inh_scheme'] = get_b1_inh_scheme(self.par)
+
         args = (self.par[arg] for arg in getargspec(make_calc_observable.__wrapped__).args)
         self.calc_observable = make_calc_observable(*args)
+        self.calc_observable_ref = make_calc_observable_ref(
+            make_calc_observable, self.par)
+
+        self.kwargs_default = {'b1_offset': self.par['b1_offset']}
 
         self.short_long_par_names = (
             ('pb', ('pb', temperature)),
@@ -267,6 +275,5 @@ class DataPoint(BaseDataPoint):
         """update b1_offset value"""
 
         self.par['b1_offset'] = b1_offset
-        args = (self.par[arg] for arg in getargspec(make_calc_observable.__wrapped__).args)
-        self.calc_observable = make_calc_observable(*args)
+        self.kwargs_default['b1_offset'] = b1_offset
 
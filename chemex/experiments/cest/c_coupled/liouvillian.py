@@ -6,27 +6,42 @@ Created on May 1, 2013
 
 # Imports
 from itertools import product
-from scipy import pi, zeros, linspace, asarray
-from scipy.stats import norm
+from scipy import pi, zeros, asarray, newaxis, shape
 
-from chemex.bases.two_states.iph import R_IXY, DR_IXY, R_IZ, CS, DW, KAB, KBA, W1X
+from chemex.experiments.misc import calc_b1_inh_samples
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states.iph import CS, W1X, BASIS, TERMS
 
 
-def compute_base_liouvillians(b1_offset=0.0, b1_frq=0.0, b1_inh=0.0, b1_inh_res=5, multiplet=None):
-    w1, w1_inh, w1_offset = 2.0 * pi * asarray([b1_frq, b1_inh, b1_offset])
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'DR_IXY', 'R_IZ', 'CS', 'DW', 'KAB', 'KBA'))
 
-    w1s = linspace(-2.0, 2.0, b1_inh_res) * w1_inh + w1
-    weights1 = norm.pdf(w1s, w1, w1_inh)
 
-    liouvillians = [
-        (j - w1_offset) * CS + w1 * W1X
-        for w1, (j, _) in product(w1s, multiplet)
-    ]
+def compute_base_liouvillians(b1_offsets=(0.0,), b1_frq=0.0, b1_inh=0.0, b1_inh_res=5,
+                              b1_inh_scheme='linspace', multiplet=None):
+    """
+    Returns the Liouvillians of the B1 field for all the offsets of a profile
+    and all the samples of the B1 field inhomogeneity and of the multiplet,
+    along with the weights of those samples.
+
+    Returns
+    -------
+    liouvillians : ndarray, shape (len(b1_offsets), n_samples, n, n)
+    weights : ndarray, shape (n_samples,)
+
+    """
+
+    w1, w1_inh = 2.0 * pi * asarray([b1_frq, b1_inh])
+    w1_offsets = 2.0 * pi * asarray(b1_offsets)
+
+    w1s, weights1 = calc_b1_inh_samples(w1, w1_inh, b1_inh_res, b1_inh_scheme)
+
+    samples = [(w1, j, weight1 * weight2)
+               for (w1, weight1), (j, weight2) in product(zip(w1s, weights1), multiplet)]
+    w1s, js, weights = asarray(samples).T
 
-    weights = [
-        weight1 * weight2
-        for weight1, (_, weight2) in product(weights1, multiplet)
-    ]
+    liouvillians = ((js - w1_offsets[:, newaxis])[:, :, newaxis, newaxis] * CS +
+                    w1s[:, newaxis, newaxis] * W1X)
 
     return liouvillians, weights
 
@@ -70,13 +85,7 @@ def compute_free_liouvillian(pb=0.0, kex=0.0, dw=0.0, r_cz=1.5, r_cxy=5.0, dr_cx
     kab = kex * pb
     kba = kex - kab
 
-    l_free = R_IXY * r_cxy
-    l_free += DR_IXY * dr_cxy
-    l_free += R_IZ * r_cz
-    l_free += CS * cs_offset
-    l_free += DW * dw
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = assemble_free(r_cxy, dr_cxy, r_cz, cs_offset, dw, kab, kba)
 
     return l_free
 
@@ -98,9 +107,9 @@ def compute_cz_eq(pb):
 
     """
 
-    mag_eq = zeros((6, 1))
-    mag_eq[2, 0] += (1.0 - pb)
-    mag_eq[5, 0] += pb
+    mag_eq = zeros(shape(pb) + (6, 1))
+    mag_eq[..., 2, 0] += (1.0 - pb)
+    mag_eq[..., 5, 0] += pb
 
     return mag_eq
 
@@ -121,8 +130,8 @@ def get_cz(mag):
 
     """
 
-    magz_a = mag[2, 0]
-    magz_b = mag[5, 0]
+    magz_a = mag[..., 2, 0]
+    magz_b = mag[..., 5, 0]
 
     return magz_a, magz_b
 
@@ -4,7 +4,8 @@ from math import pi
 from chemex.parsing import parse_assignment
 from chemex.experiments.base_data_point import BaseDataPoint
 from chemex.constants import xi_ratio
-from chemex.experiments.misc import calc_multiplet
+from chemex.experiments.misc import calc_multiplet, get_b1_inh_scheme, \
+    make_calc_observable_ref
 from .back_calculation import make_calc_observable
 from ..plotting import plot_data
 
@@ -26,7 +27,8 @@ PAR_DICT = {
                           'b1_inh',)),
                  (int, ('b1_inh_res',))),
     'exp': ('resonance_id', 'h_larmor_frq', 'temperature', 'carrier',
-            'time_t1', 'b1_frq', 'b1_offset', 'b1_inh', 'b1_inh_res'),
+            'time_t1', 'b1_frq', 'b1_offset', 'b1_inh', 'b1_inh_res',
+            'b1_inh_scheme'),
     'fit': ('pb', 'kex', 'dw', 'i0', 'r_nxy', 'dr_nxy', 'r_nz'),
     'fix': ('cs',),
 }
@@ -35,6 +37,8 @@ PAR_DICT = {
 class DataPoint(BaseDataPoint):
     """Intensity measured during a cpmg pulse train of frequency frq"""
 
+    __slots__ = ('calc_observable_ref',)
+
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
                                plot_data)
@@ -42,8 +46,6 @@ class DataPoint(BaseDataPoint):
         self.par['ppm_to_rads'] = TWO_PI * self.par['h_larmor_frq'] * RATIO_N
         self.par['multiplet'] = calc_multiplet(J_COUPLINGS)
 
-        self.kwargs_default = dict()
-
         temperature = self.par['temperature']
         resonance_id = self.par['resonance_id']
         h_larmor_frq = self.par['h_larmor_frq']
@@ -55,10 +57,16 @@ class DataPoint(BaseDataPoint):
 
         self.par['_id'] = tuple((temperature, nucleus_name, h_larmor_frq))
 
+        self.par['b1_inh_scheme'] = get_b1_inh_scheme(self.par)
+
         args = (self.par[arg] for arg in
                 getargspec(make_calc_observable.__wrapped__).args)
 
         self.calc_observable = make_calc_observable(*args)
+        self.calc_observable_ref = make_calc_observable_ref(
+            make_calc_observable, self.par)
+
+        self.kwargs_default = {'b1_offset': self.par['b1_offset']}
 
         self.short_long_par_names = (
             ('pb', ('pb', temperature)),
@@ -105,7 +113,5 @@ class DataPoint(BaseDataPoint):
         """Update b1_offset value"""
 
         self.par['b1_offset'] = b1_offset
-        args = (self.par[arg] for arg in
-                getargspec(make_calc_observable.__wrapped__).args)
-        self.calc_observable = make_calc_observable(*args)
+        self.kwargs_default['b1_offset'] = b1_offset
 
@@ -1,5 +1,5 @@
 import scipy as sc
-from scipy.linalg import eig, inv
+from numpy.linalg import eig, inv
 
 from chemex.experiments.misc import correct_chemical_shift
 from chemex.caching import lru_cache
@@ -7,7 +7,6 @@ from .liouvillian import compute_liouvillian
 
 
 dot = sc.dot
-diag = sc.diag
 exp = sc.exp
 
 
@@ -102,36 +101,33 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, carrier=0.0,
                 w1_offset
             )
 
-            magz_eq = sc.asarray([[1 - pb], [pb]])
-            magz_a = 0.0
-
-            for j, weight in multiplet:
-                liouvillian = compute_liouvillian(
-                    pb=pb,
-                    kex=kex,
-                    dw=dw,
-                    r_nxy=r_nxy,
-                    dr_nxy=dr_nxy,
-                    r_nz=r_nz,
-                    cs_offset=(wg + j),
-                    w1=w1
-                )
-
-                s, vr = eig(liouvillian)
-                vri = inv(vr)
-
-                sl1 = [2, 5]
-                sl2 = [i for i, w in enumerate(s.imag) if abs(w) < 1.0e-6]
-                sl3 = [2]
-
-                vri = vri[sc.ix_(sl2, sl1)].real
-                t = diag(exp(s[sl2].real * time_t1))
-                vr = vr[sc.ix_(sl3, sl2)].real
-
-                magz_a += (
-                    weight *
-                    dot(dot(dot(vr, t), vri), magz_eq)[0, 0]
-                )
+            js, weights = sc.asarray(multiplet).T
+
+            # One Liouvillian per component of the multiplet, all
+            # diagonalized in one call
+            liouvillians = compute_liouvillian(
+                pb=pb,
+                kex=kex,
+                dw=dw,
+                r_nxy=r_nxy,
+                dr_nxy=dr_nxy,
+                r_nz=r_nz,
+                cs_offset=(wg + js),
+                w1=w1
+            )
+
+            s, vr = eig(liouvillians)
+            vri = inv(vr)
+
+            # Only the non-oscillating modes are kept
+            slow = abs(s.imag) < 1.0e-6
+            t = sc.where(slow, exp(s.real * time_t1), 0.0)
+
+            magz_eq = sc.asarray([1 - pb, pb])
+            vri = vri[..., [2, 5]].real
+            vr = vr[..., 2, :].real
+
+            magz_a = dot(weights, (vr * t * dot(vri, magz_eq)).sum(axis=-1))
 
         return magz_a
 
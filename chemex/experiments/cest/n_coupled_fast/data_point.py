@@ -34,6 +34,8 @@ J_COUPLINGS = (7.7, 10.7, 14.4)
 class DataPoint(BaseDataPoint):
     """Intensity measured during a cpmg pulse train of frequency frq"""
 
+    __slots__ = ()
+
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
                                plot_data)
@@ -1,5 +1,9 @@
-from chemex.bases.two_states.iph import R_IXY, DR_IXY, R_IZ, CS, DW, KAB, \
-    KBA, W1X
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states.iph import BASIS, TERMS
+
+
+assemble_liouvillian = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'DR_IXY', 'R_IZ', 'CS', 'DW', 'W1X', 'KAB', 'KBA'))
 
 
 def compute_liouvillian(pb=0.0, kex=0.0, dw=0.0, r_nz=1.5, r_nxy=5.0,
@@ -43,15 +47,8 @@ def compute_liouvillian(pb=0.0, kex=0.0, dw=0.0, r_nz=1.5, r_nxy=5.0,
     kab = kex * pb
     kba = kex - kab
 
-    liouvillian = (
-        R_IXY * r_nxy +
-        DR_IXY * dr_nxy +
-        R_IZ * r_nz +
-        CS * cs_offset +
-        DW * dw +
-        w1 * W1X +
-        KAB * kab +
-        KBA * kba
+    liouvillian = assemble_liouvillian(
+        r_nxy, dr_nxy, r_nz, cs_offset, dw, w1, kab, kba
     )
 
     return liouvillian
\ No newline at end of file
@@ -1,35 +1,34 @@
-from scipy import linspace, pi
-from scipy.stats import norm
+from scipy import asarray, einsum, expand_dims, newaxis, shape, zeros
 
 import chemex.caching as caching
-from chemex.experiments.misc import correct_chemical_shift
+from chemex.bases.expm import expm_apply
+from chemex.experiments.misc import correct_chemical_shift_batch
+from chemex.experiments.profile import make_calc_observable_from_profile
 from chemex.constants import scalar_couplings
 from liouvillian import set_nz, \
     compute_liouvillian_free_precession, \
-    make_pulse_nh, \
+    compute_base_liouvillians, \
     get_nz
 
 
-TWO_PI = 2.0 * pi
-
 JHN = scalar_couplings['amide_HN']
 
 
 @caching.lru_cache()
-def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_frq_h=0.0,
-                         b1_inh=0.0, b1_inh_res=5, carrier=0.0, carrier_h=0.0,
-                         ppm_to_rads=0.0, ppm_to_rads_h=0.0, _id=None):
-    @caching.lru_cache(5)
-    def _calc_observable(pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0, r_nxy=5.0,
-                         dr_nxy=None, r_nz=1.5, r_2hznz=None, r_2hxynxy=0.0,
-                         r_hxy=10.0, r_hz=1.0, etaxy=0.0, etaz=0.0, j_hn=JHN,
-                         cs_n=0.0, cs_h=0.0):
+def make_calc_observable(time_t1=0.0, b1_frq=0.0, b1_frq_h=0.0, b1_inh=0.0,
+                         b1_inh_res=5, b1_inh_scheme='linspace', carrier=0.0,
+                         carrier_h=0.0, ppm_to_rads=0.0, ppm_to_rads_h=0.0,
+                         _id=None):
+    def _calc_profile(b1_offsets, pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0,
+                      r_nxy=5.0, dr_nxy=None, r_nz=1.5, r_2hznz=None,
+                      r_2hxynxy=0.0, r_hxy=10.0, r_hz=1.0, etaxy=0.0,
+                      etaz=0.0, j_hn=JHN, cs_n=0.0, cs_h=0.0):
         """
-        Calculate the intensity in presence of exchange during a cpmg-type pulse train.
+        Calculate the intensities in presence of exchange after a CW block for
+        all the B1 offsets of a profile.
 
         Keyword arguments:
-        I0 -- Initial intensity,
-              0.0 (default),
+        b1_offsets -- frequency offsets of the applied B1 field in Hz
         pb -- population of state B,
               0.0 for 0% (default),
               1.0 for 100%
@@ -45,8 +44,6 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_frq_h=0.0,
                 1.5 (default)
         cs_offset -- chemical shift from the carrier in rad/s,
                      0.0 (default)
-        B1_offset -- frequency offset of the applied B1 field in Hz,
-                     0.0 Hz (default)
         B1_frq -- strength of the applied B1 field in Hz,
                   0.0 Hz (default)
         B1_inh -- B1 field inhomogeneity in Hz,
@@ -56,23 +53,25 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_frq_h=0.0,
 
 
 
-        Returns: float
+        Returns: ndarray
         """
 
-        wg_h = (cs_h - carrier_h) * ppm_to_rads_h
-        wg_n = (cs_n - carrier) * ppm_to_rads
-        dw_h_rads = dw_h * ppm_to_rads_h
-        dw_n_rads = dw_n * ppm_to_rads
+        b1_offsets = asarray(b1_offsets)
+        reference = abs(b1_offsets) > 9999.0
 
         mag_eq = set_nz(pb)
 
-        if abs(b1_offset) > 9999.0:
+        magz_a = zeros(shape(pb) + b1_offsets.shape)
+        magz_a[..., reference] = expand_dims(get_nz(mag_eq)[0], -1)
 
-            mag = mag_eq
+        if not reference.all():
 
-        else:
+            wg_h = (cs_h - carrier_h) * ppm_to_rads_h
+            wg_n = (cs_n - carrier) * ppm_to_rads
+            dw_h_rads = dw_h * ppm_to_rads_h
+            dw_n_rads = dw_n * ppm_to_rads
 
-            exchange_induced_shift_n, _ = correct_chemical_shift(
+            exchange_induced_shift_n, _ = correct_chemical_shift_batch(
                 pb=pb,
                 kex=kex,
                 dw=dw_n_rads,
@@ -80,7 +79,7 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_frq_h=0.0,
                 dr_ixy=dr_nxy
             )
 
-            offset_n = wg_n - exchange_induced_shift_n - b1_offset * 2.0 * pi
+            offset_n = wg_n - exchange_induced_shift_n
 
             liouvillian = compute_liouvillian_free_precession(
                 pb=pb,
@@ -101,42 +100,32 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_frq_h=0.0,
                 j_hn=j_hn
             )
 
-            b1_frq_n_list = linspace(-2.0, 2.0, b1_inh_res) * b1_inh + b1_frq
-            b1_frq_n_scales = norm.pdf(b1_frq_n_list, b1_frq, b1_inh)
-            b1_frq_n_scales /= b1_frq_n_scales.sum()
-
-            mag = sum(
-                scale *
-                make_pulse_nh(
-                    liouvillian=liouvillian,
-                    w1_h=TWO_PI * b1_frq_h,
-                    phase_h=0.0,
-                    w1_n=TWO_PI * b1_frq_n,
-                    phase_n=0.0,
-                    pw=time_t1
-                ).dot(mag_eq)
-                for b1_frq_n, scale in zip(b1_frq_n_list, b1_frq_n_scales)
+            base_liouvillians, weights = compute_base_liouvillians(
+                b1_offsets=b1_offsets[~reference],
+                b1_frq=b1_frq,
+                b1_frq_h=b1_frq_h,
+                b1_inh=b1_inh,
+                b1_inh_res=b1_inh_res,
+                b1_inh_scheme=b1_inh_scheme
             )
 
-        return get_nz(mag)[0]
-
-    def calc_observable(i0=0.0, **kwargs):
-        """
-        Calculate the intensity in presence of exchange after a CEST block.
+            # One stack of Liouvillians per profile when given arrays of
+            # parameters
+            liouvillians = (base_liouvillians +
+                            liouvillian[..., newaxis, newaxis, :, :])
 
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
+            mags = expm_apply(liouvillians,
+                              mag_eq[..., newaxis, newaxis, :, :], time_t1)
+            mag = einsum('s,...sij->...ij', weights, mags)
 
-        Returns
-        -------
-        out : float
-            Intensity after the CEST block
-
-        """
+            magz_a[..., ~reference], _ = get_nz(mag)
 
-        return i0 * _calc_observable(**kwargs)
+        return magz_a
 
-    return calc_observable
+    # Profiles of other residues with the same settings can be calculated
+    # together (see chemex.experiments.profile.make_calc_vals)
+    batch_key = (__name__, time_t1, b1_frq, b1_frq_h, b1_inh, b1_inh_res,
+                 b1_inh_scheme, carrier, carrier_h, ppm_to_rads, ppm_to_rads_h)
 
+    return make_calc_observable_from_profile(_calc_profile, 'b1_offset',
+                                             batch_key=batch_key)
@@ -3,6 +3,7 @@ from math import pi
 
 from chemex import parsing
 from chemex.experiments.base_data_point import BaseDataPoint
+from chemex.experiments.misc import get_b1_inh_scheme, make_calc_observable_ref
 from chemex.constants import xi_ratio
 from .back_calculation import make_calc_observable
 from ..plotting import plot_data
@@ -20,7 +21,7 @@ PAR_DICT = {
     ),
     'exp': ('resonance_id', 'h_larmor_frq', 'temperature', 'carrier',
             'carrier_h', 'time_t1', 'b1_frq', 'b1_frq_h', 'b1_offset', 'b1_inh',
-            'b1_inh_res',),
+            'b1_inh_res', 'b1_inh_scheme',),
     'fit': ('pb', 'kex', 'dw_h', 'dw_n', 'i0', 'r_nxy', 'dr_nxy', 'r_nz',
             'r_2hxynxy', 'r_hxy', 'etaxy', 'etaz'),
     'fix': ('cs_n', 'cs_h', 'r_2hznz', 'r_hz', 'j_hn'),
@@ -30,6 +31,8 @@ PAR_DICT = {
 class DataPoint(BaseDataPoint):
     """Intensity measured during a cpmg pulse train of frequency frq"""
 
+    __slots__ = ('calc_observable_ref',)
+
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
                                plot_data)
@@ -51,12 +54,18 @@ class DataPoint(BaseDataPoint):
 
         self.par['_id'] = tuple((temperature, nucleus_name_2, h_larmor_frq))
 
+        self.par['b1_inh_scheme'] = get_b1_inh_scheme(self.par)
+
         args = (
             self.par[arg]
             for arg in getargspec(make_calc_observable.__wrapped__).args
         )
 
         self.calc_observable = make_calc_observable(*args)
+        self.calc_observable_ref = make_calc_observable_ref(
+            make_calc_observable, self.par)
+
+        self.kwargs_default = {'b1_offset': self.par['b1_offset']}
 
         self.short_long_par_names = (
             ('i0', ('i0', resonance_id, experiment_name)),
@@ -113,7 +122,5 @@ class DataPoint(BaseDataPoint):
         """Update b1_offset value"""
 
         self.par['b1_offset'] = b1_offset
-        args = (self.par[arg] for arg in
-                getargspec(make_calc_observable.__wrapped__).args)
-        self.calc_observable = make_calc_observable(*args)
+        self.kwargs_default['b1_offset'] = b1_offset
 
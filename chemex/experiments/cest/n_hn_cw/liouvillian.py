@@ -1,21 +1,22 @@
 from math import pi
 
-from scipy import zeros, cos, sin
-from scipy.linalg import expm2 as expm
+from scipy import zeros, asarray, newaxis, shape
 
-from chemex import caching
 from chemex.constants import scalar_couplings
-from chemex.bases.two_states.full import (
-    R_HXY, R_HZ, R_NXY_A, R_NXY_B, R_NZ, R_2HXYNZ, R_2HZNXY_A, R_2HZNXY_B,
-    R_2HXYNXY, R_2HZNZ, CS_H_A, CS_H_B, CS_N_A, CS_N_B, J_HN, ETAZ, ETAXY,
-    W1X_H, W1Y_H, W1X_N, W1Y_N, KAB, KBA
-)
+from chemex.experiments.misc import calc_b1_inh_samples
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states.full import (CS_N_A, CS_N_B, W1X_H, W1X_N, BASIS,
+                                          TERMS)
 
 
 JHN = scalar_couplings['amide_HN']
 
+assemble_liouvillian = make_assembler(BASIS, TERMS, (
+    'R_HXY', 'R_HZ', 'R_NXY_A', 'R_NXY_B', 'R_NZ', 'R_2HXYNZ', 'R_2HZNXY_A',
+    'R_2HZNXY_B', 'R_2HXYNXY', 'R_2HZNZ', 'CS_H_A', 'CS_H_B', 'CS_N_A',
+    'CS_N_B', 'J_HN', 'ETAXY', 'ETAZ', 'KAB', 'KBA'))
+
 
-@caching.lru_cache()
 def compute_liouvillian_free_precession(pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0,
                                         r_nxy=5.0, dr_nxy=0.0, r_nz=1.5,
                                         r_2hznz=0.0, r_2hxynxy=0.0, r_hxy=10.0,
@@ -62,64 +63,59 @@ def compute_liouvillian_free_precession(pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0,
     r_2hznxy = r_nxy + r_2sf
     r_2hxynz = r_hxy - r_nz
 
-    liouvillian = (
-        R_HXY * r_hxy +
-        R_HZ * r_hz +
-        R_NXY_A * r_nxy +
-        R_NXY_B * (r_nxy + dr_nxy) +
-        R_NZ * r_nz +
-        R_2HXYNZ * r_2hxynz +
-        R_2HZNXY_A * r_2hznxy +
-        R_2HZNXY_B * (r_2hznxy + dr_nxy) +
-        R_2HXYNXY * r_2hxynxy +
-        R_2HZNZ * r_2hznz +
-        CS_H_A * cs_offset_h +
-        CS_H_B * (cs_offset_h + dw_h) +
-        CS_N_A * cs_offset_n +
-        CS_N_B * (cs_offset_n + dw_n) +
-        J_HN * pi * j_hn +
-        ETAXY * etaxy +
-        ETAZ * etaz +
-        KAB * kab +
-        KBA * kba
+    liouvillian = assemble_liouvillian(
+        r_hxy, r_hz, r_nxy, r_nxy + dr_nxy, r_nz, r_2hxynz, r_2hznxy,
+        r_2hznxy + dr_nxy, r_2hxynxy, r_2hznz, cs_offset_h, cs_offset_h + dw_h,
+        cs_offset_n, cs_offset_n + dw_n, pi * j_hn, etaxy, etaz, kab, kba
     )
 
     return liouvillian
 
 
 def set_nz(pb):
-    mag_eq = zeros((30, 1))
+    mag_eq = zeros(shape(pb) + (30, 1))
 
-    mag_eq[5, 0] = (1.0 - pb)
-    mag_eq[5 + 15, 0] = pb
+    mag_eq[..., 5, 0] = (1.0 - pb)
+    mag_eq[..., 5 + 15, 0] = pb
 
     return mag_eq
 
 
 def get_nz(mag):
-    ia = mag[5, 0]
-    ib = mag[5 + 15, 0]
+    ia = mag[..., 5, 0]
+    ib = mag[..., 5 + 15, 0]
 
     return ia, ib
 
 
-def make_pulse_nh(liouvillian, w1_h=0.0, phase_h=0.0, w1_n=0.0, phase_n=0.0,
-                  pw=0.0):
-    phase_rad_h = 0.5 * phase_h * pi
-    phase_rad_n = 0.5 * phase_n * pi
+def compute_base_liouvillians(b1_offsets=(0.0,), b1_frq=0.0, b1_frq_h=0.0,
+                              b1_inh=0.0, b1_inh_res=5,
+                              b1_inh_scheme='linspace'):
+    """
+    Returns the Liouvillians of the B1 fields (applied along x) for all the
+    15N offsets of a profile and all the 15N B1 field values sampled to model
+    its inhomogeneity, along with the normalized weights of those values.
+
+    Returns
+    -------
+    liouvillians : ndarray, shape (len(b1_offsets), b1_inh_res, n, n)
+    weights : ndarray, shape (b1_inh_res,)
+
+    """
+
+    w1_offsets = 2.0 * pi * asarray(b1_offsets)
+    w1_h = 2.0 * pi * b1_frq_h
 
-    w1x_h = w1_h * cos(phase_rad_h)
-    w1y_h = w1_h * sin(phase_rad_h)
+    b1_frq_n_list, weights = calc_b1_inh_samples(b1_frq, b1_inh, b1_inh_res,
+                                                 b1_inh_scheme)
+    weights /= weights.sum()
 
-    w1x_n = w1_n * cos(phase_rad_n)
-    w1y_n = w1_n * sin(phase_rad_n)
+    w1s_n = 2.0 * pi * b1_frq_n_list
 
-    new_liouvillian = (
-        liouvillian +
-        w1x_h * W1X_H +
-        w1y_h * W1Y_H +
-        w1x_n * W1X_N +
-        w1y_n * W1Y_N
+    liouvillians = (
+        -w1_offsets[:, newaxis, newaxis, newaxis] * (CS_N_A + CS_N_B) +
+        w1s_n[:, newaxis, newaxis] * W1X_N +
+        w1_h * W1X_H
     )
 
-    return expm(new_liouvillian * pw)
+    return liouvillians, weights
@@ -113,7 +113,7 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_frq_h=0.0,
             vr = vr[ix_(sl3, sl2)].real
             magz_eq = asarray([[1 - pb], [pb]])
 
-            magz_a = dot(dot(dot(vr, t), vri), magz_eq)[0, 0]
+            magz_a = dot(vr, dot(t, dot(vri, magz_eq)))[0, 0]
 
         return magz_a
 
@@ -2,15 +2,17 @@ from math import pi
 
 from chemex import caching
 from chemex.constants import scalar_couplings
-from chemex.bases.two_states.full import (
-    R_HXY, R_HZ, R_NXY_A, R_NXY_B, R_NZ, R_2HXYNZ, R_2HZNXY_A, R_2HZNXY_B,
-    R_2HXYNXY, R_2HZNZ, CS_H_A, CS_H_B, CS_N_A, CS_N_B, J_HN, ETAZ, ETAXY,
-    W1X_H, W1X_N, KAB, KBA
-)
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states.full import BASIS, TERMS
 
 
 JHN = scalar_couplings['amide_HN']
 
+assemble_liouvillian = make_assembler(BASIS, TERMS, (
+    'R_HXY', 'R_HZ', 'R_NXY_A', 'R_NXY_B', 'R_NZ', 'R_2HXYNZ', 'R_2HZNXY_A',
+    'R_2HZNXY_B', 'R_2HXYNXY', 'R_2HZNZ', 'CS_H_A', 'CS_H_B', 'CS_N_A',
+    'CS_N_B', 'J_HN', 'ETAXY', 'ETAZ', 'KAB', 'KBA', 'W1X_H', 'W1X_N'))
+
 
 @caching.lru_cache()
 def compute_liouvillian(pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0, r_nxy=5.0,
@@ -58,28 +60,11 @@ def compute_liouvillian(pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0, r_nxy=5.0,
     r_2hznxy = r_nxy + r_2sf
     r_2hxynz = r_hxy - r_nz
 
-    liouvillian = (
-        R_HXY * r_hxy +
-        R_HZ * r_hz +
-        R_NXY_A * r_nxy +
-        R_NXY_B * (r_nxy + dr_nxy) +
-        R_NZ * r_nz +
-        R_2HXYNZ * r_2hxynz +
-        R_2HZNXY_A * r_2hznxy +
-        R_2HZNXY_B * (r_2hznxy + dr_nxy) +
-        R_2HXYNXY * r_2hxynxy +
-        R_2HZNZ * r_2hznz +
-        CS_H_A * cs_offset_h +
-        CS_H_B * (cs_offset_h + dw_h) +
-        CS_N_A * cs_offset_n +
-        CS_N_B * (cs_offset_n + dw_n) +
-        J_HN * pi * j_hn +
-        ETAXY * etaxy +
-        ETAZ * etaz +
-        KAB * kab +
-        KBA * kba +
-        w1_h * W1X_H +
-        w1_n * W1X_N
+    liouvillian = assemble_liouvillian(
+        r_hxy, r_hz, r_nxy, r_nxy + dr_nxy, r_nz, r_2hxynz, r_2hznxy,
+        r_2hznxy + dr_nxy, r_2hxynxy, r_2hznz, cs_offset_h, cs_offset_h + dw_h,
+        cs_offset_n, cs_offset_n + dw_n, pi * j_hn, etaxy, etaz, kab, kba,
+        w1_h, w1_n
     )
 
     return liouvillian
@@ -5,15 +5,17 @@ Created on Aug 15, 2011
 """
 
 import scipy as sc
-from scipy.linalg import expm2 as expm
 
-from chemex.experiments.misc import correct_chemical_shift
+from chemex.bases.expm import expm_apply
+from chemex.experiments.misc import correct_chemical_shift_batch
+from chemex.experiments.profile import make_calc_observable_from_profile
 from chemex.caching import lru_cache
 from .liouvillian import compute_nz_eq, compute_base_liouvillians, compute_free_liouvillian, get_nz
 
 
 @lru_cache()
-def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0, b1_inh_res=5, carrier=0.0, ppm_to_rads=0.0,
+def make_calc_observable(time_t1=0.0, b1_frq=0.0, b1_inh=0.0, b1_inh_res=5,
+                         b1_inh_scheme='linspace', carrier=0.0, ppm_to_rads=0.0,
                          _id=None):
     """
     Factory to make "calc_observable" function to calculate the intensity in presence
@@ -23,14 +25,15 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0, b1_
     ----------
     time_t1 : float
         Duration of the CW block.
-    b1_offset : float
-        Frequency offset of the applied B1 field in Hz.
     b1_frq : float
         Strength of the applied B1 field in Hz.
     b1_inh : float
         B1 field inhomogeneity in Hz.
     b1_inh_res : int
         Resolution to model B1 field inhomogeneity.
+    b1_inh_scheme : {'linspace', 'legendre'}
+        Sampling of the B1 field distribution (see
+        chemex.experiments.misc.calc_b1_inh_samples).
     carrier : float
         Carrier position in rad/s.
     ppm_to_rads : float
@@ -45,16 +48,15 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0, b1_
 
     """
 
-    base_liouvillians, weights = compute_base_liouvillians(b1_offset, b1_frq, b1_inh, b1_inh_res)
-
-    @lru_cache(5)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_nz=1.5, r_nxy=0.0, dr_nxy=0.0, cs=0.0):
+    def _calc_profile(b1_offsets, pb=0.0, kex=0.0, dw=0.0, r_nz=1.5, r_nxy=0.0, dr_nxy=0.0, cs=0.0):
         """
-        Calculate the intensity in presence of exchange after a CEST block assuming
-        initial intensity of 1.0.
+        Calculate the intensities in presence of exchange after a CEST block
+        for all the B1 offsets of a profile, assuming initial intensity of 1.0.
 
         Parameters
         ----------
+        b1_offsets : tuple of float
+            Frequency offsets of the applied B1 field in Hz.
         pb : float
             Fractional population of state B,
             0.0 for 0%, 1.0 for 100%
@@ -73,52 +75,46 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0, b1_
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : ndarray
+            Intensities after the CEST block
 
         """
 
-        if abs(b1_offset) >= 10000.0:
+        b1_offsets = sc.asarray(b1_offsets)
+        reference = abs(b1_offsets) >= 10000.0
 
-            return 1.0 - pb
+        magz_a = sc.zeros(sc.shape(pb) + b1_offsets.shape)
+        magz_a[..., reference] = sc.expand_dims(1.0 - pb, -1)
 
-        else:
+        if reference.all():
+            return magz_a
 
-            dw *= ppm_to_rads
-            mag_eq = compute_nz_eq(pb)
-            exchange_induced_shift, _ = correct_chemical_shift(pb=pb, kex=kex, dw=dw,
-                                                               r_ixy=r_nxy, dr_ixy=dr_nxy)
-            wg = (cs - carrier) * ppm_to_rads - exchange_induced_shift
+        dw *= ppm_to_rads
+        mag_eq = compute_nz_eq(pb)
+        exchange_induced_shift, _ = correct_chemical_shift_batch(pb=pb, kex=kex, dw=dw,
+                                                           r_ixy=r_nxy, dr_ixy=dr_nxy)
+        wg = (cs - carrier) * ppm_to_rads - exchange_induced_shift
 
-            liouvillians = base_liouvillians + compute_free_liouvillian(pb=pb, kex=kex, dw=dw,
-                                                                        r_nxy=r_nxy, dr_nxy=dr_nxy,
-                                                                        r_nz=r_nz, cs_offset=wg)
+        base_liouvillians, weights = compute_base_liouvillians(b1_offsets[~reference], b1_frq, b1_inh,
+                                                               b1_inh_res, b1_inh_scheme)
 
-            propagator = sc.zeros_like(liouvillians[0])
-            for liouvillian, weight in zip(liouvillians, weights):
-                propagator += weight * expm(liouvillian * time_t1)
-            propagator /= sum(weights)
+        l_free = compute_free_liouvillian(pb=pb, kex=kex, dw=dw, r_nxy=r_nxy, dr_nxy=dr_nxy,
+                                          r_nz=r_nz, cs_offset=wg)
 
-            magz_a, _ = get_nz(sc.dot(propagator, mag_eq))
+        # One stack of Liouvillians per profile when given arrays of parameters
+        liouvillians = base_liouvillians + l_free[..., sc.newaxis, sc.newaxis, :, :]
 
-            return magz_a
+        mags = expm_apply(liouvillians, mag_eq[..., sc.newaxis, sc.newaxis, :, :], time_t1)
+        mag = sc.einsum('s,...sij->...ij', weights, mags) / sum(weights)
 
-    def calc_observable(i0=0.0, **kwargs):
-        """
-        Calculate the intensity in presence of exchange after a CEST block.
+        magz_a[..., ~reference], _ = get_nz(mag)
 
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
-
-        Returns
-        -------
-        out : float
-            Intensity after the CEST block
-
-        """
+        return magz_a
 
-        return i0 * _calc_observable(**kwargs)
+    # Profiles of other residues with the same settings can be calculated
+    # together (see chemex.experiments.profile.make_calc_vals)
+    batch_key = (__name__, time_t1, b1_frq, b1_inh, b1_inh_res, b1_inh_scheme,
+                 carrier, ppm_to_rads)
 
-    return calc_observable
+    return make_calc_observable_from_profile(_calc_profile, 'b1_offset',
+                                             batch_key=batch_key)
@@ -3,6 +3,7 @@ from math import pi
 
 from chemex.parsing import parse_assignment
 from chemex.experiments.base_data_point import BaseDataPoint
+from chemex.experiments.misc import get_b1_inh_scheme, make_calc_observable_ref
 from chemex.constants import xi_ratio
 from .back_calculation import make_calc_observable
 from ..plotting import plot_data
@@ -26,7 +27,8 @@ PAR_DICT = {
         'b1_frq',
         'b1_offset',
         'b1_inh',
-        'b1_inh_res'
+        'b1_inh_res',
+        'b1_inh_scheme'
     ),
     'fit': (
         'pb',
@@ -43,6 +45,8 @@ PAR_DICT = {
 
 class DataPoint(BaseDataPoint):
 
+    __slots__ = ('calc_observable_ref',)
+
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'], plot_data)
 
@@ -59,12 +63,18 @@ class DataPoint(BaseDataPoint):
 
         self.par['_id'] = tuple((temperature, nucleus_name, h_larmor_frq))
 
+        self.par['b1_inh_scheme'] = get_b1_inh_scheme(self.par)
+
         args = (
             self.par[arg]
             for arg in getargspec(make_calc_observable.__wrapped__).args
         )
 
         self.calc_observable = make_calc_observable(*args)
+        self.calc_observable_ref = make_calc_observable_ref(
+            make_calc_observable, self.par)
+
+        self.kwargs_default = {'b1_offset': self.par['b1_offset']}
 
         self.short_long_par_names = (
             ('pb', ('pb', temperature)),
@@ -111,6 +121,5 @@ class DataPoint(BaseDataPoint):
         """Update b1_offset value"""
 
         self.par['b1_offset'] = b1_offset
-        args = (self.par[arg] for arg in getargspec(make_calc_observable.__wrapped__).args)
-        self.calc_observable = make_calc_observable(*args)
+        self.kwargs_default['b1_offset'] = b1_offset
 
@@ -1,14 +1,16 @@
 import scipy as sc
-from scipy.linalg import expm2 as expm
 
+from ....bases.expm import expm_apply
 from ....caching import lru_cache
+from ...profile import make_calc_observable_from_profile
 from .liouvillian import compute_nz_eq, compute_base_liouvillians, \
     compute_free_liouvillian, get_nz
 
 
 @lru_cache()
-def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0,
-                         b1_inh_res=5, carrier=0.0, ppm_to_rads=0.0, _id=None):
+def make_calc_observable(time_t1=0.0, b1_frq=0.0, b1_inh=0.0, b1_inh_res=5,
+                         b1_inh_scheme='linspace', carrier=0.0, ppm_to_rads=0.0,
+                         _id=None):
     """
     Factory to make "calc_observable" function to calculate the intensity in presence
     of exchange after a CEST block.
@@ -17,14 +19,15 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0,
     ----------
     time_t1 : float
         Duration of the CW block.
-    b1_offset : float
-        Frequency offset of the applied B1 field in Hz.
     b1_frq : float
         Strength of the applied B1 field in Hz.
     b1_inh : float
         B1 field inhomogeneity in Hz.
     b1_inh_res : int
         Resolution to model B1 field inhomogeneity.
+    b1_inh_scheme : {'linspace', 'legendre'}
+        Sampling of the B1 field distribution (see
+        chemex.experiments.misc.calc_b1_inh_samples).
     carrier : float
         Carrier position in rad/s.
     ppm_to_rads : float
@@ -39,17 +42,17 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0,
 
     """
 
-    base_liouvillians, weights = \
-        compute_base_liouvillians(b1_offset, b1_frq, b1_inh, b1_inh_res)
-
-    @lru_cache(5)
-    def _calc_observable(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
-                         dw_ab=0.0, dw_ac=0.0, r_nz=1.5, r_nxy=0.0, dr_nxy_ab=0.0, dr_nxy_ac=0.0, cs=0.0):
+    def _calc_profile(b1_offsets, pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0,
+                      kex_ac=0.0, dw_ab=0.0, dw_ac=0.0, r_nz=1.5, r_nxy=0.0,
+                      dr_nxy_ab=0.0, dr_nxy_ac=0.0, cs=0.0):
         """
-        Calculate the intensity in presence of exchange after a CEST block.
+        Calculate the intensities in presence of exchange after a CEST block
+        for all the B1 offsets of a profile.
 
         Parameters
         ----------
+        b1_offsets : tuple of float
+            Frequency offsets of the applied B1 field in Hz.
         pb : float
             Fractional population of state B,
             0.0 for 0%, 1.0 for 100%
@@ -79,67 +82,60 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0,
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : ndarray
+            Intensities after the CEST block
 
         """
 
-        if abs(b1_offset) >= 10000.0:
+        b1_offsets = sc.asarray(b1_offsets)
+        reference = abs(b1_offsets) >= 10000.0
 
-            return 1.0 - pb - pc
+        magz_a = sc.zeros(sc.shape(pb) + b1_offsets.shape)
+        magz_a[..., reference] = sc.expand_dims(1.0 - pb - pc, -1)
 
-        else:
+        if reference.all():
+            return magz_a
 
-            dw_ab *= ppm_to_rads
-            dw_ac *= ppm_to_rads
+        dw_ab *= ppm_to_rads
+        dw_ac *= ppm_to_rads
 
-            mag_eq = compute_nz_eq(pb, pc)
+        mag_eq = compute_nz_eq(pb, pc)
 
-            exchange_induced_shift = 0.0  # TODO
-            wg = (cs - carrier) * ppm_to_rads - exchange_induced_shift
+        exchange_induced_shift = 0.0  # TODO
+        wg = (cs - carrier) * ppm_to_rads - exchange_induced_shift
 
-            liouvillians = \
-                base_liouvillians + \
-                compute_free_liouvillian(
-                    pb=pb,
-                    pc=pc,
-                    kex_ab=kex_ab,
-                    kex_bc=kex_bc,
-                    kex_ac=kex_ac,
-                    dw_ab=dw_ab,
-                    dw_ac=dw_ac,
-                    r_nxy=r_nxy,
-                    r_nz=r_nz,
-                    dr_nxy_ab=dr_nxy_ab,
-                    dr_nxy_ac=dr_nxy_ac,
-                    cs_offset=wg
-            )
+        base_liouvillians, weights = compute_base_liouvillians(
+            b1_offsets[~reference], b1_frq, b1_inh, b1_inh_res, b1_inh_scheme)
 
-            propagator = sc.zeros_like(liouvillians[0])
-            for liouvillian, weight in zip(liouvillians, weights):
-                propagator += weight * expm(liouvillian * time_t1)
-            propagator /= sum(weights)
+        l_free = compute_free_liouvillian(
+            pb=pb,
+            pc=pc,
+            kex_ab=kex_ab,
+            kex_bc=kex_bc,
+            kex_ac=kex_ac,
+            dw_ab=dw_ab,
+            dw_ac=dw_ac,
+            r_nxy=r_nxy,
+            r_nz=r_nz,
+            dr_nxy_ab=dr_nxy_ab,
+            dr_nxy_ac=dr_nxy_ac,
+            cs_offset=wg
+        )
 
-            magz_a, _, _ = get_nz(sc.dot(propagator, mag_eq))
+        # One stack of Liouvillians per profile when given arrays of parameters
+        liouvillians = base_liouvillians + l_free[..., sc.newaxis, sc.newaxis, :, :]
 
-            return magz_a
+        mags = expm_apply(liouvillians, mag_eq[..., sc.newaxis, sc.newaxis, :, :], time_t1)
+        mag = sc.einsum('s,...sij->...ij', weights, mags) / sum(weights)
 
-    def calc_observable(i0=0.0, **kwargs):
-        """
-        Calculate the intensity in presence of exchange after a CEST block.
+        magz_a[..., ~reference], _, _ = get_nz(mag)
 
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
-
-        Returns
-        -------
-        out : float
-            Intensity after the CEST block
-
-        """
+        return magz_a
 
-        return i0 * _calc_observable(**kwargs)
+    # Profiles of other residues with the same settings can be calculated
+    # together (see chemex.experiments.profile.make_calc_vals)
+    batch_key = (__name__, time_t1, b1_frq, b1_inh, b1_inh_res, b1_inh_scheme,
+                 carrier, ppm_to_rads)
 
-    return calc_observable
+    return make_calc_observable_from_profile(_calc_profile, 'b1_offset',
+                                             batch_key=batch_key)
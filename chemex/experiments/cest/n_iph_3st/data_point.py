@@ -3,6 +3,7 @@ from math import pi
 
 from ....parsing import parse_assignment
 from ...base_data_point import BaseDataPoint
+from ...misc import get_b1_inh_scheme, make_calc_observable_ref
 from ....constants import xi_ratio
 from .back_calculation import make_calc_observable
 from ..plotting import plot_data
@@ -18,7 +19,7 @@ PAR_DICT = {
         (int, ('b1_inh_res',))
     ),
     'exp': ('resonance_id', 'h_larmor_frq', 'temperature', 'carrier', 'time_t1',
-            'b1_frq', 'b1_offset', 'b1_inh', 'b1_inh_res'),
+            'b1_frq', 'b1_offset', 'b1_inh', 'b1_inh_res', 'b1_inh_scheme'),
     'fit': ('pb', 'pc', 'kex_ab', 'kex_bc', 'dw_ab', 'dw_ac', 'i0', 'r_nxy',
             'dr_nxy_ab', 'dr_nxy_ac', 'r_nz'),
     'fix': ('cs', 'kex_ac',),
@@ -28,6 +29,8 @@ PAR_DICT = {
 class DataPoint(BaseDataPoint):
     """Intensity measured during a cpmg pulse train of frequency frq"""
 
+    __slots__ = ('calc_observable_ref',)
+
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'], plot_data)
 
@@ -44,8 +47,14 @@ class DataPoint(BaseDataPoint):
 
         self.par['_id'] = tuple((temperature, nucleus_name, h_larmor_frq))
 
+        self.par['b1_inh_scheme'] = get_b1_inh_scheme(self.par)
+
         args = (self.par[arg] for arg in getargspec(make_calc_observable.__wrapped__).args)
         self.calc_observable = make_calc_observable(*args)
+        self.calc_observable_ref = make_calc_observable_ref(
+            make_calc_observable, self.par)
+
+        self.kwargs_default = {'b1_offset': self.par['b1_offset']}
 
         self.short_long_par_names = (
             ('pb', ('pb', temperature)),
@@ -97,6 +106,5 @@ class DataPoint(BaseDataPoint):
         """Update b1_offset value"""
 
         self.par['b1_offset'] = b1_offset
-        args = (self.par[arg] for arg in getargspec(make_calc_observable.__wrapped__).args)
-        self.calc_observable = make_calc_observable(*args)
+        self.kwargs_default['b1_offset'] = b1_offset
 
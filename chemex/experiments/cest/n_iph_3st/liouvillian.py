@@ -1,19 +1,37 @@
-from scipy import pi, zeros, linspace, asarray
-from scipy.stats import norm
+from scipy import pi, zeros, asarray, newaxis, shape
 
-from chemex.bases.three_states.iph import R_IXY, DR_IXY_AB, DR_IXY_AC, R_IZ, \
-    CS, DW_AB, DW_AC, KAB, KBA, KAC, KCA, KBC, KCB, W1X
+from chemex.experiments.misc import calc_b1_inh_samples
+from chemex.bases.assembly import make_assembler
+from chemex.bases.three_states.iph import CS, W1X, BASIS, TERMS
 
 
-def compute_base_liouvillians(b1_offset=0.0, b1_frq=0.0, b1_inh=0.0,
-                              b1_inh_res=5):
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'DR_IXY_AB', 'DR_IXY_AC', 'R_IZ', 'CS', 'DW_AB', 'DW_AC', 'KAB',
+    'KBA', 'KBC', 'KCB', 'KAC', 'KCA'))
 
-    w1, w1_inh, w1_offset = 2.0 * pi * asarray([b1_frq, b1_inh, b1_offset])
 
-    w1s = linspace(-2.0, 2.0, b1_inh_res) * w1_inh + w1
-    weights = norm.pdf(w1s, w1, w1_inh)
+def compute_base_liouvillians(b1_offsets=(0.0,), b1_frq=0.0, b1_inh=0.0,
+                              b1_inh_res=5,
+                              b1_inh_scheme='linspace'):
+    """
+    Returns the Liouvillians of the B1 field for all the offsets of a profile
+    and all the B1 field values sampled to model its inhomogeneity, along
+    with the weights of those values.
+
+    Returns
+    -------
+    liouvillians : ndarray, shape (len(b1_offsets), b1_inh_res, n, n)
+    weights : ndarray, shape (b1_inh_res,)
+
+    """
+
+    w1, w1_inh = 2.0 * pi * asarray([b1_frq, b1_inh])
+    w1_offsets = 2.0 * pi * asarray(b1_offsets)
+
+    w1s, weights = calc_b1_inh_samples(w1, w1_inh, b1_inh_res, b1_inh_scheme)
 
-    liouvillians = [-w1_offset * CS + w1 * W1X for w1 in w1s]
+    liouvillians = (-w1_offsets[:, newaxis, newaxis, newaxis] * CS +
+                    w1s[:, newaxis, newaxis] * W1X)
 
     return liouvillians, weights
 
@@ -76,20 +94,9 @@ def compute_free_liouvillian(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
     kac = kex_ac * pc / (pa + pc)
     kca = kex_ac * pa / (pa + pc)
 
-    l_free = (
-        R_IXY * r_nxy +
-        DR_IXY_AB * dr_nxy_ab +
-        DR_IXY_AC * dr_nxy_ac +
-        R_IZ * r_nz +
-        CS * cs_offset +
-        DW_AB * dw_ab +
-        DW_AC * dw_ac +
-        KAB * kab +
-        KBA * kba +
-        KBC * kbc +
-        KCB * kcb +
-        KAC * kac +
-        KCA * kca
+    l_free = assemble_free(
+        r_nxy, dr_nxy_ab, dr_nxy_ac, r_nz, cs_offset, dw_ab, dw_ac, kab, kba,
+        kbc, kcb, kac, kca
     )
 
     return l_free
@@ -115,10 +122,10 @@ def compute_nz_eq(pb, pc):
 
     """
 
-    mag_eq = zeros((9, 1))
-    mag_eq[2, 0] += (1.0 - pb - pc)
-    mag_eq[5, 0] += pb
-    mag_eq[8, 0] += pc
+    mag_eq = zeros(shape(pb) + (9, 1))
+    mag_eq[..., 2, 0] += (1.0 - pb - pc)
+    mag_eq[..., 5, 0] += pb
+    mag_eq[..., 8, 0] += pc
 
     return mag_eq
 
@@ -139,8 +146,8 @@ def get_nz(mag):
 
     """
 
-    magz_a = mag[2, 0]
-    magz_b = mag[5, 0]
-    magz_c = mag[8, 0]
+    magz_a = mag[..., 2, 0]
+    magz_b = mag[..., 5, 0]
+    magz_c = mag[..., 8, 0]
 
     return magz_a, magz_b, magz_c
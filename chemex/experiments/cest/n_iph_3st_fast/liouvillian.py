@@ -1,5 +1,10 @@
-from ....bases.three_states.iph import R_IXY, DR_IXY_AB, DR_IXY_AC, R_IZ, CS, \
-    DW_AB, DW_AC, KAB, KBA, KAC, KCA, KBC, KCB, W1X
+from ....bases.assembly import make_assembler
+from ....bases.three_states.iph import BASIS, TERMS
+
+
+assemble_liouvillian = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'DR_IXY_AB', 'DR_IXY_AC', 'R_IZ', 'CS', 'DW_AB', 'DW_AC', 'W1X',
+    'KAB', 'KBA', 'KBC', 'KCB', 'KAC', 'KCA'))
 
 
 def compute_liouvillian(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
@@ -60,21 +65,9 @@ def compute_liouvillian(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
     kac = kex_ac * pc / (pa + pc)
     kca = kex_ac * pa / (pa + pc)
 
-    liouvillian = (
-        R_IXY * r_nxy +
-        DR_IXY_AB * dr_nxy_ab +
-        DR_IXY_AC * dr_nxy_ac +
-        R_IZ * r_nz +
-        CS * cs_offset +
-        DW_AB * dw_ab +
-        DW_AC * dw_ac +
-        w1 * W1X +
-        KAB * kab +
-        KBA * kba +
-        KBC * kbc +
-        KCB * kcb +
-        KAC * kac +
-        KCA * kca
+    liouvillian = assemble_liouvillian(
+        r_nxy, dr_nxy_ab, dr_nxy_ac, r_nz, cs_offset, dw_ab, dw_ac, w1, kab,
+        kba, kbc, kcb, kac, kca
     )
 
     return liouvillian
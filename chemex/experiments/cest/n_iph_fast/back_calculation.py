@@ -122,7 +122,7 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, carrier=0.0, pp
             vr = vr[sc.ix_(sl3, sl2)].real
             magz_eq = sc.asarray([[1 - pb], [pb]])
 
-            magz_a = dot(dot(dot(vr, t), vri), magz_eq)[0, 0]
+            magz_a = dot(vr, dot(t, dot(vri, magz_eq)))[0, 0]
 
         return magz_a
 
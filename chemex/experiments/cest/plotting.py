@@ -85,6 +85,7 @@ def compute_profiles(data_grouped, par, par_names, par_fixed):
         )
 
         data_pt = profile[0]
+        b1_offset_exp, mag_cal_exp = data_pt.par['b1_offset'], data_pt.cal
 
         for b1_offset in sp.linspace(b1_offset_min, b1_offset_max, 500):
             ppm_to_rads = data_pt.par['ppm_to_rads']
@@ -96,6 +97,9 @@ def compute_profiles(data_grouped, par, par_names, par_fixed):
 
             profile_cal.append([b1_ppm, data_pt.cal])
 
+        data_pt.update_b1_offset(b1_offset_exp)
+        data_pt.cal = mag_cal_exp
+
         b1_ppm_fit, mag_fit = zip(*sorted(profile_cal))
 
         profiles.setdefault((index, resonance_id), []).append(
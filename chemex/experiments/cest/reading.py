@@ -7,6 +7,7 @@ import scipy.signal as si
 import scipy.interpolate as ip
 
 from chemex import utils
+from chemex.experiments.dataset import Dataset
 
 
 def read_data(cfg, working_dir, global_parameters, res_incl=None,
@@ -20,6 +21,9 @@ def read_data(cfg, working_dir, global_parameters, res_incl=None,
 
     data_points = list()
 
+    # The points of the experiment are stored by columns
+    dataset = Dataset('b1_offset')
+
     experiment_name = name_experiment(global_parameters)
 
     for resonance_id, filename in cfg.items('data'):
@@ -40,13 +44,14 @@ def read_data(cfg, working_dir, global_parameters, res_incl=None,
 
         # Get the r2 values from the fuda files containing intensities
         abs_path_filename = os.path.join(exp_data_dir, filename)
-        data_points += read_a_cest_profile(abs_path_filename, parameters)
+        data_points += read_a_cest_profile(abs_path_filename, parameters,
+                                           dataset)
 
     # Adjust the minimal uncertainty
-    # data_points = adjust_min_int_uncertainty(data_points)
+    # adjust_min_int_uncertainty(dataset)
 
     # Normalize intensities
-    data_points = norm_int(data_points)
+    norm_int(dataset)
 
     return data_points
 
@@ -77,7 +82,7 @@ def name_experiment(global_parameters=None):
     return name
 
 
-def read_a_cest_profile(filename, parameters):
+def read_a_cest_profile(filename, parameters, dataset=None):
     """Reads in the fuda file and spit out the intensities"""
 
     data = sc.loadtxt(filename, dtype=[('b1_offset', '<f8'),
@@ -92,6 +97,9 @@ def read_a_cest_profile(filename, parameters):
     data_point = __import__(exp_type + '.data_point', globals(), locals(),
                             ['DataPoint'], -1)
 
+    if dataset is None:
+        dataset = Dataset('b1_offset')
+
     intensity_ref = 1.0
 
     for b1_offset, intensity_val, intensity_err in data:
@@ -101,18 +109,33 @@ def read_a_cest_profile(filename, parameters):
     parameters['intensity_ref'] = intensity_ref
     parameters['profile_id'] = filename
 
-    for b1_offset, intensity_val, intensity_err in data:
-        parameters['b1_offset'] = b1_offset
+    b1_offsets = data['b1_offset']
 
-        # Used to keep reference points out of the bootstrapping
-        parameters['reference'] = abs(b1_offset) >= 10000.0
+    # Used to keep reference points out of the bootstrapping
+    references = abs(b1_offsets) >= 10000.0
 
+    pars = dataset.add_profile(parameters, b1_offsets, references)
+
+    for par, intensity_val in zip(pars, data['intensity']):
         intensity_err = uncertainty
 
         data_points.append(
-            data_point.DataPoint(intensity_val, intensity_err, parameters)
+            data_point.DataPoint(intensity_val, intensity_err, par)
         )
 
+    dataset.share_names(data_points)
+
+    # All the points of the profile are back-calculated in one go
+    b1_offsets = [data_pt.par['b1_offset'] for data_pt in data_points]
+
+    calc_observables = set(data_pt.calc_observable for data_pt in data_points)
+    calc_observables.update(getattr(data_pt, 'calc_observable_ref', None)
+                            for data_pt in data_points)
+
+    for calc_observable in calc_observables:
+        if hasattr(calc_observable, 'add_values'):
+            calc_observable.add_values(b1_offsets)
+
     return data_points
 
 
@@ -125,35 +148,26 @@ def estimate_uncertainty(data):
     return estimate_noise(int_list)
 
 
-def adjust_min_int_uncertainty(data_int):
+def adjust_min_int_uncertainty(dataset):
     """Adjusts the uncertainty of data points to the maximum of
     either the present uncertainty or the median of all the uncertainties
     """
 
-    int_err = sc.median([data_point.err for data_point in data_int])
-
-    new_data_int = list()
-
-    for data_point in data_int:
-        data_point.err = int_err
-        new_data_int.append(data_point)
+    dataset['err'] = sc.median(dataset['err'])
 
-    return new_data_int
+    return dataset
 
 
-def norm_int(data_int):
+def norm_int(dataset):
     """Normalize intensities relative to the intensity of the reference
     plane"""
 
-    new_data_int = list()
+    intensity_refs = dataset.get_profile_values('intensity_ref')
 
-    for data_point in data_int:
-        data_point.val /= data_point.par['intensity_ref']
-        data_point.err /= data_point.par['intensity_ref']
-        data_point.err = abs(data_point.err)
-        new_data_int.append(data_point)
+    dataset['val'] /= intensity_refs
+    dataset['err'] = abs(dataset['err'] / intensity_refs)
 
-    return new_data_int
+    return dataset
 
 
 def estimate_noise(x):
@@ -8,9 +8,12 @@ Created on Sep 1, 2011
 from scipy import (zeros,
                    asarray)
 
-from chemex.bases.two_states.iph import (R_IXY, DR_IXY, R_IZ,
-                                         CS, DW, KAB, KBA, W1X,
-                                         W1Y)
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states.iph import W1X, W1Y, BASIS, TERMS
+
+
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'DR_IXY', 'R_IZ', 'CS', 'DW', 'KAB', 'KBA'))
 
 
 def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0,
@@ -53,13 +56,7 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0,
     kab = kex * pb
     kba = kex - kab
 
-    l_free = R_IXY * r_cxy
-    l_free += DR_IXY * dr_cxy
-    l_free += R_IZ * r_cz
-    l_free += CS * cs_offset
-    l_free += DW * dw
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = assemble_free(r_cxy, dr_cxy, r_cz, cs_offset, dw, kab, kba)
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
 
@@ -106,8 +103,8 @@ def get_cz(mag):
 
     """
 
-    magz_a = mag[2, 0]
-    magz_b = mag[5, 0]
+    magz_a = mag[..., 2, 0]
+    magz_b = mag[..., 5, 0]
 
     return magz_a, magz_b
 
@@ -6,9 +6,13 @@ Created on July 21, 2015
 
 from scipy import zeros, asarray, pi
 
-from chemex.bases.two_states.iph_aph import \
-    R_IXY, R_2SZIXY, DR_XY, R_IZ, R_2SZIZ, CS, DW, \
-    J, ETAXY, ETAZ, KAB, KBA, W1X, W1Y
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states.iph_aph import W1X, W1Y, BASIS, TERMS
+
+
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'R_2SZIXY', 'DR_XY', 'R_IZ', 'R_2SZIZ', 'CS', 'DW', 'J', 'ETAXY',
+    'ETAZ', 'KAB', 'KBA'))
 
 
 def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_hxy=5.0, dr_hxy=0.0,
@@ -64,18 +68,10 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_hxy=5.0, dr_hxy=0.0,
     r_hz = r_2hzcz - r_cz
     r_2hxycz = r_hxy - r_cz
 
-    l_free = R_IXY * r_hxy
-    l_free += R_2SZIXY * r_2hxycz
-    l_free += DR_XY * dr_hxy
-    l_free += R_IZ * r_hz
-    l_free += R_2SZIZ * r_2hzcz
-    l_free += CS * cs_offset
-    l_free += DW * dw
-    l_free += J * pi * j_hc
-    l_free += ETAXY * etaxy
-    l_free += ETAZ * etaz
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = assemble_free(
+        r_hxy, r_2hxycz, dr_hxy, r_hz, r_2hzcz, cs_offset, dw, pi * j_hc,
+        etaxy, etaz, kab, kba
+    )
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
 
@@ -91,7 +87,7 @@ def compute_2hycz_eq(pb):
 
 
 def get_hx(mag):
-    magz_a = mag[0, 0]
-    magz_b = mag[6, 0]
+    magz_a = mag[..., 0, 0]
+    magz_b = mag[..., 6, 0]
 
     return magz_a, magz_b
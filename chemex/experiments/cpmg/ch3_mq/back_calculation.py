@@ -5,11 +5,15 @@ Created on Feb 23, 2012
 @author: Guillaume Bouvignies
 """
 
-from scipy import dot, diag
+from numpy import matmul
+from scipy import dot, asarray, zeros
 from scipy.linalg import expm
-from numpy.linalg import matrix_power
 
+from chemex.bases.two_states.mq_complex import P180_CX, P180_CY, P180_HX
 from chemex.caching import lru_cache
+from chemex.experiments.cpmg.profile import (apply_propagators,
+                                             calc_cp_propagators,
+                                             make_calc_observable_from_profile)
 from chemex.constants import xi_ratio
 from .liouvillian import \
     compute_2hxcy_eq, \
@@ -19,13 +23,16 @@ from .liouvillian import \
 
 RATIO = xi_ratio['C']
 
-# Constants
-# Calculate the pulses
-# Assuming all 180 degree pulses are perfect in the mq_ch3_8 basis set
-P180_HX = diag([+1.0, +1.0, -1.0, -1.0, +1.0, +1.0, -1.0, -1.0], 0)
-P180_HY = diag([-1.0, -1.0, +1.0, +1.0, -1.0, -1.0, +1.0, +1.0], 0)
-P180_CX = diag([+1.0, -1.0, +1.0, -1.0, +1.0, -1.0, +1.0, -1.0], 0)
-P180_CY = diag([-1.0, +1.0, -1.0, +1.0, -1.0, +1.0, -1.0, +1.0], 0)
+
+
+def apply_p180_hx(mag):
+    """
+    Applies the 1H 180 degree x pulse, assumed perfect, to the magnetization.
+    The pulse is antilinear in the complex basis of the double- and
+    zero-quantum coherences (see chemex.bases.two_states.mq_complex).
+    """
+
+    return matmul(P180_HX, mag.conj())
 
 
 @lru_cache()
@@ -56,11 +63,10 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
         make_propagators = lru_cache(1)(compute_liouvillian)
 
-        @lru_cache(100)
-        def _calc_observable(pb=0.0, kex=0.0, dwh=0.0, dwc=0.0, r_2hxycxy=5.0, dr_2hxycxy=0.0, ncyc=0):
+        def _calc_profile(ncycs, pb=0.0, kex=0.0, dwh=0.0, dwc=0.0, r_2hxycxy=5.0, dr_2hxycxy=0.0):
             """
-            Calculate the intensity in presence of exchange during a cpmg-type pulse
-            train. Based on the sequence "hmqc_CH3_exchange_bigprotein_600_lek_v2.c".
+            Calculate the intensities in presence of exchange during a cpmg-type
+            pulse train, for all the ncyc values of a profile. Based on the sequence "hmqc_CH3_exchange_bigprotein_600_lek_v2.c".
             Parameter names from the sequence are:
 
             chemex      procpar
@@ -70,8 +76,8 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
             Parameters
             ----------
-            i0 : float
-                Initial intensity
+            ncycs : tuple of int
+                Number of cycles of the points of the profile.
             pb : float
                 Fractional population of state b
             kex : float
@@ -89,8 +95,8 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
             Returns
             -------
-            out : float
-                Intensity after the CPMG block
+            out : ndarray
+                Intensities (for i0 = 1) after the CPMG block
 
             """
 
@@ -103,16 +109,19 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
             mag_eq = compute_2hxcy_eq(pb)
 
-            if ncyc == 0:
-                mag = mag_eq
+            ncycs = asarray(ncycs)
+            cpmg = ncycs > 0
+
+            mag = zeros((len(ncycs),) + mag_eq.shape, dtype=complex)
+
+            if not cpmg.all():
+                mag[~cpmg] = mag_eq
 
-            else:
+            if cpmg.any():
 
-                t_cp = time_t2 / (4.0 * ncyc)
-                p_free = expm(l_free * t_cp)
-                p_cpy = matrix_power(p_free.dot(P180_CY).dot(p_free), ncyc)
+                p_cpy, = calc_cp_propagators(l_free, (P180_CY,), ncycs[cpmg], time_t2)
 
-                mag = reduce(dot, [p_cpy, P180_HX, p_cpy, mag_eq])
+                mag[cpmg] = matmul(p_cpy, apply_p180_hx(matmul(p_cpy, mag_eq)))
 
             magz_a, _ = get_2hxcy(mag)
 
@@ -131,11 +140,10 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
             return l_free, p_zeta
 
-        @lru_cache(100)
-        def _calc_observable(pb=0.0, kex=0.0, dwh=0.0, dwc=0.0, r_2hxycxy=5.0, dr_2hxycxy=0.0, ncyc=0):
+        def _calc_profile(ncycs, pb=0.0, kex=0.0, dwh=0.0, dwc=0.0, r_2hxycxy=5.0, dr_2hxycxy=0.0):
             """
-            Calculate the intensity in presence of exchange during a cpmg-type pulse
-            train. Based on the sequence "hmqc_CH3_exchange_bigprotein_600_lek_v2.c".
+            Calculate the intensities in presence of exchange during a cpmg-type
+            pulse train, for all the ncyc values of a profile. Based on the sequence "hmqc_CH3_exchange_bigprotein_600_lek_v2.c".
             Parameter names from the sequence are:
 
             chemex      procpar
@@ -145,8 +153,8 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
             Parameters
             ----------
-            i0 : float
-                Initial intensity
+            ncycs : tuple of int
+                Number of cycles of the points of the profile.
             pb : float
                 Fractional population of state b
             kex : float
@@ -164,8 +172,8 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
             Returns
             -------
-            out : float
-                Intensity after the CPMG block
+            out : ndarray
+                Intensities (for i0 = 1) after the CPMG block
 
             """
 
@@ -178,39 +186,26 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
             mag_eq = compute_2hxcy_eq(pb)
 
-            if ncyc == 0:
+            ncycs = asarray(ncycs)
+            cpmg = ncycs > 0
 
-                mag = reduce(dot, [p_zeta, P180_HX, P180_CX, p_zeta, mag_eq])
+            mag = zeros((len(ncycs),) + mag_eq.shape, dtype=complex)
 
-            else:
+            mag_zeta = dot(p_zeta, apply_p180_hx(apply_propagators([P180_CX, p_zeta, mag_eq])))
 
-                t_cp = time_t2 / (4.0 * ncyc)
-                p_free = expm(l_free * t_cp)
-                p_cpy = matrix_power(p_free.dot(P180_CY).dot(p_free), ncyc)
+            if not cpmg.all():
 
-                mag = reduce(dot, [p_cpy, P180_HX, p_cpy, p_zeta, P180_HX, P180_CX, p_zeta, mag_eq])
+                mag[~cpmg] = mag_zeta
 
-            magz_a, _ = get_2hxcy(mag)
-
-            return -magz_a
+            if cpmg.any():
 
+                p_cpy, = calc_cp_propagators(l_free, (P180_CY,), ncycs[cpmg], time_t2)
 
-    def calc_observable(i0=0.0, **kwargs):
-        """
-        Calculate the intensity in presence of exchange after a CEST block.
+                mag[cpmg] = matmul(p_cpy, apply_p180_hx(matmul(p_cpy, mag_zeta)))
 
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
-
-        Returns
-        -------
-        out : float
-            Intensity after the CEST block
+            magz_a, _ = get_2hxcy(mag)
 
-        """
+            return -magz_a
 
-        return i0 * _calc_observable(**kwargs)
 
-    return calc_observable
+    return make_calc_observable_from_profile(_calc_profile)
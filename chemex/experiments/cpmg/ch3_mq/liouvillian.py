@@ -5,9 +5,14 @@ Created on Feb 22, 2012
 @author: Guillaume Bouvignies
 """
 
-from scipy import mat, zeros
+from scipy import zeros
 
-from chemex.bases.two_states.mq import R_2HXYCXY, DR_2HXYCXY, DWI, DWS, KAB, KBA
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states.mq_complex import BASIS, TERMS
+
+
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_2HXYCXY', 'DR_2HXYCXY', 'DWI', 'DWS', 'KAB', 'KBA'))
 
 
 def compute_liouvillian(pb=0.0, kex=0.0, dwc=0.0, dwh=0.0, r_2hxycxy=10.0, dr_2hxycxy=0.0):
@@ -15,8 +20,10 @@ def compute_liouvillian(pb=0.0, kex=0.0, dwc=0.0, dwh=0.0, r_2hxycxy=10.0, dr_2h
     Compute the exchange matrix (Liouvillian).
 
     The function assumes a 2-site (A <-> B) exchanging system.
-    The matrix is written in 8x8 basis, that is:
-        {2HxCx, 2HxCy, 2HyCx, 2HyCy}{A,B}
+    The matrix is written in the 4x4 complex basis of the double- and
+    zero-quantum coherences, that is:
+        {2H+C+, 2H+C-}{A,B}
+    (see chemex.bases.two_states.mq_complex)
 
     Parameters
     ----------
@@ -45,26 +52,24 @@ def compute_liouvillian(pb=0.0, kex=0.0, dwc=0.0, dwh=0.0, r_2hxycxy=10.0, dr_2h
     kab = kex * pb
     kba = kex * (1.0 - pb)
 
-    l_free = R_2HXYCXY * r_2hxycxy
-    l_free += DR_2HXYCXY * dr_2hxycxy
-    l_free += DWI * dwh
-    l_free += DWS * dwc
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = assemble_free(r_2hxycxy, dr_2hxycxy, dwh, dwc, kab, kba)
 
     return l_free
 
 
 def compute_2hxcy_eq(pb):
-    mag_eq = mat(zeros((8, 1)))
-    mag_eq[1, 0] += 1.0 - pb
-    mag_eq[5, 0] += pb
+    # 2HxCy = (DQ - ZQ) / 2i
+    mag_eq = zeros((4, 1), dtype=complex)
+    mag_eq[0, 0] += 1j * (1.0 - pb)
+    mag_eq[1, 0] -= 1j * (1.0 - pb)
+    mag_eq[2, 0] += 1j * pb
+    mag_eq[3, 0] -= 1j * pb
 
     return mag_eq
 
 
 def get_2hxcy(mag):
-    mag_a = mag[1, 0]
-    mag_b = mag[5, 0]
+    mag_a = 0.5 * (mag[..., 0, 0] - mag[..., 1, 0]).imag
+    mag_b = 0.5 * (mag[..., 2, 0] - mag[..., 3, 0]).imag
 
     return mag_a, mag_b
@@ -6,12 +6,15 @@ Created on Feb 12, 2014
 """
 
 # Python Modules
-from scipy import pi, dot
+from scipy import pi, asarray, zeros
 from scipy.linalg import expm
 from numpy.linalg import matrix_power
 
 # Local Modules
 from chemex.caching import lru_cache
+from chemex.experiments.cpmg.profile import (apply_propagators,
+                                             calc_cp_propagators,
+                                             make_calc_observable_from_profile)
 from .liouvillian import \
     compute_2hzcz_eq, \
     compute_liouvillians, \
@@ -78,16 +81,16 @@ def make_calc_observable(pw=0.0, time_t2=0.0, ppm_to_rads=1.0, carrier=0.0, _id=
 
         return l_free, ps
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_hxy=5.0, dr_hxy=0.0, r_cz=1.5,
-                         r_2hzcz=0.0, etaxy=0.0, etaz=0.0, j_hc=0.0, cs=0.0, ncyc=0):
+    def _calc_profile(ncycs, pb=0.0, kex=0.0, dw=0.0, r_hxy=5.0, dr_hxy=0.0, r_cz=1.5,
+                      r_2hzcz=0.0, etaxy=0.0, etaz=0.0, j_hc=0.0, cs=0.0):
         """
-        Calculate the intensity in presence of exchange during a cpmg-type pulse train.
+        Calculate the intensities in presence of exchange during a cpmg-type pulse train,
+        for all the ncyc values of a profile.
 
         Parameters
         ----------
-        i0 : float
-            Initial intensity.
+        ncycs : tuple of int
+            Number of cycles of the points of the profile.
         pb : float
             Fractional population of state B,
             0.0 for 0%, 1.0 for 100%
@@ -108,8 +111,8 @@ def make_calc_observable(pw=0.0, time_t2=0.0, ppm_to_rads=1.0, carrier=0.0, _id=
 
         Returns
         -------
-        out : float
-            Intensity after the CPMG block
+        out : ndarray
+            Intensities (for i0 = 1) after the CPMG block
 
         """
 
@@ -134,41 +137,27 @@ def make_calc_observable(pw=0.0, time_t2=0.0, ppm_to_rads=1.0, carrier=0.0, _id=
 
         mag_eq = compute_2hzcz_eq(pb)
 
-        if ncyc == 0:
+        ncycs = asarray(ncycs)
+        cpmg = ncycs > 0
+
+        mag = zeros((len(ncycs),) + mag_eq.shape)
+
+        if not cpmg.all():
 
             # The +/- phase cycling of the first 90 and the receiver is taken care
             # by setting the thermal equilibrium to 0
-            mag = reduce(dot, [p_90px, p_180pmx, p_90px, mag_eq])
+            mag[~cpmg] = apply_propagators([p_90px, p_180pmx, p_90px, mag_eq])
 
-        else:
+        if cpmg.any():
 
-            t_cp = time_t2 / (4.0 * ncyc) - pw
-            p_free = expm(l_free * t_cp)
-            p_cpy = matrix_power(p_free.dot(p_180py).dot(p_free), ncyc)
+            p_cpy, = calc_cp_propagators(l_free, (p_180py,), ncycs[cpmg],
+                                         time_t2, pw)
 
-            mag = reduce(dot, [p_90px, p_neg, p_cpy, p_180pmx, p_cpy, p_neg, p_90px, mag_eq])
+            mag[cpmg] = apply_propagators([p_90px, p_neg, p_cpy, p_180pmx, p_cpy, p_neg, p_90px, mag_eq])
 
         magz_a, _magz_b = get_2hzcz(mag)
 
         return magz_a
 
-    def calc_observable(i0=0.0, **kwargs):
-        """
-        Calculate the intensity in presence of exchange after the CPMG pulse train.
-
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
-
-        Returns
-        -------
-        out : float
-            Intensity after the CPMG block
-
-        """
-
-        return i0 * _calc_observable(**kwargs)
-
-    return calc_observable
+    return make_calc_observable_from_profile(_calc_profile)
 
@@ -4,11 +4,14 @@ Created on Nov 12, 2014
 @author: Mike Latham
 """
 
-from scipy import pi, dot, diag
+from scipy import pi, dot, diag, asarray, zeros
 from scipy.linalg import expm2 as expm
 from numpy.linalg import matrix_power
 
 from chemex.caching import lru_cache
+from chemex.experiments.cpmg.profile import (apply_propagators,
+                                             calc_cp_propagators,
+                                             make_calc_observable_from_profile)
 from .liouvillian import compute_2coznz_eq, compute_liouvillians, get_2coznz
 
 
@@ -66,12 +69,12 @@ def make_calc_observable(pwco90=0.0, time_t2=0.0, time_equil=0.0, taucc=0.0, ppm
 
         return l_free, ps
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_coxy=5.0, dr_coxy=0.0, r_nz=1.5,
-                         r_2coznz=0.0, etaxy=0.0, etaz=0.0, j_nco=0.0, dj_nco=0.0,
-                         cs=0.0, ncyc=0):
+    def _calc_profile(ncycs, pb=0.0, kex=0.0, dw=0.0, r_coxy=5.0, dr_coxy=0.0, r_nz=1.5,
+                      r_2coznz=0.0, etaxy=0.0, etaz=0.0, j_nco=0.0, dj_nco=0.0,
+                      cs=0.0):
         """
-        Calculate the intensity in presence of exchange during a cpmg-type pulse train.
+        Calculate the intensities in presence of exchange during a cpmg-type pulse train,
+        for all the ncyc values of a profile.
                
         13CO : (2COzNz)-time_eq-COy-(2COxNz)-{ tcp-(2COx)-tcp }*ncyc-2COy-{ tcp-(2COx)-tcp }*ncyc-(2COxNz)-COy-(
         2COzNz)-time_eq
@@ -79,8 +82,8 @@ def make_calc_observable(pwco90=0.0, time_t2=0.0, time_equil=0.0, taucc=0.0, ppm
 
         Parameters
         ----------
-        i0 : float
-            Initial intensity.
+        ncycs : tuple of int
+            Number of cycles of the points of the profile.
         pb : float
             Fractional population of state B,
             0.0 for 0%, 1.0 for 100%
@@ -98,8 +101,8 @@ def make_calc_observable(pwco90=0.0, time_t2=0.0, time_equil=0.0, taucc=0.0, ppm
             Offset from the carrier in rad/s.
         Returns
         -------
-        out : float
-            Intensity after the CPMG block
+        out : ndarray
+            Intensities (for i0 = 1) after the CPMG block
 
         """
 
@@ -120,45 +123,30 @@ def make_calc_observable(pwco90=0.0, time_t2=0.0, time_equil=0.0, taucc=0.0, ppm
             p_flip = reduce(dot, [p_90my, p_taucc, 0.5*(p_180py + p_180my),
                                   p_taucc, p_90py])
 
-        if ncyc == 0:
+        ncycs = asarray(ncycs)
+        cpmg = ncycs > 0
+
+        mag = zeros((len(ncycs),) + mag_eq.shape)
+
+        if not cpmg.all():
 
             # The +/- phase cycling of the first 90 and the receiver is taken care
             # by setting the thermal equilibrium to 0
             #I = reduce(dot, [p_equil, p_90py, 0.5 * (p_180py + p_180my), p_90py, p_equil, mag_eq])
-            mag = reduce(dot,
-                         [p_equil, p_90py, p_flip, p_90py, p_equil, mag_eq])
+            mag[~cpmg] = apply_propagators([p_equil, p_90py, p_flip, p_90py,
+                                            p_equil, mag_eq])
 
-        else:
+        if cpmg.any():
 
-            t_cp = time_t2 / (4.0 * ncyc)
-            p_free = expm(l_free * t_cp)
-            p_cpx = matrix_power(p_free.dot(p_180px).dot(p_free), ncyc)
+            p_cpx, = calc_cp_propagators(l_free, (p_180px,), ncycs[cpmg], time_t2)
 
-            mag = reduce(dot, [p_equil, p_90py, p_neg, p_cpx, p_neg,
-                             p_flip, p_neg, p_cpx, p_neg, p_90py,
-                             p_equil, mag_eq])
+            mag[cpmg] = apply_propagators([p_equil, p_90py, p_neg, p_cpx,
+                                           p_neg, p_flip, p_neg, p_cpx, p_neg,
+                                           p_90py, p_equil, mag_eq])
 
         magz_a, _magz_b = get_2coznz(mag)
 
         return magz_a
 
-    def calc_observable(i0=0.0, **kwargs):
-        """
-        Calculate the intensity in presence of exchange after a CPMG block.
-
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
-
-        Returns
-        -------
-        out : float
-            Intensity after the CPMG block
-
-        """
-
-        return i0 * _calc_observable(**kwargs)
-
-    return calc_observable
+    return make_calc_observable_from_profile(_calc_profile)
 
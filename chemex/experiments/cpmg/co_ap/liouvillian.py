@@ -6,8 +6,13 @@ Created on Nov 12, 2014
 
 from scipy import zeros, asarray, pi
 
-from chemex.bases.two_states.iph_aph import (R_IXY, R_2SZIXY, DR_XY, R_IZ, R_2SZIZ, CS, DW, J, DJ, ETAXY, ETAZ, KAB,
-                                             KBA, W1X, W1Y)
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states.iph_aph import W1X, W1Y, BASIS, TERMS
+
+
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'R_2SZIXY', 'DR_XY', 'R_IZ', 'R_2SZIZ', 'CS', 'DW', 'J', 'DJ',
+    'ETAXY', 'ETAZ', 'KAB', 'KBA'))
 
 
 def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_coxy=5.0, dr_coxy=0.0, r_nz=1.5, r_2coznz=5.0, etaxy=0.0, etaz=0.0,
@@ -64,20 +69,9 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_coxy=5.0, dr_coxy=0.0, r_nz=
     r_2coxynz = r_coxy - r_nz
     r_coz = r_2coznz - r_nz
 
-    l_free = (
-        R_IXY * r_coxy +
-        R_2SZIXY * r_2coxynz +
-        DR_XY * dr_coxy +
-        R_IZ * r_coz +
-        R_2SZIZ * r_2coznz +
-        CS * cs_offset +
-        DW * dw +
-        J * pi * j_nco +
-        DJ * pi * dj_nco +
-        ETAXY * etaxy +
-        ETAZ * etaz +
-        KAB * kab +
-        KBA * kba
+    l_free = assemble_free(
+        r_coxy, r_2coxynz, dr_coxy, r_coz, r_2coznz, cs_offset, dw, pi * j_nco,
+        pi * dj_nco, etaxy, etaz, kab, kba
     )
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
@@ -94,8 +88,8 @@ def compute_2coznz_eq(pb):
 
 
 def get_2coznz(mag):
-    magz_a = mag[5, 0]
-    magz_b = mag[11, 0]
+    magz_a = mag[..., 5, 0]
+    magz_b = mag[..., 11, 0]
 
     return magz_a, magz_b
 
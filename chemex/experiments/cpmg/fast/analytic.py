@@ -0,0 +1,144 @@
+"""
+Closed-form back-calculation of the 'fast' CPMG profiles.
+
+With perfect refocusing pulses, the transverse magnetization of a spin
+exchanging between two states is described in the complex basis {I+}{a,b}
+(see chemex.bases.two_states.fast_complex) by a 2x2 Liouvillian, and one CPMG
+cycle [t_cp-180-2t_cp-180-t_cp] by a 2x2 propagator q (see
+chemex.experiments.cpmg.profile.calc_cp_propagators_conj). This is the
+Carver-Richards problem, which has an exact solution (Baldwin, J. Magn. Reson.
+244, 114, 2014): functions of 2x2 matrices follow from their eigenvalues,
+
+    f(m) = f(l2) * I + (f(l1) - f(l2)) / (l1 - l2) * (m - l2 * I)
+
+so that both exp(l_free * t_cp) and q^ncyc are obtained with array arithmetic,
+for all the ncyc values of a profile (and all the profiles, when given arrays
+of parameters) at once and without any matrix exponential or matrix power. The divided differences are written in terms of
+expm1(x) / x to stay accurate for (nearly) degenerate eigenvalues.
+"""
+
+import numpy as np
+
+
+def calc_magy_a(ncycs, time_t2, pb=0.0, kex=0.0, dw=0.0, r_ixy=5.0,
+                dr_ixy=0.0):
+    """
+    Calculates the magnetization of state A along y after CPMG trains with
+    ncyc cycles (all > 0), starting from the equilibrium magnetization along
+    y.
+
+    Parameters
+    ----------
+    ncycs : array_like of int
+        Number of cycles (all > 0).
+    time_t2 : float
+        Time of the CPMG block.
+    pb : float
+        Fractional population of state B.
+    kex : float
+        Exchange rate between state A and B in /s.
+    dw : float
+        Chemical shift difference between states A and B in rad/s.
+    r_ixy : float
+        Transverse relaxation rate of state a in /s.
+    dr_ixy : float
+        Transverse relaxation rate difference between states a and b in /s.
+
+    The parameters can also be arrays (one value per profile).
+
+    Returns
+    -------
+    out : ndarray, shape (..., len(ncycs))
+        Magnetization of state A along y (for i0 = 1).
+
+    """
+
+    ncycs = np.asarray(ncycs)
+    t_cps = time_t2 / (4.0 * ncycs)
+
+    # The parameters get an extra dimension for the ncyc values
+    pb, kex, dw, r_ixy, dr_ixy = [
+        np.asarray(par)[..., np.newaxis]
+        for par in np.broadcast_arrays(pb, kex, dw, r_ixy, dr_ixy)
+    ]
+
+    kab = kex * pb
+    kba = kex - kab
+
+    l_free = np.stack([np.stack([-r_ixy - kab, kba], axis=-1),
+                       np.stack([kab, -r_ixy - dr_ixy - kba + 1j * dw],
+                                axis=-1)], axis=-2)
+
+    p_free = _expm2(l_free, t_cps[..., np.newaxis, np.newaxis])
+
+    # The 180 degree y pulse maps c to -c* (see fast_complex.P_180Y)
+    p_element = -np.matmul(p_free, p_free.conj())
+    p_cycle = np.matmul(p_element, p_element.conj())
+
+    mag = _power2(p_cycle, ncycs[..., np.newaxis, np.newaxis])
+
+    # Equilibrium magnetization along y: 1j * [1 - pb, pb]
+    mag_a = 1j * ((1.0 - pb) * mag[..., 0, 0] + pb * mag[..., 0, 1])
+
+    return mag_a.imag
+
+
+def _expm2(matrix, times):
+    """Exponentials exp(matrix * times) of a 2x2 matrix."""
+
+    values_1, values_2 = _eigvals2(matrix)
+
+    # values_2 has the largest real part, so that nothing overflows
+    exp_2 = np.exp(values_2 * times)
+    slope = exp_2 * times * _phi((values_1 - values_2) * times)
+
+    return _sylvester2(matrix, values_2, exp_2, slope)
+
+
+def _power2(matrices, powers):
+    """Integer powers of a stack of 2x2 matrices."""
+
+    values_1, values_2 = _eigvals2(matrices)
+
+    # values_2 has the largest modulus, so that nothing overflows
+    swap = abs(values_1) > abs(values_2)
+    values_1, values_2 = (np.where(swap, values_2, values_1),
+                          np.where(swap, values_1, values_2))
+
+    delta = np.log(values_1 / values_2)
+    log_2 = np.log(values_2)
+    slope = (powers * np.exp((powers - 1) * log_2) *
+             _phi(powers * delta) / _phi(delta))
+
+    return _sylvester2(matrices, values_2, np.exp(powers * log_2), slope)
+
+
+def _eigvals2(matrices):
+    """
+    Eigenvalues of a stack of 2x2 matrices, the second one with the largest
+    real part.
+    """
+
+    mean = 0.5 * (matrices[..., 0, 0] + matrices[..., 1, 1])
+    half_diff = 0.5 * (matrices[..., 0, 0] - matrices[..., 1, 1])
+    root = np.sqrt(half_diff ** 2 + matrices[..., 0, 1] * matrices[..., 1, 0])
+
+    return ((mean - root)[..., np.newaxis, np.newaxis],
+            (mean + root)[..., np.newaxis, np.newaxis])
+
+
+def _sylvester2(matrices, values_2, f_2, slope):
+    """f(m) = f(l2) * I + f[l1, l2] * (m - l2 * I) for 2x2 matrices."""
+
+    identity = np.eye(2)
+
+    return f_2 * identity + slope * (matrices - values_2 * identity)
+
+
+def _phi(values):
+    """expm1(x) / x, equal to 1 at x = 0."""
+
+    values = np.asarray(values)
+    zero = values == 0.0
+
+    return np.where(zero, 1.0, np.expm1(values) / np.where(zero, 1.0, values))
@@ -1,13 +1,33 @@
-from numpy.linalg import matrix_power
-from scipy.linalg import expm
+from numpy import matmul, newaxis
+from scipy import asarray, shape, zeros
 
+from ....bases.derivatives import (augment_liouvillian, augment_matrix,
+                                   augment_vector, split_vector)
+from ....bases.two_states import fast_complex
 from ....bases.two_states.fast import P_180Y
 from ....caching import lru_cache
-from .liouvillian import compute_iy_eq, compute_liouvillians, get_iy
+from ..profile import (add_derivatives, calc_cp_propagators,
+                       calc_cp_propagators_conj,
+                       make_calc_observable_from_profile)
+from .analytic import calc_magy_a
+from .liouvillian import (compute_iy_eq, compute_iy_eq_complex,
+                          compute_iy_eq_derivative, compute_liouvillians,
+                          compute_liouvillians_complex,
+                          compute_liouvillian_derivatives, get_iy,
+                          get_iy_complex)
+
+# Parameters the intensity can be differentiated with respect to (besides i0),
+# in the order given by compute_liouvillian_derivatives
+PAR_NAMES = ('pb', 'kex', 'dw', 'r_ixy', 'dr_ixy')
+
+# Engines calculating the profiles: propagation of the magnetization with
+# matrix exponentials and powers, or closed form (see .analytic)
+ENGINES = ('numeric', 'analytic')
 
 
 @lru_cache()
-def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
+def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, engine='numeric',
+                         _id=None):
     """
     Factory to make "calc_observable" function to calculate the intensity in
     presence of exchange after a CPMG block.
@@ -18,6 +38,8 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
         Time of the CPMG block
     ncyc : integer
         Number of cycles, [t-180-2t-180-t]*n
+    engine : {'numeric', 'analytic'}
+        Calculation of the profiles (see ENGINES).
     id : tuple
         Some type of identification for caching optimization
 
@@ -28,17 +50,15 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
 
     """
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_ixy=5.0, dr_ixy=0.0,
-                         ncyc=0):
+    def _calc_profile(ncycs, pb=0.0, kex=0.0, dw=0.0, r_ixy=5.0, dr_ixy=0.0):
         """
-        Calculate the intensity in presence of exchange during a cpmg-type pulse
-        train.
+        Calculate the intensities in presence of exchange during a cpmg-type
+        pulse train, for all the ncyc values of a profile.
 
         Parameters
         ----------
-        i0 : float
-            Initial intensity.
+        ncycs : tuple of int
+            Number of cycles of the points of the profile.
         pb : float
             Fractional population of state B,
             0.0 for 0%, 1.0 for 100%
@@ -51,24 +71,34 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
         dr_ixy : float
             Transverse relaxation rate difference between states a and b in /s.
 
+        The parameters can also be arrays, one value per profile.
+
         Returns
         -------
-        out : float
-            Intensity after the CPMG block
+        out : ndarray, shape (..., len(ncycs))
+            Intensities (for i0 = 1) after the CPMG block
 
         """
 
-        dw *= ppm_to_rads
+        dw = dw * ppm_to_rads
+
+        # The profiles are calculated in the complex reduced basis, with
+        # 2x2 instead of 4x4 Liouvillians
+        mag_eq = compute_iy_eq_complex(pb)[..., newaxis, :, :]
+
+        ncycs = asarray(ncycs)
+        cpmg = ncycs > 0
 
-        mag_eq = compute_iy_eq(pb)
+        mag = zeros(shape(pb) + (len(ncycs),) + mag_eq.shape[-2:],
+                    dtype=complex)
 
-        if ncyc == 0:
+        if not cpmg.all():
 
-            mag = mag_eq
+            mag[..., ~cpmg, :, :] = mag_eq
 
-        else:
+        if cpmg.any():
 
-            l_free = compute_liouvillians(
+            l_free = compute_liouvillians_complex(
                 pb=pb,
                 kex=kex,
                 dw=dw,
@@ -76,36 +106,119 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
                 dr_ixy=dr_ixy
             )
 
-            t_cp = time_t2 / (4.0 * ncyc)
-            p_free = expm(l_free * t_cp)
+            p_cp, = calc_cp_propagators_conj(
+                l_free,
+                (fast_complex.P_180Y,),
+                ncycs[cpmg],
+                time_t2
+            )
 
-            mag = matrix_power(
-                p_free
-                .dot(P_180Y)
-                .dot(p_free),
-                2 * ncyc
-            ).dot(mag_eq)
+            mag[..., cpmg, :, :] = matmul(p_cp, mag_eq)
 
-        magy_a, _ = get_iy(mag)
+        magy_a, _ = get_iy_complex(mag)
 
         return magy_a
 
-    def calc_observable(i0=0.0, **kwargs):
+    def _calc_profile_analytic(ncycs, pb=0.0, kex=0.0, dw=0.0, r_ixy=5.0,
+                               dr_ixy=0.0):
+        """
+        Same as _calc_profile, using the closed-form solution of the
+        Carver-Richards problem (see chemex.experiments.cpmg.fast.analytic).
         """
-        Calculate the intensity in presence of exchange after a CPMG block.
 
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
+        dw = dw * ppm_to_rads
+
+        ncycs = asarray(ncycs)
+        cpmg = ncycs > 0
+
+        magy_a = zeros(shape(pb) + (len(ncycs),))
+        magy_a[..., ~cpmg] = (1.0 - asarray(pb))[..., newaxis]
+
+        if cpmg.any():
+
+            magy_a[..., cpmg] = calc_magy_a(
+                ncycs[cpmg],
+                time_t2,
+                pb=pb,
+                kex=kex,
+                dw=dw,
+                r_ixy=r_ixy,
+                dr_ixy=dr_ixy
+            )
+
+        return magy_a
+
+    def _calc_profile_derivatives(ncycs, names, pb=0.0, kex=0.0, dw=0.0,
+                                  r_ixy=5.0, dr_ixy=0.0):
+        """
+        Same as _calc_profile, along with the derivatives of the intensities
+        with respect to the parameters in 'names', propagated through the pulse
+        sequence with augmented Liouvillians (see chemex.bases.derivatives).
+        The calculation is done in the real basis {Ix, Iy}{a,b}.
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : ndarray, ndarray
+            Intensities (for i0 = 1) after the CPMG block, shape (len(ncycs),),
+            and their derivatives, shape (len(names), len(ncycs)).
 
         """
 
-        return i0 * _calc_observable(**kwargs)
+        par_nb = len(names)
+
+        dw *= ppm_to_rads
+
+        d_l_frees = dict(zip(PAR_NAMES,
+                             compute_liouvillian_derivatives(pb=pb, kex=kex)))
+
+        # dw is in ppm
+        d_l_frees['dw'] = d_l_frees['dw'] * ppm_to_rads
+
+        d_mags_eq = dict((name, zeros((4, 1))) for name in PAR_NAMES)
+        d_mags_eq['pb'] = compute_iy_eq_derivative()
+
+        mag_eq = augment_vector(compute_iy_eq(pb),
+                                [d_mags_eq[name] for name in names])
+
+        ncycs = asarray(ncycs)
+        cpmg = ncycs > 0
+
+        mag = zeros((len(ncycs),) + mag_eq.shape)
+
+        if not cpmg.all():
+
+            mag[~cpmg] = mag_eq
+
+        if cpmg.any():
+
+            l_free = augment_liouvillian(
+                compute_liouvillians(pb=pb, kex=kex, dw=dw, r_ixy=r_ixy,
+                                     dr_ixy=dr_ixy),
+                [d_l_frees[name] for name in names]
+            )
+
+            p_cp, = calc_cp_propagators(l_free,
+                                        (augment_matrix(P_180Y, par_nb),),
+                                        ncycs[cpmg], time_t2, repeat=2,
+                                        par_nb=par_nb)
+
+            mag[cpmg] = matmul(p_cp, mag_eq)
+
+        magy_a = asarray([get_iy(a_mag)[0]
+                          for a_mag in split_vector(mag, par_nb)])
+
+        return magy_a[0], magy_a[1:]
+
+    # Profiles of other residues with the same settings can be calculated
+    # together (see chemex.experiments.profile.make_calc_vals)
+    batch_key = (__name__, time_t2, ppm_to_rads, engine)
+
+    # The closed form is cheaper to difference numerically than the
+    # augmented Liouvillians are to propagate: no analytic derivatives then
+    if engine == 'analytic':
+        return make_calc_observable_from_profile(_calc_profile_analytic,
+                                                 batch_key=batch_key)
 
-    return calc_observable
+    return add_derivatives(
+        make_calc_observable_from_profile(_calc_profile, batch_key=batch_key),
+        _calc_profile_derivatives, PAR_NAMES)
@@ -12,7 +12,7 @@ from chemex.constants import xi_ratio
 from chemex.experiments.base_data_point import BaseDataPoint
 from chemex.parsing import parse_assignment
 from ..plotting import plot_data
-from .back_calculation import make_calc_observable
+from .back_calculation import ENGINES, make_calc_observable
 
 
 PAR_DICT = {
@@ -23,7 +23,8 @@ PAR_DICT = {
         (int, ('ncyc',))
     ),
     # Some stuff to get a nice help output
-    'exp': ('resonance_id', 'h_larmor_frq', 'temperature', 'time_t2', 'ncyc',),
+    'exp': ('resonance_id', 'h_larmor_frq', 'temperature', 'time_t2', 'ncyc',
+            'engine',),
     'fit': ('pb', 'kex', 'dw', 'i0', 'r_ixy',),
     'fix': ('dr_ixy',),
 }
@@ -32,6 +33,8 @@ PAR_DICT = {
 class DataPoint(BaseDataPoint):
     """Intensity measured during a cpmg pulse train of frequency frq"""
 
+    __slots__ = ()
+
     def __init__(self, val, err, par):
 
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
@@ -59,6 +62,16 @@ class DataPoint(BaseDataPoint):
 
         self.par['_id'] = ((temperature, nucleus_name, h_larmor_frq),)
 
+        self.par['engine'] = self.par.get('engine', 'numeric').strip().lower()
+
+        if self.par['engine'] not in ENGINES:
+            exit(
+                "Unknown engine \"{}\" for peak \"{}\" in experiment \"{}\" "
+                "(choose from {})"
+                .format(self.par['engine'], resonance_id, experiment_name,
+                        ', '.join(ENGINES))
+            )
+
         args = (self.par[arg] for arg in
                 getargspec(make_calc_observable.__wrapped__).args)
         self.calc_observable = make_calc_observable(*args)
@@ -5,7 +5,11 @@ Analyzes 15N chemical exchange in the presence of a CPMG block. Refocusing
 pulses are assumed to be perfect, spin evolution is therefore calculated using
 the 4x4, single spin matrix:
 
-[ Nx(a), Ny(a), Nx(b), Ny(b) ]"""
+[ Nx(a), Ny(a), Nx(b), Ny(b) ]
+
+Set 'engine = analytic' in the experiment file to calculate the profiles with
+the closed-form solution of the Carver-Richards problem instead (same results,
+much faster)."""
 
 reference = {
     'journal': '',
@@ -4,9 +4,20 @@ Created on Sep 1, 2011
 @author: guillaume
 """
 
-from scipy import zeros
+from scipy import shape, zeros
 
-from chemex.bases.two_states.fast import R_IXY, DR_IXY, DW, KAB, KBA
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states import fast_complex
+from chemex.bases.two_states.fast import (R_IXY, DR_IXY, DW, KAB, KBA, BASIS,
+                                          TERMS)
+
+
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'DR_IXY', 'DW', 'KAB', 'KBA'))
+
+assemble_free_complex = make_assembler(
+    fast_complex.BASIS, fast_complex.TERMS,
+    ('R_IXY', 'DR_IXY', 'DW', 'KAB', 'KBA'))
 
 
 def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0,
@@ -49,15 +60,60 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0,
     kab = kex * pb
     kba = kex - kab
 
-    l_free = R_IXY * r_ixy
-    l_free += DR_IXY * dr_ixy
-    l_free += DW * dw
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = assemble_free(r_ixy, dr_ixy, dw, kab, kba)
+
+    return l_free
+
+
+def compute_liouvillians_complex(pb=0.0, kex=0.0, dw=0.0, r_ixy=5.0,
+                                 dr_ixy=0.0):
+    """
+    Same as compute_liouvillians, in the complex reduced basis {I+}{a,b} (see
+    chemex.bases.two_states.fast_complex).
+
+    Returns
+    -------
+    out: numpy.ndarray
+        Liouvillian (2x2, complex) describing free precession of one
+        isolated spin in presence of two-site exchange.
+
+    """
+
+    kab = kex * pb
+    kba = kex - kab
+
+    l_free = assemble_free_complex(r_ixy, dr_ixy, dw, kab, kba)
 
     return l_free
 
 
+def compute_liouvillian_derivatives(pb=0.0, kex=0.0):
+    """
+    Compute the derivatives of the Liouvillian returned by
+    compute_liouvillians with respect to pb, kex, dw, r_ixy and dr_ixy.
+
+    Parameters
+    ----------
+    pb : float
+        Fractional population of state B.
+        0.0 for 0%, 1.0 for 100%.
+    kex : float
+        Exchange rate between state A and B in /s.
+
+    Returns
+    -------
+    out: tuple
+        Derivatives of the Liouvillian, in the order pb, kex, dw, r_ixy and
+        dr_ixy.
+
+    """
+
+    d_l_pb = (KAB - KBA) * kex
+    d_l_kex = KAB * pb + KBA * (1.0 - pb)
+
+    return d_l_pb, d_l_kex, DW, R_IXY, DR_IXY
+
+
 def compute_iy_eq(pb):
     """
     Returns the equilibrium magnetization vector.
@@ -82,6 +138,37 @@ def compute_iy_eq(pb):
     return mag_eq
 
 
+def compute_iy_eq_complex(pb):
+    """
+    Same as compute_iy_eq, in the complex reduced basis {I+}{a,b}.
+    """
+
+    mag_eq = zeros(shape(pb) + (2, 1), dtype=complex)
+    mag_eq[..., 0, 0] += 1j * (1.0 - pb)
+    mag_eq[..., 1, 0] += 1j * pb
+
+    return mag_eq
+
+
+def compute_iy_eq_derivative():
+    """
+    Returns the derivative of the equilibrium magnetization vector with
+    respect to pb.
+
+    Returns
+    -------
+    out: numpy.matrix
+        Derivative of the magnetization vector at equilibrium.
+
+    """
+
+    d_mag_eq = zeros((4, 1))
+    d_mag_eq[1, 0] -= 1.0
+    d_mag_eq[3, 0] += 1.0
+
+    return d_mag_eq
+
+
 def get_iy(mag):
     """
     Returns the amount of magnetization along z.
@@ -98,8 +185,18 @@ def get_iy(mag):
 
     """
 
-    magy_a = mag[1, 0]
-    magy_b = mag[3, 0]
+    magy_a = mag[..., 1, 0]
+    magy_b = mag[..., 3, 0]
 
     return magy_a, magy_b
 
+
+def get_iy_complex(mag):
+    """
+    Same as get_iy, in the complex reduced basis {I+}{a,b}.
+    """
+
+    magy_a = mag[..., 0, 0].imag
+    magy_b = mag[..., 1, 0].imag
+
+    return magy_a, magy_b
@@ -4,13 +4,21 @@ Created on Aug 15, 2011
 @author: guillaume
 """
 
-from numpy.linalg import matrix_power
-from scipy.linalg import expm
+from numpy import matmul
+from scipy import asarray, zeros
 
+from chemex.bases.reduction import (get_detection_vector, get_reduced_indexes,
+                                    reduce_matrices, reduce_vectors,
+                                    expand_vectors)
 from chemex.bases.three_states.fast import P_180Y
 from chemex.caching import lru_cache
+from chemex.experiments.cpmg.profile import (calc_cp_propagators,
+                                             make_calc_observable_from_profile)
 from .liouvillian import compute_iy_eq, compute_liouvillians, get_iy
 
+SIZE = P_180Y.shape[0]
+DETECTED = get_detection_vector(get_iy, SIZE)
+
 
 @lru_cache()
 def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
@@ -34,18 +42,17 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
 
     """
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
-                         dw_ab=0.0, dw_ac=0.0, r_ixy=5.0, dr_ixy_ab=0.0,
-                         dr_ixy_ac=0.0, ncyc=0):
+    def _calc_profile(ncycs, pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0,
+                      kex_ac=0.0, dw_ab=0.0, dw_ac=0.0, r_ixy=5.0,
+                      dr_ixy_ab=0.0, dr_ixy_ac=0.0):
         """
-        Calculate the intensity in presence of exchange during a cpmg-type pulse
-        train.
+        Calculate the intensities in presence of exchange during a cpmg-type
+        pulse train, for all the ncyc values of a profile.
 
         Parameters
         ----------
-        i0 : float
-            Initial intensity.
+        ncycs : tuple of int
+            Number of cycles of the points of the profile.
         pb : float
             Fractional population of state B,
             0.0 for 0%, 1.0 for 100%
@@ -73,8 +80,8 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
 
         Returns
         -------
-        out : float
-            Intensity after the CPMG block
+        out : ndarray
+            Intensities (for i0 = 1) after the CPMG block
 
         """
 
@@ -83,11 +90,16 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
 
         mag_eq = compute_iy_eq(pb, pc)
 
-        if ncyc == 0:
+        ncycs = asarray(ncycs)
+        cpmg = ncycs > 0
+
+        mag = zeros((len(ncycs),) + mag_eq.shape)
 
-            mag = mag_eq
+        if not cpmg.all():
 
-        else:
+            mag[~cpmg] = mag_eq
+
+        if cpmg.any():
 
             l_free = compute_liouvillians(
                 pb=pb,
@@ -102,36 +114,26 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
                 dr_ixy_ac=dr_ixy_ac
             )
 
-            t_cp = time_t2 / (4.0 * ncyc)
-            p_free = expm(l_free * t_cp)
+            # Drops the part of the basis that does not contribute to the
+            # signal, e.g. state C when pc = 0 (see chemex.bases.reduction)
+            indexes = get_reduced_indexes((mag_eq,), (l_free, P_180Y),
+                                          DETECTED)
+            l_free, p_180y = reduce_matrices(indexes, l_free, P_180Y)
+            mag_eq_reduced, = reduce_vectors(indexes, mag_eq)
+
+            p_cp, = calc_cp_propagators(
+                l_free,
+                (p_180y,),
+                ncycs[cpmg],
+                time_t2,
+                repeat=2
+            )
 
-            mag = matrix_power(
-                p_free
-                .dot(P_180Y)
-                .dot(p_free),
-                2 * ncyc
-            ).dot(mag_eq)
+            mag[cpmg] = expand_vectors(indexes, matmul(p_cp, mag_eq_reduced),
+                                       SIZE)
 
         magy_a, _, _ = get_iy(mag)
 
         return magy_a
 
-    def calc_observable(i0=0.0, **kwargs):
-        """
-        Calculate the intensity in presence of exchange after a CEST block.
-
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
-
-        Returns
-        -------
-        out : float
-            Intensity after the CPMG block
-
-        """
-
-        return i0 * _calc_observable(**kwargs)
-
-    return calc_observable
+    return make_calc_observable_from_profile(_calc_profile)
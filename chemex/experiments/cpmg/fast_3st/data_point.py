@@ -31,6 +31,8 @@ PAR_DICT = {
 class DataPoint(BaseDataPoint):
     """Intensity measured during a cpmg pulse train of frequency frq"""
 
+    __slots__ = ()
+
     def __init__(self, val, err, par):
 
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
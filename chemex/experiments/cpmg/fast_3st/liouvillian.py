@@ -6,7 +6,13 @@ Created on Sep 1, 2011
 
 from scipy import zeros
 
-from chemex.bases.three_states.fast import R_IXY, DR_IXY_AB, DR_IXY_AC, DW_AB, DW_AC, KAB, KBA, KBC, KCB, KAC, KCA
+from chemex.bases.assembly import make_assembler
+from chemex.bases.three_states.fast import BASIS, TERMS
+
+
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'DR_IXY_AB', 'DR_IXY_AC', 'DW_AB', 'DW_AC', 'KAB', 'KBA', 'KBC',
+    'KCB', 'KAC', 'KCA'))
 
 
 def compute_liouvillians(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0, dw_ab=0.0, dw_ac=0.0,
@@ -66,17 +72,10 @@ def compute_liouvillians(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0, dw_
     kac = kex_ac * pc / (pa + pc)
     kca = kex_ac * pa / (pa + pc)
 
-    l_free = R_IXY * r_ixy
-    l_free += DR_IXY_AB * dr_ixy_ab
-    l_free += DR_IXY_AC * dr_ixy_ac
-    l_free += DW_AB * dw_ab
-    l_free += DW_AC * dw_ac
-    l_free += KAB * kab
-    l_free += KBA * kba
-    l_free += KBC * kbc
-    l_free += KCB * kcb
-    l_free += KAC * kac
-    l_free += KCA * kca
+    l_free = assemble_free(
+        r_ixy, dr_ixy_ab, dr_ixy_ac, dw_ab, dw_ac, kab, kba, kbc, kcb, kac,
+        kca
+    )
 
     return l_free
 
@@ -125,9 +124,9 @@ def get_iy(mag):
 
     """
 
-    magy_a = mag[1, 0]
-    magy_b = mag[3, 0]
-    magy_c = mag[5, 0]
+    magy_a = mag[..., 1, 0]
+    magy_b = mag[..., 3, 0]
+    magy_c = mag[..., 5, 0]
 
     return magy_a, magy_b, magy_c
 
@@ -4,15 +4,23 @@ Created on June 26, 2014
 @author: Mike Latham
 """
 
-from scipy import pi, dot
+from scipy import pi, asarray, zeros
 from scipy.linalg import expm
 from numpy.linalg import matrix_power
 
+from ....bases.reduction import (get_detection_vector, get_reduced_indexes,
+                                 reduce_matrices, reduce_vectors,
+                                 expand_vectors)
 from ....caching import lru_cache
+from ..profile import (apply_propagators, calc_cp_propagators,
+                       make_calc_observable_from_profile)
 from .liouvillian import (compute_2hznz_eq,
                           compute_liouvillians,
                           get_2hznz, )
 
+SIZE = compute_2hznz_eq(0.0).shape[0]
+DETECTED = get_detection_vector(get_2hznz, SIZE)
+
 
 @lru_cache()
 def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
@@ -62,6 +70,15 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
             w1=w1
         )
 
+        mag_eq = compute_2hznz_eq(pb)
+
+        # Drops the part of the basis that does not contribute to the signal
+        # (see chemex.bases.reduction)
+        indexes = get_reduced_indexes((mag_eq,), (l_free, l_w1x, l_w1y),
+                                      DETECTED)
+        l_free, l_w1x, l_w1y = reduce_matrices(indexes, l_free, l_w1x, l_w1y)
+        mag_eq, = reduce_vectors(indexes, mag_eq)
+
         p_equil = expm(l_free * time_equil)
         p_neg = expm(l_free * -2.0 * pw / pi)
         p_90px = expm((l_free + l_w1x) * pw)
@@ -75,22 +92,22 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
         ps = (p_equil, p_neg, p_90px, p_90py, p_90mx, p_90my, p_180px, p_180mx,
               p_180py)
 
-        return l_free, ps
+        return l_free, mag_eq, indexes, ps
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_hxy=5.0, dr_hxy=0.0,
-                         r_nz=1.5, r_2hznz=0.0, etaxy=0.0, etaz=0.0, j_hn=0.0,
-                         dj_hn=0.0, cs=0.0, ncyc=0):
+    def _calc_profile(ncycs, pb=0.0, kex=0.0, dw=0.0, r_hxy=5.0, dr_hxy=0.0,
+                      r_nz=1.5, r_2hznz=0.0, etaxy=0.0, etaz=0.0, j_hn=0.0,
+                      dj_hn=0.0, cs=0.0):
         """
-        Calculate the intensity in presence of exchange during a cpmg-type pulse train.
+        Calculate the intensities in presence of exchange during a cpmg-type pulse train,
+        for all the ncyc values of a profile.
                
         1H : (2HzNz)-time_eq-Hx-(2HyNz)-{ tcp-2Hy-tcp }*ncyc-2Hx-{ tcp-2Hy-tcp }*ncyc-(2HyNz)-Hx-(2HzNz) 
         15N:    
 
         Parameters
         ----------
-        i0 : float
-            Initial intensity.
+        ncycs : tuple of int
+            Number of cycles of the points of the profile.
         pb : float
             Fractional population of state B,
             0.0 for 0%, 1.0 for 100%
@@ -108,15 +125,15 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
             Offset from the carrier in rad/s.
         Returns
         -------
-        out : float
-            Intensity after the CPMG block
+        out : ndarray
+            Intensities (for i0 = 1) after the CPMG block
 
         """
 
         dw *= ppm_to_rads
         cs_offset = (cs - carrier) * ppm_to_rads
 
-        l_free, ps = make_propagators(
+        l_free, mag_eq, indexes, ps = make_propagators(
             pb=pb,
             kex=kex,
             dw=dw,
@@ -134,14 +151,16 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
         (p_equil, p_neg, p_90px, p_90py, p_90mx, p_90my, p_180px, p_180mx,
          p_180py) = ps
 
-        mag_eq = compute_2hznz_eq(pb)
+        ncycs = asarray(ncycs)
+        cpmg = ncycs > 0
 
-        if ncyc == 0:
+        mag = zeros((len(ncycs),) + mag_eq.shape)
+
+        if not cpmg.all():
 
             # The +/- phase cycling of the first 90 and the receiver is taken
             # care by setting the thermal equilibrium to 0
-            mag = reduce(
-                dot,
+            mag[~cpmg] = apply_propagators(
                 [
                     p_equil,
                     p_90px,
@@ -151,17 +170,17 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
                 ]
             )
 
-        else:
+        if cpmg.any():
 
-            t_cp = time_t2 / (4.0 * ncyc) - pw
-            p_free = expm(l_free * t_cp)
-            p_cpy = matrix_power(
-                p_free
-                .dot(p_180py)
-                .dot(p_free), ncyc)
+            p_cpy, = calc_cp_propagators(
+                l_free,
+                (p_180py,),
+                ncycs[cpmg],
+                time_t2,
+                pw
+            )
 
-            mag = reduce(
-                dot,
+            mag[cpmg] = apply_propagators(
                 [
                     p_equil,
                     p_90px,
@@ -177,27 +196,9 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
                 ]
             )
 
-        magz_a, _magz_b = get_2hznz(mag)
+        magz_a, _magz_b = get_2hznz(expand_vectors(indexes, mag, SIZE))
 
         return magz_a
 
-    def calc_observable(i0=0.0, **kwargs):
-        """
-        Calculate the intensity in presence of exchange after a CPMG block.
-
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
-
-        Returns
-        -------
-        out : float
-            Intensity after the CPMG block
-
-        """
-
-        return i0 * _calc_observable(**kwargs)
-
-    return calc_observable
+    return make_calc_observable_from_profile(_calc_profile)
 
@@ -10,10 +10,13 @@ from scipy import (zeros,
                    asarray,
                    pi)
 
-from chemex.bases.two_states.iph_aph import (R_IXY, R_2SZIXY, DR_XY,
-                                             R_IZ, R_2SZIZ, CS, DW,
-                                             J, DJ, ETAXY, ETAZ,
-                                             KAB, KBA, W1X, W1Y)
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states.iph_aph import W1X, W1Y, BASIS, TERMS
+
+
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'R_2SZIXY', 'DR_XY', 'R_IZ', 'R_2SZIZ', 'CS', 'DW', 'J', 'DJ',
+    'ETAXY', 'ETAZ', 'KAB', 'KBA'))
 
 # Functions
 
@@ -72,19 +75,10 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_hxy=5.0, dr_hxy=0.0,
     r_2hxynz = r_hxy - r_nz
     r_hz = r_2hznz - r_nz
 
-    l_free = R_IXY * r_hxy
-    l_free += R_2SZIXY * r_2hxynz
-    l_free += DR_XY * dr_hxy
-    l_free += R_IZ * r_hz
-    l_free += R_2SZIZ * r_2hznz
-    l_free += CS * cs_offset
-    l_free += DW * dw
-    l_free += J * pi * j_hn
-    l_free += DJ * pi * dj_hn
-    l_free += ETAXY * etaxy
-    l_free += ETAZ * etaz
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = assemble_free(
+        r_hxy, r_2hxynz, dr_hxy, r_hz, r_2hznz, cs_offset, dw, pi * j_hn,
+        pi * dj_hn, etaxy, etaz, kab, kba
+    )
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
 
@@ -100,8 +94,8 @@ def compute_2hznz_eq(pb):
 
 
 def get_2hznz(mag):
-    magz_a = mag[5, 0]
-    magz_b = mag[11, 0]
+    magz_a = mag[..., 5, 0]
+    magz_b = mag[..., 11, 0]
 
     return magz_a, magz_b
 
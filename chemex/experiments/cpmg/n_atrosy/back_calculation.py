@@ -5,12 +5,15 @@ Created on Aug 15, 2011
 """
 
 # Python Modules
-from scipy import pi, dot
+from scipy import pi, dot, asarray, zeros
 from scipy.linalg import expm
 from numpy.linalg import matrix_power
 
 # Local Modules
 from chemex.caching import lru_cache
+from chemex.experiments.cpmg.profile import (apply_propagators,
+                                             calc_cp_propagators,
+                                             make_calc_observable_from_profile)
 from .liouvillian import (compute_2hznz_eq,
                           compute_liouvillians,
                           get_atrz)
@@ -72,20 +75,20 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, c
 
         return l_free, ps
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0, r_nz=1.5,
-                         r_2hznz=0.0, etaxy=0.0, etaz=0.0, j_hn=0.0, dj_hn=0.0,
-                         cs=0.0, ncyc=0):
+    def _calc_profile(ncycs, pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0, r_nz=1.5,
+                      r_2hznz=0.0, etaxy=0.0, etaz=0.0, j_hn=0.0, dj_hn=0.0,
+                      cs=0.0):
         """
-        Calculate the intensity in presence of exchange during a cpmg-type pulse train.
+        Calculate the intensities in presence of exchange during a cpmg-type pulse train,
+        for all the ncyc values of a profile.
                 _______________________________________________________________________
         1H :   |  /   /   /   /   /   /   /   /   CW   /   /   /   /   /   /   /   /   |
         15N:    Nx { tauc  2Ny  tauc }*ncyc 2Nx { tauc  2Ny  tauc }*ncyc -Nx time_equil
 
         Parameters
         ----------
-        i0 : float
-            Initial intensity.
+        ncycs : tuple of int
+            Number of cycles of the points of the profile.
         pb : float
             Fractional population of state B,
             0.0 for 0%, 1.0 for 100%
@@ -103,8 +106,8 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, c
             Offset from the carrier in rad/s.
         Returns
         -------
-        out : float
-            Intensity after the CPMG block
+        out : ndarray
+            Intensities (for i0 = 1) after the CPMG block
 
         """
 
@@ -120,45 +123,29 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, c
 
         mag_eq = compute_2hznz_eq(pb)
 
-        if ncyc == 0:
+        ncycs = asarray(ncycs)
+        cpmg = ncycs > 0
+
+        mag = zeros((len(ncycs),) + mag_eq.shape)
+
+        if not cpmg.all():
 
             # The +/- phase cycling of the first 90 and the receiver is taken care
             # by setting the thermal equilibrium to 0
-            mag = -reduce(dot, [p_equil, p_90py, p_element, p_90px, mag_eq])
+            mag[~cpmg] = -apply_propagators([p_equil, p_90py, p_element, p_90px, mag_eq])
 
-        else:
+        if cpmg.any():
 
-            t_cp = time_t2 / (4.0 * ncyc) - pw
-            p_free = expm(l_free * t_cp)
-            p_cpx = matrix_power(p_free.dot(p_180px).dot(p_free), ncyc)
-            p_cpy = matrix_power(p_free.dot(p_180py).dot(p_free), ncyc)
+            p_cpx, p_cpy = calc_cp_propagators(l_free, (p_180px, p_180py), ncycs[cpmg],
+                                               time_t2, pw)
             p_element_pc = 0.5 * (p_90px.dot(p_element).dot(p_90py) +
                                   p_90mx.dot(p_element).dot(p_90my))
 
-            mag = -reduce(dot,
-                          [p_equil, p_90py, p_neg, p_cpx, p_neg, p_element_pc, p_neg, p_cpy, p_neg, p_90px, mag_eq])
+            mag[cpmg] = -apply_propagators([p_equil, p_90py, p_neg, p_cpx, p_neg, p_element_pc, p_neg, p_cpy, p_neg, p_90px, mag_eq])
 
         magz_a, _magz_b = get_atrz(mag)
 
         return magz_a
 
-    def calc_observable(i0=0.0, **kwargs):
-        """
-        Calculate the intensity in presence of exchange after a CEST block.
-
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
-
-        Returns
-        -------
-        out : float
-            Intensity after the CEST block
-
-        """
-
-        return i0 * _calc_observable(**kwargs)
-
-    return calc_observable
+    return make_calc_observable_from_profile(_calc_profile)
 
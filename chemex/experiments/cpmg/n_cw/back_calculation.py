@@ -5,16 +5,29 @@ Created on Aug 15, 2011
 """
 
 # Python Modules
-from scipy import pi, dot
+from scipy import pi, asarray, zeros
 from scipy.linalg import expm
-from numpy.linalg import matrix_power
+from numpy import matmul, ndim, newaxis
 
 # Local Modules
+from chemex.bases.derivatives import (augment_liouvillian, augment_matrix,
+                                      augment_vector, expm_augmented,
+                                      split_vector)
+from chemex.bases.expm import expm_batch
 from chemex.caching import lru_cache
+from chemex.experiments.cpmg.profile import (add_derivatives,
+                                             apply_propagators,
+                                             calc_cp_propagators,
+                                             make_calc_observable_from_profile)
 from .liouvillian import (compute_nz_eq,
+                          compute_nz_eq_derivatives,
                           compute_liouvillians,
+                          compute_liouvillian_derivatives,
                           get_nz)
 
+# Parameters the intensity can be differentiated with respect to (besides i0)
+PAR_NAMES = ('pb', 'kex', 'dw', 'r_nxy', 'dr_nxy', 'r_nz', 'cs')
+
 
 @lru_cache()
 def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, carrier=0.0, _id=None):
@@ -40,7 +53,26 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, c
 
     """
 
-    @lru_cache(1)
+    def calc_propagators(l_free, l_w1x, l_w1y, par_nb=0):
+
+        if par_nb:
+            def exponentiate(liouvillian):
+                return expm_augmented(liouvillian, par_nb)
+        elif ndim(l_free) > 2:
+            exponentiate = expm_batch
+        else:
+            exponentiate = expm
+
+        p_equil = exponentiate(l_free * time_equil)
+        p_neg = exponentiate(l_free * -2.0 * pw / pi)
+        p_90px = exponentiate((l_free + l_w1x) * pw)
+        p_90py = exponentiate((l_free + l_w1y) * pw)
+        p_90mx = exponentiate((l_free - l_w1x) * pw)
+        p_180pmx = 0.5 * (matmul(p_90px, p_90px) + matmul(p_90mx, p_90mx))
+        p_180py = matmul(p_90py, p_90py)
+
+        return p_equil, p_neg, p_90px, p_90mx, p_180pmx, p_180py
+
     def make_propagators(pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0, r_nz=1.5, cs_offset=0.0):
 
         w1 = 2.0 * pi / (4.0 * pw)
@@ -48,31 +80,51 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, c
                                                     r_nxy=r_nxy, dr_nxy=dr_nxy,
                                                     r_nz=r_nz, cs_offset=cs_offset, w1=w1)
 
-        p_equil = expm(l_free * time_equil)
-        p_neg = expm(l_free * -2.0 * pw / pi)
-        p_90px = expm((l_free + l_w1x) * pw)
-        p_90py = expm((l_free + l_w1y) * pw)
-        p_90mx = expm((l_free - l_w1x) * pw)
-        p_180pmx = 0.5 * (matrix_power(p_90px, 2) +
-                          matrix_power(p_90mx, 2))
-        p_180py = matrix_power(p_90py, 2)
+        return l_free, calc_propagators(l_free, l_w1x, l_w1y)
 
-        ps = (p_equil, p_neg, p_90px, p_90mx, p_180pmx, p_180py)
+    make_propagators_cached = lru_cache(1)(make_propagators)
 
-        return l_free, ps
+    def calc_mag(ncycs, l_free, ps, mag_eq, par_nb=0):
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0, r_nz=1.5, cs=0.0, ncyc=0):
+        # The propagators and vectors get a dimension for the ncyc values
+        p_equil, p_neg, p_90px, p_90mx, p_180pmx, p_180py = ps
+        p_equil, p_neg, p_90px, p_180pmx, mag_eq = [
+            array[..., newaxis, :, :]
+            for array in (p_equil, p_neg, p_90px, p_180pmx, mag_eq)
+        ]
+
+        ncycs = asarray(ncycs)
+        cpmg = ncycs > 0
+
+        mag = zeros(mag_eq.shape[:-3] + (len(ncycs),) + mag_eq.shape[-2:])
+
+        if not cpmg.all():
+            # The +/- phase cycling of the first 90 and the receiver is taken care
+            # by setting the thermal equilibrium to 0
+            mag[..., ~cpmg, :, :] = apply_propagators([p_equil, p_90px, p_180pmx, p_90px, mag_eq])
+
+        if cpmg.any():
+
+            p_cp, = calc_cp_propagators(l_free, (p_180py,), ncycs[cpmg], time_t2, pw,
+                                        par_nb=par_nb)
+
+            mag[..., cpmg, :, :] = apply_propagators([p_equil, p_90px, p_neg, p_cp, p_180pmx, p_cp, p_neg, p_90px,
+                                                      mag_eq])
+
+        return mag
+
+    def _calc_profile(ncycs, pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0, r_nz=1.5, cs=0.0):
         """
-        Calculate the intensity in presence of exchange during a cpmg-type pulse train.
+        Calculate the intensities in presence of exchange during a cpmg-type pulse train,
+        for all the ncyc values of a profile.
                 _______________________________________________________________________
         1H :   |  /   /   /   /   /   /   /   /   CW   /   /   /   /   /   /   /   /   |
         15N:    Nx { tauc  2Ny  tauc }*ncyc 2Nx { tauc  2Ny  tauc }*ncyc -Nx time_equil
 
         Parameters
         ----------
-        i0 : float
-            Initial intensity.
+        ncycs : tuple of int
+            Number of cycles of the points of the profile.
         pb : float
             Fractional population of state B,
             0.0 for 0%, 1.0 for 100%
@@ -88,55 +140,79 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, c
             Transverse relaxation rate difference between states a and b in /s.
         cs_offset : float
             Offset from the carrier in rad/s.
+
+        The parameters can also be arrays, one value per profile.
+
         Returns
         -------
-        out : float
-            Intensity after the CPMG block
+        out : ndarray, shape (..., len(ncycs))
+            Intensities (for i0 = 1) after the CPMG block
 
         """
 
-        dw *= ppm_to_rads
+        dw = dw * ppm_to_rads
         cs_offset = (cs - carrier) * ppm_to_rads
 
-        l_free, ps = make_propagators(pb=pb, kex=kex, dw=dw, r_nxy=r_nxy, dr_nxy=dr_nxy, r_nz=r_nz, cs_offset=cs_offset)
-
-        p_equil, p_neg, p_90px, p_90mx, p_180pmx, p_180py = ps
-
-        mag_eq = compute_nz_eq(pb)
+        # The propagators of stacks of profiles are not cached
+        make = make_propagators if ndim(pb) else make_propagators_cached
 
-        if ncyc == 0:
-            # The +/- phase cycling of the first 90 and the receiver is taken care
-            # by setting the thermal equilibrium to 0
-            mag = reduce(dot, [p_equil, p_90px, p_180pmx, p_90px, mag_eq])
-
-        else:
-
-            t_cp = time_t2 / (4.0 * ncyc) - pw
-            p_free = expm(l_free * t_cp)
-            p_cp = matrix_power(p_free.dot(p_180py).dot(p_free), ncyc)
+        l_free, ps = make(pb=pb, kex=kex, dw=dw, r_nxy=r_nxy, dr_nxy=dr_nxy, r_nz=r_nz, cs_offset=cs_offset)
 
-            mag = reduce(dot, [p_equil, p_90px, p_neg, p_cp, p_180pmx, p_cp, p_neg, p_90px, mag_eq])
+        mag = calc_mag(ncycs, l_free, ps, compute_nz_eq(pb))
 
         magz_a, _magz_b = get_nz(mag)
 
         return magz_a
 
-    def calc_observable(i0=0.0, **kwargs):
+    def _calc_profile_derivatives(ncycs, names, pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0,
+                                  r_nz=1.5, cs=0.0):
         """
-        Calculate the intensity in presence of exchange after a CEST block.
-
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
+        Same as _calc_profile, along with the derivatives of the intensities
+        with respect to the parameters in 'names', propagated through the pulse
+        sequence with augmented Liouvillians (see chemex.bases.derivatives).
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : ndarray, ndarray
+            Intensities (for i0 = 1) after the CPMG block, shape (len(ncycs),),
+            and their derivatives, shape (len(names), len(ncycs)).
 
         """
 
-        return i0 * _calc_observable(**kwargs)
+        par_nb = len(names)
+
+        dw *= ppm_to_rads
+        cs_offset = (cs - carrier) * ppm_to_rads
+
+        w1 = 2.0 * pi / (4.0 * pw)
+        l_free, l_w1x, l_w1y = compute_liouvillians(pb=pb, kex=kex, dw=dw,
+                                                    r_nxy=r_nxy, dr_nxy=dr_nxy,
+                                                    r_nz=r_nz, cs_offset=cs_offset, w1=w1)
+
+        d_l_frees = compute_liouvillian_derivatives(
+            ['cs_offset' if name == 'cs' else name for name in names], pb=pb, kex=kex)
+
+        # dw and cs are in ppm
+        for index, name in enumerate(names):
+            if name in ('dw', 'cs'):
+                d_l_frees[index] = d_l_frees[index] * ppm_to_rads
+
+        l_free = augment_liouvillian(l_free, d_l_frees)
+        l_w1x = augment_matrix(l_w1x, par_nb)
+        l_w1y = augment_matrix(l_w1y, par_nb)
+        mag_eq = augment_vector(compute_nz_eq(pb), compute_nz_eq_derivatives(names))
+
+        ps = calc_propagators(l_free, l_w1x, l_w1y, par_nb=par_nb)
+        mag = calc_mag(ncycs, l_free, ps, mag_eq, par_nb=par_nb)
+
+        magz_a = asarray([get_nz(a_mag)[0] for a_mag in split_vector(mag, par_nb)])
+
+        return magz_a[0], magz_a[1:]
+
+    # Profiles of other residues with the same settings can be calculated
+    # together (see chemex.experiments.profile.make_calc_vals)
+    batch_key = (__name__, pw, time_t2, time_equil, ppm_to_rads, carrier)
 
-    return calc_observable
+    return add_derivatives(make_calc_observable_from_profile(_calc_profile,
+                                                             batch_key=batch_key),
+                           _calc_profile_derivatives, PAR_NAMES)
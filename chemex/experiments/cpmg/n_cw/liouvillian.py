@@ -5,10 +5,15 @@ Created on Sep 1, 2011
 """
 
 # Imports
-from scipy import zeros, asarray
+from scipy import zeros, asarray, shape
 
-from chemex.bases.two_states.iph import \
-    R_IXY, DR_IXY, R_IZ, CS, DW, KAB, KBA, W1X, W1Y
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states.iph import (R_IXY, R_IZ, DR_IXY, CS, DW, KAB, KBA,
+                                         W1X, W1Y, BASIS, TERMS)
+
+
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'DR_IXY', 'R_IZ', 'CS', 'DW', 'KAB', 'KBA'))
 
 
 def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0,
@@ -52,19 +57,50 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0,
     kab = kex * pb
     kba = kex - kab
 
-    l_free = R_IXY * r_nxy
-    l_free += DR_IXY * dr_nxy
-    l_free += R_IZ * r_nz
-    l_free += CS * cs_offset
-    l_free += DW * dw
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = assemble_free(r_nxy, dr_nxy, r_nz, cs_offset, dw, kab, kba)
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
 
     return l_free, l_w1x, l_w1y
 
 
+def compute_liouvillian_derivatives(names, pb=0.0, kex=0.0):
+    """
+    Compute the derivatives of the free-precession Liouvillian returned by
+    compute_liouvillians.
+
+    Parameters
+    ----------
+    names : sequence of str
+        Parameters to differentiate the Liouvillian with respect to, among
+        pb, kex, dw, r_nz, r_nxy, dr_nxy and cs_offset (dw and cs_offset in
+        rad/s).
+    pb : float
+        Fractional population of state B.
+        0.0 for 0%, 1.0 for 100%.
+    kex : float
+        Exchange rate between state A and B in /s.
+
+    Returns
+    -------
+    out: list of ndarray
+        Derivatives of the Liouvillian, in the order of 'names'.
+
+    """
+
+    derivatives = {
+        'pb': (KAB - KBA) * kex,
+        'kex': KAB * pb + KBA * (1.0 - pb),
+        'dw': DW,
+        'r_nz': R_IZ,
+        'r_nxy': R_IXY,
+        'dr_nxy': DR_IXY,
+        'cs_offset': CS,
+    }
+
+    return [derivatives[name] for name in names]
+
+
 def compute_nz_eq(pb):
     """
     Returns the equilibrium magnetization vector.
@@ -82,13 +118,31 @@ def compute_nz_eq(pb):
 
     """
 
-    mag_eq = zeros((6, 1))
-    mag_eq[2, 0] += (1.0 - pb)
-    mag_eq[5, 0] += pb
+    mag_eq = zeros(shape(pb) + (6, 1))
+    mag_eq[..., 2, 0] += (1.0 - pb)
+    mag_eq[..., 5, 0] += pb
 
     return mag_eq
 
 
+def compute_nz_eq_derivatives(names):
+    """
+    Returns the derivatives of the equilibrium magnetization vector, in the
+    order of 'names' (only the one with respect to pb is not zero).
+    """
+
+    d_mags_eq = []
+
+    for name in names:
+        d_mag_eq = zeros((6, 1))
+        if name == 'pb':
+            d_mag_eq[2, 0] -= 1.0
+            d_mag_eq[5, 0] += 1.0
+        d_mags_eq.append(d_mag_eq)
+
+    return d_mags_eq
+
+
 def get_nz(mag):
     """
     Returns the amount of magnetization along z.
@@ -105,8 +159,8 @@ def get_nz(mag):
 
     """
 
-    magz_a = mag[2, 0]
-    magz_b = mag[5, 0]
+    magz_a = mag[..., 2, 0]
+    magz_b = mag[..., 5, 0]
 
     return magz_a, magz_b
 
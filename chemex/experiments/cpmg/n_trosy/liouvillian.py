@@ -8,14 +8,20 @@ Created on Aug 26, 2011
 # Imports
 from scipy import (zeros,
                    asarray,
-                   pi, cos, sqrt)
+                   pi, cos, sqrt, shape)
 from scipy.constants import hbar, mu_0
 
 from chemex.constants import gamma
-from chemex.bases.two_states.iph_aph import (R_IXY, R_2SZIXY, DR_XY,
-                                             R_IZ, R_2SZIZ, CS, DW,
-                                             J, DJ, ETAXY, ETAZ,
-                                             KAB, KBA, W1X, W1Y)
+from chemex.bases.assembly import make_assembler
+from chemex.bases.two_states.iph_aph import (R_IXY, R_2SZIXY, DR_XY, R_IZ,
+                                             R_2SZIZ, CS, DW, J, DJ, ETAXY,
+                                             ETAZ, KAB, KBA, W1X, W1Y, BASIS,
+                                             TERMS)
+
+
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'R_2SZIXY', 'DR_XY', 'R_IZ', 'R_2SZIZ', 'CS', 'DW', 'J', 'DJ',
+    'ETAXY', 'ETAZ', 'KAB', 'KBA'))
 
 
 def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0,
@@ -72,36 +78,88 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0,
 
     r_2hznxy = r_nxy + r_2hznz - r_nz
 
-    l_free = R_IXY * r_nxy
-    l_free += R_2SZIXY * r_2hznxy
-    l_free += DR_XY * dr_nxy
-    l_free += R_IZ * r_nz
-    l_free += R_2SZIZ * r_2hznz
-    l_free += CS * cs_offset
-    l_free += DW * dw
-    l_free += J * pi * j_hn
-    l_free += DJ * pi * dj_hn
-    l_free += ETAXY * etaxy
-    l_free += ETAZ * etaz
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = assemble_free(
+        r_nxy, r_2hznxy, dr_nxy, r_nz, r_2hznz, cs_offset, dw, pi * j_hn,
+        pi * dj_hn, etaxy, etaz, kab, kba
+    )
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
 
     return l_free, l_w1x, l_w1y
 
 
+def compute_liouvillian_derivatives(names, pb=0.0, kex=0.0):
+    """
+    Compute the derivatives of the free-precession Liouvillian returned by
+    compute_liouvillians.
+
+    Parameters
+    ----------
+    names : sequence of str
+        Parameters to differentiate the Liouvillian with respect to, among
+        the arguments of compute_liouvillians but w1 (dw and cs_offset in
+        rad/s, j_hn and dj_hn in Hz).
+    pb : float
+        Fractional population of state B.
+        0.0 for 0%, 1.0 for 100%.
+    kex : float
+        Exchange rate between state A and B in /s.
+
+    Returns
+    -------
+    out: list of ndarray
+        Derivatives of the Liouvillian, in the order of 'names'.
+
+    """
+
+    # r_2hznxy = r_nxy + r_2hznz - r_nz
+    derivatives = {
+        'pb': (KAB - KBA) * kex,
+        'kex': KAB * pb + KBA * (1.0 - pb),
+        'dw': DW,
+        'r_nxy': R_IXY + R_2SZIXY,
+        'dr_nxy': DR_XY,
+        'r_nz': R_IZ - R_2SZIXY,
+        'r_2hznz': R_2SZIZ + R_2SZIXY,
+        'etaxy': ETAXY,
+        'etaz': ETAZ,
+        'j_hn': pi * J,
+        'dj_hn': pi * DJ,
+        'cs_offset': CS,
+    }
+
+    return [derivatives[name] for name in names]
+
+
 def compute_2hznz_eq(pb):
-    mag_eq = zeros((12, 1))
-    mag_eq[5, 0] += (1.0 - pb)
-    mag_eq[11, 0] += pb
+    mag_eq = zeros(shape(pb) + (12, 1))
+    mag_eq[..., 5, 0] += (1.0 - pb)
+    mag_eq[..., 11, 0] += pb
 
     return mag_eq
 
 
+def compute_2hznz_eq_derivatives(names):
+    """
+    Returns the derivatives of the equilibrium magnetization vector, in the
+    order of 'names' (only the one with respect to pb is not zero).
+    """
+
+    d_mags_eq = []
+
+    for name in names:
+        d_mag_eq = zeros((12, 1))
+        if name == 'pb':
+            d_mag_eq[5, 0] -= 1.0
+            d_mag_eq[11, 0] += 1.0
+        d_mags_eq.append(d_mag_eq)
+
+    return d_mags_eq
+
+
 def get_trz(mag):
-    magz_a = mag[5, 0] - mag[2, 0]
-    magz_b = mag[11, 0] - mag[8, 0]
+    magz_a = mag[..., 5, 0] - mag[..., 2, 0]
+    magz_b = mag[..., 11, 0] - mag[..., 8, 0]
 
     return magz_a, magz_b
 
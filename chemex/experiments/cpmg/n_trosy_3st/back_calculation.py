@@ -5,15 +5,24 @@ Created on Aug 15, 2011
 """
 
 # Python Modules
-from scipy import pi, dot
+from scipy import pi, dot, asarray, zeros
 from scipy.linalg import expm
 from numpy.linalg import matrix_power
 
 # Local Modules
 from chemex.caching import lru_cache
+from chemex.experiments.cpmg.profile import (apply_propagators,
+                                             calc_cp_propagators,
+                                             make_calc_observable_from_profile)
 from .liouvillian import compute_2hznz_eq, get_trz, compute_liouvillians
+from chemex.bases.reduction import (get_detection_vector, get_reduced_indexes,
+                                    reduce_matrices, reduce_vectors,
+                                    expand_vectors)
 from chemex.bases.three_states.iph_aph import P180_S
 
+SIZE = P180_S.shape[0]
+DETECTED = get_detection_vector(get_trz, SIZE)
+
 
 @lru_cache()
 def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
@@ -55,6 +64,17 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
             cs_offset=cs_offset, w1=w1,
         )
 
+        mag_eq = compute_2hznz_eq(pb, pc)
+
+        # Drops the part of the basis that does not contribute to the signal,
+        # e.g. state C when pc = 0 (see chemex.bases.reduction)
+        indexes = get_reduced_indexes((mag_eq,),
+                                      (l_free, l_w1x, l_w1y, P180_S),
+                                      DETECTED)
+        l_free, l_w1x, l_w1y, p180_s = reduce_matrices(indexes, l_free, l_w1x,
+                                                       l_w1y, P180_S)
+        mag_eq, = reduce_vectors(indexes, mag_eq)
+
         p_equil = expm(l_free * time_equil)
         p_neg = expm(l_free * -2.0 * pw / pi)
         p_taub = expm(l_free * (taub - 2.0 * pw - 2.0 * pw / pi))
@@ -65,30 +85,30 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
         p_180px = matrix_power(p_90px, 2)
         p_180py = matrix_power(p_90py, 2)
 
-        p_element = reduce(dot, [P180_S, p_taub, p_90py, p_90px, P180_S, p_90px,
+        p_element = reduce(dot, [p180_s, p_taub, p_90py, p_90px, p180_s, p_90px,
                                  p_90py, p_taub])
 
         ps = (p_equil, p_neg, p_90px, p_90py, p_90mx, p_90my, p_180px, p_180py,
               p_element)
 
-        return l_free, ps
+        return l_free, mag_eq, indexes, ps
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
-                         dw_ab=0.0, dw_ac=0.0, r_nxy=5.0, dr_nxy_ab=0.0,
-                         dr_nxy_ac=0.0,
-                         r_nz=1.5, r_2hznz=5.0, etaxy=0.0, etaz=0.0, j_hn=-93.0,
-                         dj_hn_ab=0.0, dj_hn_ac=0.0, cs=0.0, ncyc=0):
+    def _calc_profile(ncycs, pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
+                      dw_ab=0.0, dw_ac=0.0, r_nxy=5.0, dr_nxy_ab=0.0,
+                      dr_nxy_ac=0.0,
+                      r_nz=1.5, r_2hznz=5.0, etaxy=0.0, etaz=0.0, j_hn=-93.0,
+                      dj_hn_ab=0.0, dj_hn_ac=0.0, cs=0.0):
         """
-        Calculate the intensity in presence of exchange during a cpmg-type pulse train.
+        Calculate the intensities in presence of exchange during a cpmg-type pulse train,
+        for all the ncyc values of a profile.
                 _______________________________________________________________________
         1H :   |  /   /   /   /   /   /   /   /   CW   /   /   /   /   /   /   /   /   |
         15N:    Nx { tauc  2Ny  tauc }*ncyc 2Nx { tauc  2Ny  tauc }*ncyc -Nx time_equil
 
         Parameters
         ----------
-        i0 : float
-            Initial intensity.
+        ncycs : tuple of int
+            Number of cycles of the points of the profile.
         pb : float
             Fractional population of state B,
             0.0 for 0%, 1.0 for 100%
@@ -106,8 +126,8 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
             Offset from the carrier in rad/s.
         Returns
         -------
-        out : float
-            Intensity after the CPMG block
+        out : ndarray
+            Intensities (for i0 = 1) after the CPMG block
 
         """
 
@@ -115,7 +135,7 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
         dw_ac *= ppm_to_rads
         cs_offset = (cs - carrier) * ppm_to_rads + pi * j_hn
 
-        l_free, ps = make_propagators(
+        l_free, mag_eq, indexes, ps = make_propagators(
             pb=pb, pc=pc, kex_ab=kex_ab, kex_bc=kex_bc, kex_ac=kex_ac,
             dw_ab=dw_ab, dw_ac=dw_ac, r_nxy=r_nxy, dr_nxy_ab=dr_nxy_ab,
             dr_nxy_ac=dr_nxy_ac, r_nz=r_nz, r_2hznz=r_2hznz, etaxy=etaxy,
@@ -126,48 +146,30 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0,
         (p_equil, p_neg, p_90px, p_90py, p_90mx,
          p_90my, p_180px, p_180py, p_element) = ps
 
-        mag_eq = compute_2hznz_eq(pb, pc)
+        ncycs = asarray(ncycs)
+        cpmg = ncycs > 0
+
+        mag = zeros((len(ncycs),) + mag_eq.shape)
 
-        if ncyc == 0:
+        if not cpmg.all():
 
             # The +/- phase cycling of the first 90 and the receiver is taken care
             # by setting the thermal equilibrium to 0
-            mag = -reduce(dot, [p_equil, p_90py, p_element, p_90px, mag_eq])
+            mag[~cpmg] = -apply_propagators([p_equil, p_90py, p_element, p_90px, mag_eq])
 
-        else:
+        if cpmg.any():
 
-            t_cp = time_t2 / (4.0 * ncyc) - pw
-            p_free = expm(l_free * t_cp)
-            p_cpx = matrix_power(p_free.dot(p_180px).dot(p_free), ncyc)
-            p_cpy = matrix_power(p_free.dot(p_180py).dot(p_free), ncyc)
+            p_cpx, p_cpy = calc_cp_propagators(l_free, (p_180px, p_180py), ncycs[cpmg],
+                                               time_t2, pw)
             p_element_pc = 0.5 * (p_90px.dot(p_element).dot(p_90py) +
                                   p_90mx.dot(p_element).dot(p_90my))
 
-            mag = -reduce(dot,
-                          [p_equil, p_90py, p_neg, p_cpx, p_neg, p_element_pc,
-                           p_neg, p_cpy, p_neg, p_90px, mag_eq])
+            mag[cpmg] = -apply_propagators([p_equil, p_90py, p_neg, p_cpx, p_neg, p_element_pc,
+                                            p_neg, p_cpy, p_neg, p_90px, mag_eq])
 
-        magz_a, _, _ = get_trz(mag)
+        magz_a, _, _ = get_trz(expand_vectors(indexes, mag, SIZE))
 
         return magz_a
 
-    def calc_observable(i0=0.0, **kwargs):
-        """
-        Calculate the intensity in presence of exchange after a CEST block.
-
-        Parameters
-        ----------
-        i0 : float
-            Initial intensity.
-
-        Returns
-        -------
-        out : float
-            Intensity after the CEST block
-
-        """
-
-        return i0 * _calc_observable(**kwargs)
-
-    return calc_observable
+    return make_calc_observable_from_profile(_calc_profile)
 
@@ -8,9 +8,14 @@ Created on Aug 26, 2011
 # Imports
 from scipy import zeros, asarray, pi
 
-from chemex.bases.three_states.iph_aph import \
-    R_IXY, R_2SZIXY, DR_IXY_AB, DR_IXY_AC, R_IZ, R_2SZIZ, CS, DW_AB, DW_AC, \
-    J, DJ_AB, DJ_AC, ETAXY, ETAZ, KAB, KBA, KBC, KCB, KAC, KCA, W1X, W1Y
+from chemex.bases.assembly import make_assembler
+from chemex.bases.three_states.iph_aph import W1X, W1Y, BASIS, TERMS
+
+
+assemble_free = make_assembler(BASIS, TERMS, (
+    'R_IXY', 'DR_IXY_AB', 'DR_IXY_AC', 'R_2SZIZ', 'R_IZ', 'R_2SZIXY', 'CS',
+    'DW_AB', 'DW_AC', 'J', 'DJ_AB', 'DJ_AC', 'ETAXY', 'ETAZ', 'KAB', 'KBA',
+    'KBC', 'KCB', 'KAC', 'KCA'))
 
 
 # Functions
@@ -91,26 +96,11 @@ def compute_liouvillians(
 
     r_2hznxy = r_nxy + r_2hznz - r_nz
 
-    l_free = R_IXY * r_nxy
-    l_free += DR_IXY_AB * dr_nxy_ab
-    l_free += DR_IXY_AC * dr_nxy_ac
-    l_free += R_2SZIZ * r_2hznz
-    l_free += R_IZ * r_nz
-    l_free += R_2SZIXY * r_2hznxy
-    l_free += CS * cs_offset
-    l_free += DW_AB * dw_ab
-    l_free += DW_AC * dw_ac
-    l_free += J * pi * j_hn
-    l_free += DJ_AB * pi * dj_hn_ab
-    l_free += DJ_AC * pi * dj_hn_ac
-    l_free += ETAXY * etaxy
-    l_free += ETAZ * etaz
-    l_free += KAB * kab
-    l_free += KBA * kba
-    l_free += KBC * kbc
-    l_free += KCB * kcb
-    l_free += KAC * kac
-    l_free += KCA * kca
+    l_free = assemble_free(
+        r_nxy, dr_nxy_ab, dr_nxy_ac, r_2hznz, r_nz, r_2hznxy, cs_offset, dw_ab,
+        dw_ac, pi * j_hn, pi * dj_hn_ab, pi * dj_hn_ac, etaxy, etaz, kab, kba,
+        kbc, kcb, kac, kca
+    )
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
 
@@ -127,9 +117,9 @@ def compute_2hznz_eq(pb, pc):
 
 
 def get_trz(mag):
-    magz_a = mag[5, 0] - mag[2, 0]
-    magz_b = mag[11, 0] - mag[8, 0]
-    magz_c = mag[17, 0] - mag[14, 0]
+    magz_a = mag[..., 5, 0] - mag[..., 2, 0]
+    magz_b = mag[..., 11, 0] - mag[..., 8, 0]
+    magz_c = mag[..., 17, 0] - mag[..., 14, 0]
 
     return magz_a, magz_b, magz_c
 
@@ -0,0 +1,179 @@
+"""
+Back-calculation of whole CPMG profiles.
+
+The intensities of all the points of a profile (i.e. all its ncyc values) are
+calculated together: the free-precession Liouvillian is diagonalized once and
+the propagators of all the ncyc values are obtained in one vectorized pass
+(see chemex.bases.expm).
+
+When the "calc_profile" function also accepts arrays of parameters (one value
+per profile), it is given a batch_key and the profiles of the residues sharing
+the settings of the experiment are calculated together (see
+chemex.experiments.profile.make_calc_vals). The propagators and magnetization
+vectors then have a leading dimension for the profiles, before the one for the
+ncyc values.
+"""
+
+from numpy import matmul, newaxis
+from scipy import asarray
+
+from chemex.bases.derivatives import (dot_split, expm_split,
+                                      matrix_power_split, pack_matrix,
+                                      split_matrix)
+from chemex.bases.expm import expm_batch, matrix_power_batch
+from chemex.caching import lru_cache
+from chemex.experiments import profile
+
+
+def make_calc_observable_from_profile(calc_profile, batch_key=None):
+    """
+    Factory to make a "calc_observable" function out of a "calc_profile"
+    function calculating the intensities for a tuple of ncyc values (see
+    chemex.experiments.profile; batch_key should only be given if
+    calc_profile accepts arrays of parameters).
+    """
+
+    return profile.make_calc_observable_from_profile(calc_profile, 'ncyc',
+                                                     batch_key=batch_key)
+
+
+def add_derivatives(calc_observable, calc_profile_derivatives, par_names):
+    """
+    Attaches a "calc_profile_derivatives" function to a calc_observable made
+    by make_calc_observable_from_profile, used for the Jacobian of the
+    residuals when the analytic derivatives are selected (see
+    chemex.jacobian.make_calc_derivatives).
+
+    Parameters
+    ----------
+    calc_observable : function
+        Calculates the intensity of one point of the profile.
+    calc_profile_derivatives : function
+        Calculates the intensities (for i0 = 1) for a tuple of ncyc values,
+        along with their derivatives with respect to a tuple of parameter
+        names (in the order of 'par_names'), given as first and second
+        arguments, and the model parameters, given as keyword arguments.
+        Returns arrays of shape (len(ncycs),) and (len(names), len(ncycs)).
+    par_names : tuple of str
+        Parameters the intensities can be differentiated with respect to
+        (besides i0).
+
+    """
+
+    calc_observable.calc_profile_derivatives = lru_cache(5)(
+        calc_profile_derivatives)
+    calc_observable.derivative_names = par_names
+
+    return calc_observable
+
+
+def calc_cp_propagators(l_free, p_180s, ncycs, time_t2, pw=0.0, repeat=1,
+                        par_nb=0):
+    """
+    Calculates the propagators of the CPMG trains for all the ncyc values at
+    once: [p_free . p_180 . p_free]^(repeat * ncyc) with
+    p_free = exp(l_free * t_cp) and t_cp = time_t2 / (4 * ncyc) - pw.
+
+    Parameters
+    ----------
+    l_free : ndarray, shape (..., n, n)
+        Liouvillian(s) of the free precession.
+    p_180s : tuple of ndarray, shape (..., n, n)
+        Propagators of the refocusing pulses, one train per pulse.
+    ncycs : array_like of int
+        Number of cycles (all > 0).
+    time_t2 : float
+        Time of the CPMG block.
+    pw : float
+        Part of the pulse width to subtract from the delays.
+    repeat : integer
+        Number of [t_cp-180-t_cp] elements per cycle.
+    par_nb : integer
+        Number of parameters of the augmented matrices, if 'l_free' and
+        'p_180s' are augmented matrices (see chemex.bases.derivatives).
+
+    Returns
+    -------
+    out : list of ndarray, shape (..., len(ncycs), n, n)
+        The propagators of the CPMG trains, one stack per refocusing pulse.
+
+    """
+
+    ncycs = asarray(ncycs)
+    t_cps = time_t2 / (4.0 * ncycs) - pw
+
+    if par_nb:
+        p_frees = expm_split(split_matrix(l_free, par_nb), t_cps)
+        return [pack_matrix(*matrix_power_split(
+                    dot_split(dot_split(p_frees,
+                                        split_matrix(p_180, par_nb)),
+                              p_frees),
+                    repeat * ncycs))
+                for p_180 in p_180s]
+
+    p_frees = expm_batch(asarray(l_free)[..., newaxis, :, :], t_cps)
+
+    return [matrix_power_batch(
+                matmul(matmul(p_frees, asarray(p_180)[..., newaxis, :, :]),
+                       p_frees),
+                repeat * ncycs)
+            for p_180 in p_180s]
+
+
+def calc_cp_propagators_conj(l_free, p_180s, ncycs, time_t2, pw=0.0):
+    """
+    Same as calc_cp_propagators (with repeat=2) for the complex reduced bases,
+    in which the refocusing pulses are antilinear: they map the magnetization
+    vector c to p_180 . c* (see chemex.bases.two_states.fast_complex).
+
+    An element [t_cp-180-t_cp] then maps c to a . c*, with
+    a = p_free . p_180 . p_free*, so that a cycle of two elements is linear:
+    c -> a . a* . c. The propagators returned are [a . a*]^ncyc.
+
+    """
+
+    ncycs = asarray(ncycs)
+    t_cps = time_t2 / (4.0 * ncycs) - pw
+
+    p_frees = expm_batch(asarray(l_free)[..., newaxis, :, :], t_cps)
+
+    propagators = []
+
+    for p_180 in p_180s:
+        p_element = matmul(matmul(p_frees, asarray(p_180)[..., newaxis, :, :]),
+                           p_frees.conj())
+        propagators.append(
+            matrix_power_batch(matmul(p_element, p_element.conj()), ncycs))
+
+    return propagators
+
+
+def apply_propagators(operands):
+    """
+    Propagates a magnetization vector through a sequence of propagators.
+
+    Same as reduce(matmul, operands), but the products are evaluated from the
+    right: each propagator is applied to the magnetization vector rather than
+    multiplied with the next propagator, so that only matrix-vector products
+    are computed.
+
+    Parameters
+    ----------
+    operands : sequence of ndarray
+        The propagators, shape (..., n, n), in the order of the matrix
+        product (i.e. the last one is applied first), followed by the
+        magnetization vector, shape (..., n, 1).
+
+    Returns
+    -------
+    out : ndarray, shape (..., n, 1)
+        The propagated magnetization vector(s).
+
+    """
+
+    mag = operands[-1]
+
+    for propagator in reversed(operands[:-1]):
+        mag = matmul(propagator, mag)
+
+    return mag
@@ -11,6 +11,7 @@ import os
 import scipy as sc
 
 from chemex import utils
+from chemex.experiments.dataset import Dataset
 
 
 def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None):
@@ -20,6 +21,9 @@ def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None)
 
     data_points = list()
 
+    # The points of the experiment are stored by columns
+    dataset = Dataset('ncyc', int)
+
     experiment_name = name_experiment(global_parameters)
 
     for resonance_id, filename in cfg.items('data'):
@@ -39,13 +43,14 @@ def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None)
         parameters['resonance_id'] = resonance_id
 
         abs_path_filename = os.path.join(exp_data_dir, filename)
-        data_points += read_a_cpmg_profile(abs_path_filename, parameters)
+        data_points += read_a_cpmg_profile(abs_path_filename, parameters,
+                                           dataset)
 
     # Adjust the minimal uncertainty
-    data_points = adjust_min_int_uncertainty(data_points)
+    adjust_min_int_uncertainty(dataset)
 
     # Normalize intensities
-    data_points = norm_int(data_points)
+    norm_int(dataset)
 
     return data_points
 
@@ -67,7 +72,7 @@ def name_experiment(global_parameters=None):
     return name
 
 
-def read_a_cpmg_profile(filename, parameters):
+def read_a_cpmg_profile(filename, parameters, dataset=None):
     """Reads in the fuda file and spit out the intensities"""
 
     data = sc.loadtxt(filename, dtype=[('ncyc', '<f8'), ('intensity', '<f8'), ('intensity_err', '<f8')])
@@ -79,6 +84,9 @@ def read_a_cpmg_profile(filename, parameters):
     exp_type = parameters['experiment_type'].replace('_cpmg', '')
     data_point = __import__(exp_type + '.data_point', globals(), locals(), ['DataPoint'], -1)
 
+    if dataset is None:
+        dataset = Dataset('ncyc', int)
+
     intensity_ref = 1.0
 
     for ncyc, intensity_val, intensity_err in data:
@@ -88,16 +96,24 @@ def read_a_cpmg_profile(filename, parameters):
     parameters['profile_id'] = filename
     parameters['intensity_ref'] = intensity_ref
 
-    for ncyc, intensity_val, intensity_err in data:
-        parameters['ncyc'] = int(ncyc)
+    ncycs = [int(ncyc) for ncyc in data['ncyc']]
 
-        # Used to keep reference points out of the bootstrapping
-        parameters['reference'] = int(ncyc) == 0
+    # Used to keep reference points out of the bootstrapping
+    references = [ncyc == 0 for ncyc in ncycs]
 
+    pars = dataset.add_profile(parameters, ncycs, references)
+
+    for par, (_ncyc, intensity_val, intensity_err) in zip(pars, data):
         # Calculate r2 uncertainty from intensity uncertainty
         intensity_err = max([uncertainty_from_duplicates, intensity_err])
 
-        data_points.append(data_point.DataPoint(intensity_val, intensity_err, parameters))
+        data_points.append(data_point.DataPoint(intensity_val, intensity_err, par))
+
+    dataset.share_names(data_points)
+
+    # All the points of the profile are back-calculated in one go
+    for calc_observable in set(data_pt.calc_observable for data_pt in data_points):
+        calc_observable.add_values(ncycs)
 
     return data_points
 
@@ -117,36 +133,24 @@ def estimate_uncertainty_from_duplicates(data):
     return sc.mean(intensity_std) if intensity_std else 0.0
 
 
-def adjust_min_int_uncertainty(data_int):
+def adjust_min_int_uncertainty(dataset):
     """
     Adjusts the uncertainty of data points to the maximum of
     either the present uncertainty or the median of all the uncertainties
 
     """
 
-    int_err_list = list()
-
-    for data_point in data_int:
-        int_err_list.append(data_point.err)
-
-    new_data_int = list()
-
-    for data_point in data_int:
-        data_point.err = max([data_point.err, sc.median(int_err_list)])
-        new_data_int.append(data_point)
+    dataset['err'] = sc.maximum(dataset['err'], sc.median(dataset['err']))
 
-    return new_data_int
+    return dataset
 
 
-def norm_int(data_int):
+def norm_int(dataset):
     """Normalize intensities relative to the intensity of the reference plane"""
 
-    new_data_int = list()
+    intensity_refs = dataset.get_profile_values('intensity_ref')
 
-    for data_point in data_int:
-        data_point.val /= data_point.par['intensity_ref']
-        data_point.err /= data_point.par['intensity_ref']
-        data_point.err = abs(data_point.err)
-        new_data_int.append(data_point)
+    dataset['val'] /= intensity_refs
+    dataset['err'] = abs(dataset['err'] / intensity_refs)
 
-    return new_data_int
+    return dataset
@@ -0,0 +1,282 @@
+"""
+Columnar storage of the data points of an experiment.
+
+The measured and back-calculated values of the points of an experiment, their
+uncertainties, their variable (e.g. 'ncyc' or 'b1_offset'), the profile they
+belong to and whether they are reference points are stored as NumPy arrays.
+The other parameters are shared by all the points of a profile and stored
+only once per profile.
+
+The data points themselves are thin views on a row of the dataset (see
+Parameters and chemex.experiments.base_data_point.BaseDataPoint):
+
+    dataset = Dataset('ncyc', int)
+    for par in dataset.add_profile(parameters, ncycs, references):
+        data_points.append(DataPoint(val, err, par))
+"""
+
+import numpy as np
+
+
+COLUMNS = ('val', 'err', 'cal', 'variable', 'profile', 'reference')
+
+
+class Dataset(object):
+    """The points of an experiment, stored by columns."""
+
+    def __init__(self, variable=None, dtype=float):
+        """
+        Parameters
+        ----------
+        variable : str
+            Name of the parameter varying from point to point within a
+            profile (e.g. 'ncyc'), if any.
+        dtype : type
+            Type of the variable.
+
+        """
+
+        self.variable = variable
+        self.profiles = []
+        self.size = 0
+
+        self._columns = {
+            'val': np.zeros(0),
+            'err': np.zeros(0),
+            'cal': np.zeros(0),
+            'variable': np.zeros(0, dtype=dtype),
+            'profile': np.zeros(0, dtype=int),
+            'reference': np.zeros(0, dtype=bool),
+        }
+
+        self._names = {}
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_columns'] = dict((name, self[name]) for name in COLUMNS)
+        return state
+
+    def __getitem__(self, name):
+        """Returns a column of the dataset (a view, not a copy)."""
+
+        return self._columns[name][:self.size]
+
+    def __setitem__(self, name, values):
+        self._columns[name][:self.size] = values
+
+    @property
+    def val(self):
+        return self['val']
+
+    @property
+    def err(self):
+        return self['err']
+
+    @property
+    def cal(self):
+        return self['cal']
+
+    def add_profile(self, parameters, variables=(None,), references=None):
+        """
+        Adds the points of a profile to the dataset.
+
+        Parameters
+        ----------
+        parameters : dict
+            Parameters shared by all the points of the profile. The dictionary
+            is copied.
+        variables : sequence
+            Values of the variable of the points (one point per value).
+        references : sequence of bool, optional
+            Whether the points are reference points.
+
+        Returns
+        -------
+        out : list of Parameters
+            The parameters of the points, to create the data points with.
+
+        """
+
+        size = len(variables)
+        start, stop = self.size, self.size + size
+
+        self._reserve(stop)
+        self.size = stop
+
+        profile = dict(parameters)
+
+        if self.variable is not None:
+            profile.pop(self.variable, None)
+            self._columns['variable'][start:stop] = variables
+
+        profile.pop('reference', None)
+
+        self._columns['val'][start:stop] = 0.0
+        self._columns['err'][start:stop] = 0.0
+        self._columns['cal'][start:stop] = np.nan
+        self._columns['profile'][start:stop] = len(self.profiles)
+        self._columns['reference'][start:stop] = (
+            False if references is None else references
+        )
+
+        self.profiles.append(profile)
+
+        return [Parameters(self, index) for index in range(start, stop)]
+
+    def get_profile_values(self, name):
+        """Returns the value of a profile parameter, for every point."""
+
+        values = np.asarray([profile[name] for profile in self.profiles])
+
+        return values[self['profile']]
+
+    def share_names(self, data_points):
+        """
+        Makes the data points share the parameter names they have in common
+        rather than keeping a copy each. The sets of names are made frozen in
+        the process.
+        """
+
+        for data_point in data_points:
+            data_point.short_long_par_names = self._share(
+                tuple(data_point.short_long_par_names)
+            )
+            data_point.fitting_parameter_names = self._share(
+                frozenset(data_point.fitting_parameter_names)
+            )
+            data_point.fixed_parameter_names = self._share(
+                frozenset(data_point.fixed_parameter_names)
+            )
+
+    def _share(self, names):
+        return self._names.setdefault(names, names)
+
+    def _reserve(self, size):
+        """Grows the columns (by doubling them) to hold 'size' points."""
+
+        capacity = len(self._columns['val'])
+
+        if size <= capacity:
+            return
+
+        capacity = max(size, 2 * capacity)
+
+        for name, column in self._columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self._columns[name] = grown
+
+
+class Parameters(object):
+    """
+    Parameters of a data point: a dictionary-like view on a row of a dataset.
+
+    The variable of the point and whether it is a reference point are read
+    from (and written to) the columns of the dataset, the other parameters
+    from the parameters shared by the points of the profile.
+    """
+
+    __slots__ = ('dataset', 'index')
+
+    def __init__(self, dataset, index):
+        self.dataset = dataset
+        self.index = index
+
+    def _get_column(self, key):
+        if key == 'reference':
+            return 'reference'
+        elif key == self.dataset.variable:
+            return 'variable'
+        else:
+            return None
+
+    @property
+    def profile(self):
+        """Parameters shared by the points of the profile."""
+
+        return self.dataset.profiles[self.dataset['profile'][self.index]]
+
+    def __getitem__(self, key):
+        column = self._get_column(key)
+
+        if column is None:
+            return self.profile[key]
+
+        return self.dataset[column][self.index].item()
+
+    def __setitem__(self, key, value):
+        column = self._get_column(key)
+
+        if column is None:
+            self.profile[key] = value
+        else:
+            self.dataset[column][self.index] = value
+
+    def __contains__(self, key):
+        return self._get_column(key) is not None or key in self.profile
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        keys = list(self.profile)
+        keys.append('reference')
+
+        if self.dataset.variable is not None:
+            keys.append(self.dataset.variable)
+
+        return keys
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def copy(self):
+        """Returns the parameters as a (new) dictionary."""
+
+        return dict(self.items())
+
+
+def group_by_dataset(data_points):
+    """
+    Groups a list of data points by dataset.
+
+    Returns
+    -------
+    out : list of tuple
+        (dataset, rows, positions) for every dataset: the rows of the points
+        in the dataset and their positions in the list.
+
+    """
+
+    groups = {}
+
+    for position, data_point in enumerate(data_points):
+        par = data_point.par
+        rows, positions = groups.setdefault(id(par.dataset),
+                                            (par.dataset, [], []))[1:]
+        rows.append(par.index)
+        positions.append(position)
+
+    return [(dataset, np.asarray(rows, dtype=int),
+             np.asarray(positions, dtype=int))
+            for dataset, rows, positions in groups.values()]
+
+
+def get_column(data_points, name):
+    """Returns the values of a column of the datasets for a list of points."""
+
+    values = np.empty(len(data_points))
+
+    for dataset, rows, positions in group_by_dataset(data_points):
+        values[positions] = dataset[name][rows]
+
+    return values
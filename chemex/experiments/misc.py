@@ -1,16 +1,26 @@
 from __future__ import print_function
 
 import collections
+import copy
+from inspect import getargspec
 
 import numpy as np
-from scipy import array, pi
+from numpy.polynomial.legendre import leggauss
+from scipy import array, linspace, pi
+from scipy.stats import norm
 
 from chemex.caching import lru_cache
+from chemex.experiments.dataset import Parameters
 from chemex.utils import header1, header2
 
 
 SIGN = array([1.0, -1.0])
 
+# Sampling schemes of the B1 field inhomogeneity, and number of points of the
+# dense (linspace) grid used as reference to estimate the error of the others
+B1_INH_SCHEMES = ('linspace', 'legendre')
+B1_INH_RES_REF = 101
+
 
 @lru_cache()
 def correct_chemical_shift(pb=0.0, kex=0.0, dw=0.0, r_ixy=0.0, dr_ixy=0.0):
@@ -33,6 +43,27 @@ def correct_chemical_shift(pb=0.0, kex=0.0, dw=0.0, r_ixy=0.0, dr_ixy=0.0):
     return nu1, nu2
 
 
+def correct_chemical_shift_batch(pb=0.0, kex=0.0, dw=0.0, r_ixy=0.0,
+                                 dr_ixy=0.0):
+    """Same as correct_chemical_shift, for arrays of parameters."""
+
+    kab = np.asarray(kex * pb, dtype=complex)
+    kba = kex - kab
+
+    k2ab = r_ixy + kab
+    k2ba = r_ixy + dr_ixy - 1j * dw + kba
+
+    k2ex = k2ab + k2ba
+    fac = ((k2ab - k2ba) ** 2 + 4.0 * kab * kba) ** 0.5
+
+    nu1 = (0.5 * (-k2ex + fac)).imag
+    nu2 = (0.5 * (-k2ex - fac)).imag
+
+    swap = abs(nu1) > abs(nu2)
+
+    return np.where(swap, nu2, nu1)[()], np.where(swap, nu1, nu2)[()]
+
+
 def correct_intensities(magz_a=1.0, magz_b=0.0, pb=0.0, kex=0.0, dw=0.0,
                         r_ixy=0.0, dr_ixy=0.0):
     """Corrects major and minor peak intensities in presence of exchange."""
@@ -127,6 +158,110 @@ def calc_multiplet(couplings=None, multiplet=None):
         return multiplet
 
 
+def calc_b1_inh_samples(b1_frq=0.0, b1_inh=0.0, b1_inh_res=5,
+                        b1_inh_scheme='linspace'):
+    """
+    Samples the B1 field strength, assumed to follow a normal distribution, to
+    model its inhomogeneity.
+
+    Parameters
+    ----------
+    b1_frq : float
+        Mean B1 field strength.
+    b1_inh : float
+        Standard deviation of the B1 field strength (same unit as b1_frq).
+    b1_inh_res : int
+        Number of samples.
+    b1_inh_scheme : {'linspace', 'legendre'}
+        'linspace': values evenly spaced over +/- 2 standard deviations,
+        weighted by the normal probability density (weights not normalized).
+        'legendre': nodes of the Gauss-Legendre quadrature over the same
+        +/- 2 standard deviations, weighted by the Gauss-Legendre weights
+        times the normal probability density (normalized). Same distribution
+        as 'linspace', which it converges to with fewer samples. The number
+        of samples needed grows with the spread of the nutation angles
+        (2 pi b1_inh time_t1): check the error estimate written in
+        'b1_inh_error.fit'.
+
+    Returns
+    -------
+    b1_frqs, weights : ndarray
+        The sampled B1 field strengths and their weights.
+
+    """
+
+    if b1_inh_scheme == 'legendre':
+        nodes, weights = leggauss(b1_inh_res)
+        weights = weights * norm.pdf(2.0 * nodes)
+        return b1_frq + 2.0 * b1_inh * nodes, weights / weights.sum()
+
+    b1_frqs = linspace(-2.0, 2.0, b1_inh_res) * b1_inh + b1_frq
+    weights = norm.pdf(b1_frqs, b1_frq, b1_inh)
+
+    return b1_frqs, weights
+
+
+def get_b1_inh_scheme(par):
+    """Returns the sampling scheme of the B1 inhomogeneity of an experiment
+    ('linspace' by default)."""
+
+    b1_inh_scheme = par.get('b1_inh_scheme', 'linspace').strip().lower()
+
+    if b1_inh_scheme not in B1_INH_SCHEMES:
+        exit("Unknown B1 inhomogeneity scheme for {:s}: '{:s}' (choose from "
+             "{:s})".format(par['resonance_id'], b1_inh_scheme,
+                            ', '.join(B1_INH_SCHEMES)))
+
+    return b1_inh_scheme
+
+
+def make_calc_observable_ref(make_calc_observable, par):
+    """
+    Makes the "calc_observable" function sampling the B1 inhomogeneity on the
+    dense linspace grid, used as reference to estimate the error of the
+    quadrature (None if the experiment uses the linspace scheme already).
+    """
+
+    if par['b1_inh_scheme'] == 'linspace':
+        return None
+
+    par_ref = dict(par, b1_inh_scheme='linspace', b1_inh_res=B1_INH_RES_REF)
+    args = (par_ref[arg]
+            for arg in getargspec(make_calc_observable.__wrapped__).args)
+
+    return make_calc_observable(*args)
+
+
+def make_data_ref(data):
+    """
+    Makes copies of the data points back-calculated with their
+    "calc_observable_ref" function (see make_calc_observable_ref), stored in
+    copies of their datasets: the reference values can then be calculated in
+    batches (see chemex.experiments.profile.make_calc_vals) without
+    overwriting the back-calculated values of the data points.
+    """
+
+    datasets = dict()
+    data_ref = list()
+
+    for data_point in data:
+
+        dataset = data_point.dataset
+
+        if id(dataset) not in datasets:
+            datasets[id(dataset)] = copy.deepcopy(dataset)
+
+        data_point_ref = copy.copy(data_point)
+        data_point_ref.par = Parameters(datasets[id(dataset)],
+                                        data_point.index)
+        data_point_ref.calc_observable = data_point.calc_observable_ref
+        data_point_ref.calc_compiled = None
+
+        data_ref.append(data_point_ref)
+
+    return data_ref
+
+
 def format_experiment_help(type_experiment, name_experiment):
     import textwrap
 
@@ -0,0 +1,341 @@
+"""
+Back-calculation of whole profiles.
+
+The points of a profile only differ by one experimental variable (e.g. the
+number of cycles of a CPMG experiment or the B1 offset of a CEST experiment).
+Rather than calculating them one at a time, the intensities of all the points
+are calculated together by a "calc_profile" function, which can share the
+costly steps (diagonalizations, exponentials) between the points. The data
+points then read their value out of the shared, cached profile.
+
+The profiles of the different residues of an experiment can in turn be
+calculated together, when the "calc_profile" function accepts arrays of
+parameters (one value per profile): see make_calc_vals.
+"""
+
+from collections import OrderedDict
+from functools import wraps
+
+import scipy as sc
+
+from chemex.caching import lru_cache
+from chemex.experiments.base_data_point import make_gather
+from chemex.experiments.dataset import group_by_dataset
+
+
+def make_calc_observable_from_profile(calc_profile, variable, batch_key=None):
+    """
+    Factory to make a "calc_observable" function out of a "calc_profile"
+    function.
+
+    Parameters
+    ----------
+    calc_profile : function
+        Calculates the intensities (for i0 = 1) for a tuple of values of the
+        variable, given as first argument, and the model parameters, given as
+        keyword arguments.
+    variable : str
+        Name of the keyword argument of calc_observable holding the value of
+        the variable (e.g. 'ncyc' or 'b1_offset').
+    batch_key : hashable, optional
+        Identifies the profiles that can be calculated together across
+        residues: calc_profile then also accepts arrays of parameters of the
+        same shape (one value per profile) and returns an array of shape
+        (number of profiles, number of values). All the "calc_profile"
+        functions sharing a batch_key should be interchangeable (same
+        experiment and settings).
+
+    Returns
+    -------
+    out : function
+        Calculate the intensity of one point of the profile. The values of
+        the variable in the profile should be declared beforehand with
+        calc_observable.add_values; other values (e.g. those used to draw the
+        fitted curves) are calculated on their own.
+
+    """
+
+    calc_profile_cached = lru_cache(5)(calc_profile)
+
+    positions = {}
+    positional_caches = {}
+
+    def add_values(values):
+        """Declares values of the variable to be calculated along with the
+        profile."""
+
+        values = sorted(set(positions) | set(values))
+
+        positions.clear()
+        positions.update((value, index) for index, value in enumerate(values))
+
+        calc_observable.values = tuple(values)
+
+    def calc_observable(i0=0.0, **kwargs):
+        """
+        Calculate the intensity of one point of the profile.
+
+        Parameters
+        ----------
+        i0 : float
+            Initial intensity.
+
+        Returns
+        -------
+        out : float
+            Intensity of the point
+
+        """
+
+        value = kwargs.pop(variable)
+
+        if value not in positions:
+            return i0 * calc_profile_cached((value,), **kwargs)[0]
+
+        mags = calc_profile_cached(calc_observable.values, **kwargs)
+
+        return i0 * mags[positions[value]]
+
+    def make_positional(names):
+        """
+        Makes a function calculating the intensity of one point out of the
+        values of the arguments of calc_observable, given positionally in the
+        order of 'names' (fixed for a data point, see
+        chemex.experiments.base_data_point.BaseDataPoint.compile_calc): the
+        cache lookups then cost a tuple hash, with no keyword arguments to
+        sort.
+        """
+
+        index_i0 = names.index('i0')
+        index_value = names.index(variable)
+        indexes = [index for index, name in enumerate(names)
+                   if name not in ('i0', variable)]
+        profile_names = tuple(names[index] for index in indexes)
+
+        calc_profile_positional = positional_caches.get(profile_names)
+
+        if calc_profile_positional is None:
+
+            @wraps(calc_profile)
+            def calc_profile_positional(values, *args):
+                return calc_profile(values, **dict(zip(profile_names, args)))
+
+            calc_profile_positional = lru_cache(5)(calc_profile_positional)
+            positional_caches[profile_names] = calc_profile_positional
+
+        def calc(*args):
+            """calc_observable with positional arguments."""
+
+            value = args[index_value]
+            profile_args = [args[index] for index in indexes]
+
+            if value not in positions:
+                return (args[index_i0] *
+                        calc_profile_positional((value,), *profile_args)[0])
+
+            mags = calc_profile_positional(calc_observable.values,
+                                           *profile_args)
+
+            return args[index_i0] * mags[positions[value]]
+
+        return calc
+
+    calc_observable.values = ()
+    calc_observable.add_values = add_values
+    calc_observable.make_positional = make_positional
+    calc_observable.variable = variable
+    calc_observable.calc_profile = calc_profile
+    calc_observable.batch_key = batch_key
+
+    return calc_observable
+
+
+def make_calc_vals(data):
+    """
+    Factory to make a "calc_vals" function calculating the values of all the
+    data points.
+
+    The points are grouped by profile and the profiles of an experiment that
+    share their settings and values of the variable (same batch_key and
+    values) are calculated in one call to calc_profile, with the parameters
+    of all the residues stacked. Profiles whose parameters did not change
+    since the previous call are not calculated again. The other points are
+    calculated one at a time, and again only if one of the parameters they
+    depend on changed since the previous call (e.g. only the points of a
+    residue when one of its parameters is stepped to get the Jacobian).
+
+    The parameters of all the points are extracted from 'par' and
+    'par_fixed' by NumPy gathers, whose indexes are only looked up again when
+    the fitting step changes (see
+    chemex.experiments.base_data_point.make_gather).
+
+    Parameters
+    ----------
+    data : list of DataPoint
+        The data points, in the order of the returned values.
+
+    Returns
+    -------
+    out : function
+        calc_vals(par, par_indexes, par_fixed) returns the values of the
+        points as an ndarray and also sets their 'cal' attribute.
+
+    """
+
+    singles = []
+    groups = OrderedDict()
+
+    for index, data_pt in enumerate(data):
+
+        if data_pt.calc_compiled is None:
+            data_pt.compile_calc()
+
+        calc_observable = data_pt.calc_observable
+        batch_key = getattr(calc_observable, 'batch_key', None)
+
+        if batch_key is not None:
+            value = data_pt.kwargs_default.get(calc_observable.variable)
+
+        if batch_key is None or value not in calc_observable.values:
+            singles.append(index)
+            continue
+
+        profiles = groups.setdefault(
+            (batch_key, calc_observable.values, data_pt.arg_names),
+            OrderedDict()
+        )
+        points = profiles.setdefault(
+            (calc_observable, data_pt.short_long_par_names), []
+        )
+        points.append((index, calc_observable.values.index(value)))
+
+    batches = [_make_batch(data, profiles) for profiles in groups.values()]
+
+    # The arguments of the points calculated one at a time, all gathered at
+    # once
+    long_names, slices = [], []
+
+    for index in singles:
+        start = len(long_names)
+        long_names.extend(data[index].long_names)
+        slices.append((data[index], index, start, len(long_names)))
+
+    gather = make_gather(long_names)
+    starts = sc.asarray([start for _, _, start, _ in slices], dtype=int)
+    stops = sc.asarray([stop for _, _, _, stop in slices], dtype=int)
+
+    # The back-calculated values are stored in the datasets of the points
+    datasets = group_by_dataset(data)
+
+    # Values of the arguments of the points at the previous call, and the
+    # values of the points calculated with them
+    previous = {'values': None, 'cals': sc.zeros(len(data))}
+
+    def calc_vals(par, par_indexes, par_fixed=None):
+        """Calculates the values of all the data points."""
+
+        cals = previous['cals']
+
+        values = gather(par, par_indexes, par_fixed)
+
+        if previous['values'] is None:
+            changed = sc.ones(len(slices), dtype=bool)
+        else:
+            # The arguments of a point changed if the number of arguments
+            # changed (cumulated over all the points) increases over its slice
+            counts = sc.cumsum(
+                sc.concatenate(([0], values != previous['values']))
+            )
+            changed = counts[stops] > counts[starts]
+
+        # Reset until all the points are calculated (in case of an interrupt)
+        previous['values'] = None
+
+        for position in sc.flatnonzero(changed):
+            data_pt, index, start, stop = slices[position]
+            args = tuple(values[start:stop]) + data_pt.args_default
+            cals[index] = data_pt.calc_compiled(*args)
+
+        previous['values'] = values
+
+        for batch in batches:
+            cals[batch['indexes']] = _calc_batch(batch, par, par_indexes,
+                                                 par_fixed)
+
+        for dataset, rows, positions in datasets:
+            dataset['cal'][rows] = cals[positions]
+
+        return cals.copy()
+
+    return calc_vals
+
+
+def _make_batch(data, profiles):
+    """Gathers the points of the profiles calculated together."""
+
+    indexes, rows, positions = [], [], []
+
+    for row, points in enumerate(profiles.values()):
+        for index, position in points:
+            indexes.append(index)
+            rows.append(row)
+            positions.append(position)
+
+    calc_observable = next(iter(profiles))[0]
+    data_pts = [data[points[0][0]] for points in profiles.values()]
+
+    # All the profiles share the order of their arguments: the parameters
+    # (among which i0), then the default arguments (among which the variable)
+    arg_names = data_pts[0].arg_names
+    nb_pars = len(data_pts[0].long_names)
+
+    columns = [column for column, name in enumerate(arg_names[:nb_pars])
+               if name != 'i0']
+    columns_default = [column for column, name
+                       in enumerate(arg_names[nb_pars:])
+                       if name != calc_observable.variable]
+
+    return {
+        'calc_profile': calc_observable.calc_profile,
+        'values': calc_observable.values,
+        'gather': make_gather(long_name for data_pt in data_pts
+                              for long_name in data_pt.long_names),
+        'shape': (len(data_pts), nb_pars),
+        'column_i0': arg_names.index('i0'),
+        'columns': columns,
+        'names': ([arg_names[column] for column in columns] +
+                  [arg_names[nb_pars + column] for column in columns_default]),
+        'defaults': sc.array([[data_pt.args_default[column]
+                               for column in columns_default]
+                              for data_pt in data_pts], dtype=float),
+        'indexes': sc.asarray(indexes, dtype=int),
+        'rows': sc.asarray(rows, dtype=int),
+        'positions': sc.asarray(positions, dtype=int),
+        'params': None,
+        'mags': sc.zeros((len(profiles), len(calc_observable.values))),
+    }
+
+
+def _calc_batch(batch, par, par_indexes, par_fixed):
+    """Calculates the values of the points of a batch of profiles."""
+
+    values = batch['gather'](par, par_indexes, par_fixed)
+    values = values.reshape(batch['shape'])
+
+    i0s = values[:, batch['column_i0']]
+    params = sc.hstack((values[:, batch['columns']], batch['defaults']))
+
+    if batch['params'] is None or batch['params'].shape != params.shape:
+        changed = sc.ones(len(params), dtype=bool)
+    else:
+        changed = (params != batch['params']).any(axis=1)
+
+    if changed.any():
+        kwargs = dict(zip(batch['names'], params[changed].T))
+        batch['mags'][changed] = batch['calc_profile'](batch['values'],
+                                                       **kwargs)
+        batch['params'] = params
+
+    rows = batch['rows']
+
+    return i0s[rows] * batch['mags'][rows, batch['positions']]
@@ -9,6 +9,7 @@ import os
 import scipy as sc
 
 from chemex import utils
+from chemex.experiments.dataset import Dataset
 
 
 def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None):
@@ -20,6 +21,9 @@ def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None)
 
     data_points = list()
 
+    # The points of the experiment are stored by columns
+    dataset = Dataset()
+
     experiment_name = name_experiment(global_parameters)
 
     for key, val in cfg.items('data'):
@@ -32,7 +36,7 @@ def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None)
         parameters['experiment_name'] = experiment_name
 
         abs_path_filename = os.path.join(exp_data_dir, val)
-        data_points += read_a_shift_file(abs_path_filename, parameters, res_incl, res_excl)
+        data_points += read_a_shift_file(abs_path_filename, parameters, res_incl, res_excl, dataset)
 
     return data_points
 
@@ -53,7 +57,7 @@ def name_experiment(global_parameters=None):
     return name
 
 
-def read_a_shift_file(filename, parameters, res_incl=None, res_excl=None):
+def read_a_shift_file(filename, parameters, res_incl=None, res_excl=None, dataset=None):
     """Reads in the fuda file and spit out the intensities"""
 
     data = sc.loadtxt(filename, dtype=[('resonance_id', 'S10'), ('shift_ppb', 'f8'), ('shift_ppb_err', 'f8')])
@@ -63,6 +67,9 @@ def read_a_shift_file(filename, parameters, res_incl=None, res_excl=None):
     exp_type = parameters['experiment_type'].replace('_shift', '')
     data_point = __import__(exp_type + '.data_point', globals(), locals(), ['DataPoint'], -1)
 
+    if dataset is None:
+        dataset = Dataset()
+
     for resonance_id, shift_ppb, shift_ppb_err in data:
 
         included = (
@@ -76,6 +83,11 @@ def read_a_shift_file(filename, parameters, res_incl=None, res_excl=None):
 
         parameters['resonance_id'] = resonance_id
 
-        data_points.append(data_point.DataPoint(shift_ppb, shift_ppb_err, parameters))
+        # Every shift is a profile of its own
+        par, = dataset.add_profile(parameters)
+
+        data_points.append(data_point.DataPoint(shift_ppb, shift_ppb_err, par))
+
+    dataset.share_names(data_points)
 
     return data_points
@@ -1,23 +1,39 @@
 from __future__ import print_function
 
 import itertools
+import multiprocessing
 import os.path
 import ConfigParser
 import sys
 
 import scipy as sp
+import scipy.linalg as la
 import scipy.optimize as opt
 
 from chemex import utils
 from chemex import chi2
+from chemex import jacobian
+from chemex import projection
 from chemex import writing
 from chemex.experiments import misc
 
 
 product = itertools.product
 
+SOLVERS = ('leastsq', 'sparse')
 
-def run_fit(fit_filename, par, par_indexes, par_fixed, data):
+# Calculation of the Jacobian of the residuals: finite differences for all the
+# points, or analytic derivatives for the points whose model provides them
+# (see chemex.jacobian)
+DERIVATIVES = ('numeric', 'analytic')
+
+# Clusters being fitted by the worker processes. They are set before the pool
+# is created so that the workers inherit them when forked: data points hold
+# closures that cannot be pickled.
+_CLUSTERS = []
+
+
+def run_fit(fit_filename, par, par_indexes, par_fixed, data, nproc=None):
     fit_par_file = ConfigParser.SafeConfigParser()
 
     utils.header1("Fit")
@@ -48,6 +64,8 @@ def run_fit(fit_filename, par, par_indexes, par_fixed, data):
 
         utils.header2(section)
 
+        options = get_fit_options(fit_par_file, section)
+
         items = fit_par_file.items(section)
         par, par_indexes, par_fixed = fix_par(items, par, par_indexes,
                                               par_fixed)
@@ -61,19 +79,14 @@ def run_fit(fit_filename, par, par_indexes, par_fixed, data):
 
         if independent_clusters_no > 1:
 
-            for i, independent_cluster in enumerate(independent_clusters, 1):
+            results = fit_clusters(independent_clusters, par_fixed, nproc,
+                                   options)
 
-                print('\nChi2 / Reduced Chi2 (cluster {}/{}):'
-                      .format(i, independent_clusters_no))
+            for independent_cluster, result in zip(independent_clusters,
+                                                   results):
 
-                c_data, c_par, c_par_indexes = independent_cluster
-                c_par, c_par_err, _c_reduced_chi2 = local_minimization(
-                    c_par,
-                    c_par_indexes,
-                    par_fixed,
-                    c_data,
-                    verbose=True
-                )
+                _c_data, _c_par, c_par_indexes = independent_cluster
+                c_par, c_par_err, _c_reduced_chi2 = result
 
                 for par_name in c_par_indexes:
                     index = par_indexes[par_name]
@@ -83,7 +96,8 @@ def run_fit(fit_filename, par, par_indexes, par_fixed, data):
         else:
             print("\nChi2 / Reduced Chi2:")
             par, par_err, reduced_chi2 = local_minimization(par, par_indexes,
-                                                            par_fixed, data)
+                                                            par_fixed, data,
+                                                            **options)
 
         print("\nFinal Chi2        : {:.3e}".format(
             chi2.calc_chi2(par, par_indexes, par_fixed, data)))
@@ -93,22 +107,174 @@ def run_fit(fit_filename, par, par_indexes, par_fixed, data):
     return par, par_err, par_indexes, par_fixed
 
 
-def local_minimization(par, par_indexes, par_fixed, data, verbose=True):
+def get_fit_options(fit_par_file, section):
     """
-    Minimize the residuals using the Levenberg-Marquard algorithm.
+    Gets the fitting options set in a section of the method file and removes
+    them so that the remaining items are all parameters:
+      * solver = leastsq | sparse
+      * projection = yes | no (analytic elimination of the i0 parameters)
+      * derivatives = numeric | analytic (Jacobian of the residuals)
+    """
+
+    options = {'solver': 'leastsq', 'projection': False,
+               'derivatives': 'numeric'}
+
+    if fit_par_file.has_option(section, 'solver'):
+
+        solver = fit_par_file.get(section, 'solver').strip().lower()
+        fit_par_file.remove_option(section, 'solver')
+
+        if solver not in SOLVERS:
+            exit("Unknown solver '{}' in section [{}]: choose among {}\n"
+                 .format(solver, section, ', '.join(SOLVERS)))
+
+        options['solver'] = solver
+
+    if fit_par_file.has_option(section, 'projection'):
+
+        try:
+            options['projection'] = fit_par_file.getboolean(section,
+                                                            'projection')
+        except ValueError:
+            exit("Option 'projection' in section [{}] should be 'yes' or "
+                 "'no'\n".format(section))
+
+        fit_par_file.remove_option(section, 'projection')
+
+    if fit_par_file.has_option(section, 'derivatives'):
+
+        derivatives = fit_par_file.get(section, 'derivatives').strip().lower()
+        fit_par_file.remove_option(section, 'derivatives')
+
+        if derivatives not in DERIVATIVES:
+            exit("Unknown derivatives '{}' in section [{}]: choose among {}\n"
+                 .format(derivatives, section, ', '.join(DERIVATIVES)))
+
+        options['derivatives'] = derivatives
+
+    return options
+
+
+def fit_clusters(independent_clusters, par_fixed, nproc=None, options=None):
+    """
+    Fit independent clusters, spreading them over 'nproc' worker processes
+    (defaults to the number of cores). Returns the list of (c_par, c_par_err,
+    c_reduced_chi2) in the order of the clusters.
+    """
+
+    global _CLUSTERS
+
+    if options is None:
+        options = {}
+
+    independent_clusters_no = len(independent_clusters)
+
+    if nproc is None:
+        nproc = multiprocessing.cpu_count()
+
+    nproc = max(1, min(nproc, independent_clusters_no))
+
+    if nproc == 1:
+
+        results = list()
+
+        for i, independent_cluster in enumerate(independent_clusters, 1):
+
+            print('\nChi2 / Reduced Chi2 (cluster {}/{}):'
+                  .format(i, independent_clusters_no))
+
+            c_data, c_par, c_par_indexes = independent_cluster
+            results.append(
+                local_minimization(c_par, c_par_indexes, par_fixed, c_data,
+                                   verbose=True, **options)
+            )
+
+        return results
+
+    print('\nFitting {} clusters using {} processes'
+          .format(independent_clusters_no, nproc))
+    print('\nChi2 / Reduced Chi2 (per cluster):')
+
+    _CLUSTERS = [
+        (c_data, c_par, c_par_indexes, par_fixed, options)
+        for c_data, c_par, c_par_indexes in independent_clusters
+    ]
+
+    pool = multiprocessing.Pool(processes=nproc)
+
+    try:
+        results = list()
+
+        for i, result in enumerate(
+                pool.imap(_fit_cluster, range(independent_clusters_no)), 1):
+
+            c_par, c_par_err, c_reduced_chi2 = result
+            c_data = independent_clusters[i - 1][0]
+            c_chi2 = c_reduced_chi2 * (len(c_data) - len(c_par))
+
+            print('  * cluster {}/{}: {:.3e} / {:.3e}'.format(
+                i, independent_clusters_no, c_chi2, c_reduced_chi2))
+
+            results.append(result)
+
+        pool.close()
+
+    except KeyboardInterrupt:
+        pool.terminate()
+        exit("\n -- Keyboard Interrupt: calculation stopped")
+
+    except Exception:
+        # The workers must be stopped before being joined, or join would
+        # fail and hide the error of the worker
+        pool.terminate()
+        raise
+
+    finally:
+        pool.join()
+        _CLUSTERS = []
+
+    return results
+
+
+def _fit_cluster(index):
+    """Fits the cluster number 'index' (run in a worker process)."""
+
+    c_data, c_par, c_par_indexes, par_fixed, options = _CLUSTERS[index]
+
+    try:
+        return local_minimization(c_par, c_par_indexes, par_fixed, c_data,
+                                  verbose=False, **options)
+
+    except SystemExit as error:
+        # SystemExit is not sent back to the parent process by the pool, which
+        # would then wait for the result forever
+        raise RuntimeError('The fit of cluster {} stopped: {}'
+                           .format(index + 1, error.code))
+
+
+def local_minimization(par, par_indexes, par_fixed, data, verbose=True,
+                       solver='leastsq', projection=False,
+                       derivatives='numeric'):
+    """
+    Minimize the residuals using the Levenberg-Marquard algorithm ('leastsq'
+    solver) or a trust-region algorithm working on the sparse Jacobian
+    ('sparse' solver). With 'projection', the i0 parameters are computed in
+    closed form rather than optimized (see chemex.projection). With
+    'analytic' derivatives, the Jacobian rows of the points whose model
+    provides derivatives are calculated from them rather than by finite
+    differences (only without 'projection').
     """
 
-    func = chi2.make_calc_residuals(verbose=verbose)
     args = (par_indexes, par_fixed, data)
 
     try:
-        out = opt.leastsq(func, par, args=args,
-                          full_output=True,
-                          ftol=1e-9,
-                          xtol=1e-9,
-                          maxfev=100000,
-                          epsfcn=1e-10,
-                          factor=0.1)
+        if projection:
+            par, pcov, errmsg, success = _minimize_projected(par, args,
+                                                             verbose, solver,
+                                                             derivatives)
+        else:
+            par, pcov, errmsg, success = _minimize(par, args, verbose, solver,
+                                                   derivatives)
 
     except TypeError:
         sys.stderr.write(' -- Error encountered during minimization:\n')
@@ -118,9 +284,7 @@ def local_minimization(par, par_indexes, par_fixed, data, verbose=True):
         writing.dump_parameters(par, par_indexes, par_fixed, data)
         exit()
 
-    par, pcov, _infodict, errmsg, ier = out
-
-    if ier not in [1, 2, 3, 4]:
+    if not success:
         print(''.join(('Optimal parameters not found: ', errmsg)))
 
     data_nb, par_nb = len(data), len(par)
@@ -137,6 +301,132 @@ def local_minimization(par, par_indexes, par_fixed, data, verbose=True):
     return par, par_err, reduced_chi2
 
 
+def _minimize(par, args, verbose, solver, derivatives='numeric'):
+    """Minimization over all the fitted parameters."""
+
+    par_indexes, _par_fixed, data = args
+
+    func = chi2.make_calc_residuals(verbose=verbose)
+    jac = jacobian.make_calc_jacobian(par_indexes, data, epsfcn=1e-10,
+                                      sparse=(solver == 'sparse'),
+                                      analytic=(derivatives == 'analytic'))
+
+    return MINIMIZERS[solver](func, par, args, jac)
+
+
+def _minimize_projected(par, args, verbose, solver, derivatives='numeric'):
+    """
+    Minimization over the non-linear parameters only, the i0 being computed
+    in closed form for each set of non-linear parameters. The covariance is
+    then obtained from the Jacobian of the full problem at the solution.
+    """
+
+    par_indexes, par_fixed, data = args
+
+    linear_par_names = projection.get_linear_par_names(data, par_indexes)
+
+    if not any(linear_par_names):
+        return _minimize(par, args, verbose, solver, derivatives)
+
+    nl_par, nl_par_indexes, nl_par_fixed = projection.split_par(
+        par, par_indexes, par_fixed, linear_par_names)
+    nl_args = (nl_par_indexes, nl_par_fixed, data)
+
+    func = projection.make_calc_residuals(data, linear_par_names,
+                                          verbose=verbose)
+
+    if nl_par_indexes:
+        jac = jacobian.make_calc_jacobian(
+            nl_par_indexes, data, epsfcn=1e-10,
+            sparse=(solver == 'sparse'),
+            calc_residuals=projection.make_calc_residuals(data,
+                                                          linear_par_names,
+                                                          verbose=False),
+            index_lists=projection.get_par_index_lists(data, nl_par_indexes,
+                                                       linear_par_names)
+        )
+        nl_par, _pcov, errmsg, success = MINIMIZERS[solver](func, nl_par,
+                                                            nl_args, jac)
+    else:
+        errmsg, success = '', True
+
+    # Sets the linear parameters to their value at the solution
+    func(nl_par, *nl_args)
+
+    par = projection.merge_par(nl_par, nl_par_indexes, func.linear_par, par,
+                               par_indexes)
+
+    return par, calc_covariance(par, par_indexes, par_fixed, data), \
+        errmsg, success
+
+
+def _minimize_leastsq(func, par, args, jac):
+    """Levenberg-Marquardt minimization with a dense Jacobian."""
+
+    out = opt.leastsq(func, par, args=args,
+                      Dfun=jac,
+                      full_output=True,
+                      ftol=1e-9,
+                      xtol=1e-9,
+                      maxfev=100000,
+                      epsfcn=1e-10,
+                      factor=0.1)
+
+    par, pcov, _infodict, errmsg, ier = out
+
+    return par, pcov, errmsg, ier in [1, 2, 3, 4]
+
+
+def _minimize_sparse(func, par, args, jac):
+    """
+    Trust-region minimization keeping the Jacobian sparse: the linear
+    least-squares sub-problems are solved iteratively (LSMR), so the memory
+    and time needed no longer grow with the square/cube of the number of
+    fitted parameters.
+    """
+
+    try:
+        from scipy.optimize import least_squares
+    except ImportError:
+        exit("\nThe 'sparse' solver requires SciPy 0.17 or newer\n")
+
+    out = least_squares(func, par, jac=jac, args=args,
+                        method='trf',
+                        tr_solver='lsmr',
+                        x_scale='jac',
+                        ftol=1e-9,
+                        xtol=1e-9,
+                        max_nfev=100000)
+
+    # The covariance matrix is only needed once, at the solution
+    hessian = out.jac.T.dot(out.jac).toarray()
+
+    try:
+        pcov = la.inv(hessian)
+    except la.LinAlgError:
+        pcov = None
+
+    return out.x, pcov, out.message, out.status > 0
+
+
+MINIMIZERS = {'leastsq': _minimize_leastsq, 'sparse': _minimize_sparse}
+
+
+def calc_covariance(par, par_indexes, par_fixed, data):
+    """
+    Calculates the (unscaled) covariance matrix of the fitted parameters from
+    the Jacobian of the residuals at par. Returns None if it is singular.
+    """
+
+    jac = jacobian.make_calc_jacobian(par_indexes, data, epsfcn=1e-10)
+    jac = jac(par, par_indexes, par_fixed, data)
+
+    try:
+        return la.inv(jac.T.dot(jac))
+    except la.LinAlgError:
+        return None
+
+
 def fix_par(items, par, par_indexes, par_fixed):
     """
     Fix (or not) fit variables according to what set in the protocol file.
@@ -199,29 +489,53 @@ def find_independent_clusters(data, par, par_indexes, par_fixed):
     For example, if the population of the minor state and the exchange rate are
     set to 'fix', chances are that the fit can be decomposed
     residue-specifically.
+
+    Parameters are merged with a disjoint-set (union-find) structure, so that
+    two clusters bridged by a later data point end up in the same cluster.
     """
 
     params_fix = set(par_fixed)
 
-    clusters = []
+    parents = {}
+
+    params_pts = []
 
     for data_pt in data:
 
         params_pt = get_params_fit(data_pt, params_fix)
+        params_pts.append(params_pt)
 
-        for data_cluster, params_cluster in clusters:
+        params_pt = iter(params_pt)
+        root = _find_root(parents, next(params_pt, None))
 
-            if params_pt & params_cluster:
-                data_cluster.append(data_pt)
-                params_cluster.update(params_pt)
-                break
+        for param in params_pt:
+            other_root = _find_root(parents, param)
+            if other_root != root:
+                parents[other_root] = root
 
-        else:
-            clusters.append(([data_pt], params_pt))
+    clusters = {}
+    roots = []
+
+    for data_pt, params_pt in zip(data, params_pts):
+
+        if not params_pt:
+            continue
+
+        root = _find_root(parents, next(iter(params_pt)))
+
+        if root not in clusters:
+            clusters[root] = ([], set())
+            roots.append(root)
+
+        data_cluster, params_cluster = clusters[root]
+        data_cluster.append(data_pt)
+        params_cluster.update(params_pt)
 
     clusters_final = list()
 
-    for data_cluster, params_cluster in clusters:
+    for root in roots:
+
+        data_cluster, params_cluster = clusters[root]
 
         par_cluster = []
         par_indexes_cluster = {}
@@ -234,3 +548,22 @@ def find_independent_clusters(data, par, par_indexes, par_fixed):
 
     return clusters_final
 
+
+def _find_root(parents, param):
+    """
+    Returns the representative of the set containing 'param' in the
+    disjoint-set forest 'parents', compressing the path on the way.
+    """
+
+    if param is None:
+        return None
+
+    root = parents.setdefault(param, param)
+
+    while parents[root] != root:
+        root = parents[root]
+
+    while parents[param] != root:
+        parents[param], param = root, parents[param]
+
+    return root
@@ -0,0 +1,327 @@
+"""
+Finite-difference Jacobian of the residuals exploiting their sparsity.
+
+Each data point only depends on a handful of fitted parameters. Parameters
+that never act on the same data point are grouped together ("colored") and
+perturbed simultaneously, so that one residual sweep gives several columns of
+the Jacobian at once.
+
+Optionally, the data points whose back-calculation provides analytic
+derivatives (see chemex.experiments.cpmg.profile.add_derivatives) are taken
+out of the finite-difference sweeps and use those derivatives instead,
+calculated once per profile.
+"""
+
+from collections import OrderedDict
+
+import scipy as sp
+from scipy.sparse import csr_matrix
+
+from chemex import chi2
+from chemex.experiments.base_data_point import make_gather
+
+
+def get_par_index_lists(data, par_indexes):
+    """Returns, for each data point, the indexes of the fitted parameters it
+    depends on."""
+
+    index_lists = []
+
+    for data_pt in data:
+        par_names = (data_pt.get_fitting_parameter_names() |
+                     data_pt.get_fixed_parameter_names())
+        index_lists.append(sorted(par_indexes[par_name]
+                                  for par_name in par_names
+                                  if par_name in par_indexes))
+
+    return index_lists
+
+
+def color_columns(index_lists, par_nb):
+    """
+    Groups the columns of the Jacobian so that no two columns of a group have
+    a non-zero element on the same row (greedy coloring, largest columns
+    first).
+
+    Returns the list of groups and the rows attached to each column.
+    """
+
+    rows = [[] for _ in range(par_nb)]
+
+    for row, indexes in enumerate(index_lists):
+        for index in indexes:
+            rows[index].append(row)
+
+    groups = []
+    groups_rows = []
+
+    for index in sorted(range(par_nb), key=lambda i: -len(rows[i])):
+
+        index_rows = set(rows[index])
+
+        for group, group_rows in zip(groups, groups_rows):
+            if not index_rows & group_rows:
+                group.append(index)
+                group_rows.update(index_rows)
+                break
+
+        else:
+            groups.append([index])
+            groups_rows.append(index_rows)
+
+    rows = [sp.asarray(index_rows, dtype=int) for index_rows in rows]
+
+    return groups, rows
+
+
+def make_calc_derivatives(data, rows, par_indexes):
+    """
+    Factory to make a function calculating the Jacobian rows of the points
+    whose back-calculation provides analytic derivatives.
+
+    The points are grouped by profile (same model, parameters and settings,
+    only the variable differs) and the derivatives of all the points of a
+    profile are calculated in one call. The parameters of all the profiles
+    are extracted at once (see
+    chemex.experiments.base_data_point.make_gather).
+
+    Parameters
+    ----------
+    data : list of DataPoint
+        The data points.
+    rows : sequence of int
+        The rows of the points providing analytic derivatives.
+    par_indexes : dict
+        Positions of the fitted parameters.
+
+    Returns
+    -------
+    out : function, list of int
+        calc_derivatives(par, par_indexes, par_fixed) returns the rows,
+        columns and values of the elements of the Jacobian; and the rows it
+        calculates. The profiles depending on fitted parameters the model
+        cannot differentiate with respect to are left out.
+
+    """
+
+    groups = OrderedDict()
+
+    for row in rows:
+
+        data_pt = data[row]
+
+        if data_pt.calc_compiled is None:
+            data_pt.compile_calc()
+
+        calc_observable = data_pt.calc_observable
+        defaults = tuple((name, data_pt.kwargs_default[name])
+                         for name in data_pt.arg_names[len(data_pt.long_names):]
+                         if name != calc_observable.variable)
+
+        groups.setdefault(
+            (calc_observable, data_pt.long_names, data_pt.arg_names, defaults),
+            []
+        ).append(row)
+
+    profiles, long_names, rows_used = [], [], []
+
+    for (calc_observable, p_long_names, arg_names, defaults), p_rows in (
+            groups.items()):
+
+        names = arg_names[:len(p_long_names)]
+        fitted = dict((name, par_indexes[long_name])
+                      for name, long_name in zip(names, p_long_names)
+                      if long_name in par_indexes)
+
+        if not set(fitted) - {'i0'} <= set(calc_observable.derivative_names):
+            continue
+
+        d_names = tuple(name for name in calc_observable.derivative_names
+                        if name in fitted)
+
+        variables = [data[row].kwargs_default[calc_observable.variable]
+                     for row in p_rows]
+        values = calc_observable.values
+
+        if not set(variables) <= set(values):
+            values = tuple(sorted(set(variables)))
+
+        # The derivative with respect to i0 is the intensity for i0 = 1
+        columns = ([fitted['i0']] if 'i0' in fitted else []) + [
+            fitted[name] for name in d_names]
+
+        rows_used.extend(p_rows)
+
+        if not columns:
+            continue
+
+        profiles.append({
+            'calc': calc_observable.calc_profile_derivatives,
+            'names': names,
+            'defaults': dict(defaults),
+            'start': len(long_names),
+            'stop': len(long_names) + len(p_long_names),
+            'values': values,
+            'd_names': d_names,
+            'with_i0': 'i0' in fitted,
+            'positions': sp.asarray([values.index(variable)
+                                     for variable in variables], dtype=int),
+            'errs': sp.asarray([data[row].err for row in p_rows]),
+            'rows': sp.repeat(p_rows, len(columns)),
+            'cols': sp.tile(sp.asarray(columns, dtype=int), len(p_rows)),
+        })
+
+        long_names.extend(p_long_names)
+
+    gather = make_gather(long_names)
+
+    def calc_derivatives(par, par_indexes, par_fixed):
+        """Calculates the Jacobian rows of the points."""
+
+        par_values = gather(par, par_indexes, par_fixed)
+
+        all_rows, all_cols, all_vals = [], [], []
+
+        for profile in profiles:
+
+            kwargs = dict(zip(profile['names'],
+                              par_values[profile['start']:profile['stop']]))
+            i0 = kwargs.pop('i0', 1.0)
+            kwargs.update(profile['defaults'])
+
+            mags, d_mags = profile['calc'](profile['values'],
+                                           profile['d_names'], **kwargs)
+
+            positions = profile['positions']
+            blocks = [i0 * d_mags[:, positions]]
+
+            if profile['with_i0']:
+                blocks.insert(0, mags[sp.newaxis, positions])
+
+            vals = -sp.concatenate(blocks) / profile['errs']
+
+            all_rows.append(profile['rows'])
+            all_cols.append(profile['cols'])
+            all_vals.append(vals.T.ravel())
+
+        return all_rows, all_cols, all_vals
+
+    return calc_derivatives, rows_used
+
+
+def make_calc_jacobian(par_indexes, data, epsfcn=1e-10, sparse=False,
+                       calc_residuals=None, index_lists=None,
+                       analytic=False):
+    """
+    Factory to make a "calc_jacobian" function usable as 'Dfun' in
+    scipy.optimize.leastsq (or as 'jac' in scipy.optimize.least_squares when
+    'sparse' is True, in which case a CSR matrix is returned).
+
+    The step sizes are the ones leastsq would use for its own forward
+    differences: sqrt(epsfcn) * |x|, or sqrt(epsfcn) if x is zero.
+
+    A residual function other than chemex.chi2's can be provided along with
+    the parameters each residual depends on ('index_lists'); all the
+    derivatives are then obtained by finite differences over the whole
+    dataset.
+
+    With 'analytic', the points whose back-calculation provides analytic
+    derivatives use them (see make_calc_derivatives) rather than finite
+    differences.
+    """
+
+    par_nb = len(par_indexes)
+    data_nb = len(data)
+
+    calc_derivatives, analytic_rows = None, []
+
+    if calc_residuals is None:
+
+        calc_residuals = chi2.make_calc_residuals(verbose=False)
+
+        if analytic:
+            calc_derivatives, analytic_rows = make_calc_derivatives(
+                data,
+                [row for row, data_pt in enumerate(data)
+                 if data_pt.has_derivatives()],
+                par_indexes
+            )
+
+    numeric_rows = sorted(set(range(data_nb)) - set(analytic_rows))
+    numeric_data = [data[row] for row in numeric_rows]
+
+    if index_lists is None:
+        index_lists = get_par_index_lists(numeric_data, par_indexes)
+
+    groups, rows = color_columns(index_lists, par_nb)
+    eps = sp.sqrt(max(epsfcn, sp.finfo(float).eps))
+
+    numeric_rows = sp.asarray(numeric_rows, dtype=int)
+    jac_rows = sp.concatenate([sp.zeros(0, dtype=int)] + rows)
+    jac_cols = sp.concatenate(
+        [sp.zeros(0, dtype=int)] +
+        [sp.zeros(len(index_rows), dtype=int) + index
+         for index, index_rows in enumerate(rows)]
+    )
+    offsets = sp.cumsum([0] + [len(index_rows) for index_rows in rows])
+
+    def calc_jacobian(par, par_indexes, par_fixed, data):
+        """Calculates the Jacobian of the residuals at par."""
+
+        par = sp.asarray(par, dtype=float)
+
+        jac_vals = sp.zeros(len(jac_rows))
+
+        if numeric_data:
+
+            steps = eps * abs(par)
+            steps[steps == 0.0] = eps
+
+            residuals = sp.asarray(
+                calc_residuals(par, par_indexes, par_fixed, numeric_data)
+            )
+
+            for group in groups:
+
+                par_step = par.copy()
+                par_step[group] += steps[group]
+
+                residuals_step = sp.asarray(
+                    calc_residuals(par_step, par_indexes, par_fixed,
+                                   numeric_data)
+                )
+
+                for index in group:
+                    index_rows = rows[index]
+                    jac_vals[offsets[index]:offsets[index + 1]] = (
+                        (residuals_step[index_rows] - residuals[index_rows]) /
+                        steps[index]
+                    )
+
+        all_rows = [numeric_rows[jac_rows]]
+        all_cols = [jac_cols]
+        all_vals = [jac_vals]
+
+        if calc_derivatives is not None:
+            rows_d, cols_d, vals_d = calc_derivatives(par, par_indexes,
+                                                      par_fixed)
+            all_rows.extend(rows_d)
+            all_cols.extend(cols_d)
+            all_vals.extend(vals_d)
+
+        all_rows = sp.concatenate(all_rows)
+        all_cols = sp.concatenate(all_cols)
+        all_vals = sp.concatenate(all_vals)
+
+        if sparse:
+            return csr_matrix((all_vals, (all_rows, all_cols)),
+                              shape=(data_nb, par_nb))
+
+        jacobian = sp.zeros((data_nb, par_nb))
+        jacobian[all_rows, all_cols] = all_vals
+
+        return jacobian
+
+    calc_jacobian.groups_nb = len(groups)
+
+    return calc_jacobian
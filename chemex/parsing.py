@@ -131,6 +131,29 @@ def arg_parse():
         help='No plots of the fits'
     )
 
+    parser_fit.add_argument(
+        '--nproc',
+        metavar='N',
+        type=int,
+        help='Number of processes used to fit independent clusters '
+             '(default: number of cores)'
+    )
+
+    parser_fit.add_argument(
+        '--cache-mb',
+        metavar='MB',
+        type=float,
+        help='Memory budget of the caches of the back-calculations, in MB '
+             'per process (default: no limit)'
+    )
+
+    parser_fit.add_argument(
+        '--cache-stats',
+        action='store_true',
+        help='Print the hits, misses and memory of the caches by experiment '
+             'type after the fit'
+    )
+
     group_residue_selec = parser_fit.add_mutually_exclusive_group()
 
     group_residue_selec.add_argument(
@@ -165,6 +188,21 @@ def arg_parse():
         help='Run N Bootstrap simulation'
     )
 
+    parser_fit.add_argument(
+        '--seed',
+        metavar='SEED',
+        type=int,
+        help='Seed of the random generator used by the Monte-Carlo/Bootstrap '
+             'simulations (replicate i uses SEED + i)'
+    )
+
+    parser_fit.add_argument(
+        '--aggregate',
+        action='store_true',
+        help='Only write statistics over the Monte-Carlo/Bootstrap '
+             'replicates, without any per-replicate output'
+    )
+
     args = parser.parse_args()
 
     if args.commands == 'fit':
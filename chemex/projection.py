@@ -0,0 +1,172 @@
+"""
+Variable projection of the linear intensity parameters (i0).
+
+The back-calculated intensities are all of the form i0 * f(pb, kex, ...), so
+for a given set of non-linear parameters, the value of each i0 minimizing the
+chi2 is known in closed form (weighted linear least squares over the points
+sharing that i0):
+
+    i0 = sum(val * f / err^2) / sum(f^2 / err^2)
+
+Removing the i0 from the parameters seen by the optimizer shrinks the
+Jacobian and usually the number of iterations.
+"""
+
+import sys
+
+import scipy as sp
+
+from chemex.experiments.profile import make_calc_vals
+
+LINEAR_PAR_NAME = 'i0'
+
+
+def get_linear_par_names(data, par_indexes):
+    """
+    Returns, for each data point, the long name of its fitted i0 parameter
+    (None when the point has no i0 or when it is not fitted).
+    """
+
+    linear_par_names = []
+
+    for data_pt in data:
+        par_name = dict(data_pt.short_long_par_names).get(LINEAR_PAR_NAME)
+        linear_par_names.append(par_name if par_name in par_indexes else None)
+
+    return linear_par_names
+
+
+def split_par(par, par_indexes, par_fixed, linear_par_names):
+    """
+    Removes the linear parameters from the fitted parameters. They are set to
+    1.0 in the fixed parameters so that the data points back-calculate f.
+    """
+
+    linear_par_names = set(linear_par_names) - {None}
+
+    nl_par = []
+    nl_par_indexes = {}
+
+    for par_name, index in sorted(par_indexes.items(), key=lambda x: x[1]):
+        if par_name not in linear_par_names:
+            nl_par_indexes[par_name] = len(nl_par)
+            nl_par.append(par[index])
+
+    nl_par_fixed = dict(par_fixed)
+    nl_par_fixed.update((par_name, 1.0) for par_name in linear_par_names)
+
+    return sp.asarray(nl_par), nl_par_indexes, nl_par_fixed
+
+
+def merge_par(nl_par, nl_par_indexes, linear_par, par, par_indexes):
+    """Puts the non-linear and the linear parameters back together."""
+
+    par = sp.array(par, dtype=float)
+
+    for par_name, index in nl_par_indexes.items():
+        par[par_indexes[par_name]] = nl_par[index]
+
+    for par_name, val in linear_par.items():
+        par[par_indexes[par_name]] = val
+
+    return par
+
+
+def get_par_index_lists(data, nl_par_indexes, linear_par_names):
+    """
+    Returns, for each data point, the indexes of the non-linear parameters its
+    projected residual depends on: those of all the points sharing its i0.
+    """
+
+    index_sets = []
+    index_sets_linear = {}
+
+    for data_pt, linear_par_name in zip(data, linear_par_names):
+
+        par_names = (data_pt.get_fitting_parameter_names() |
+                     data_pt.get_fixed_parameter_names())
+        indexes = set(nl_par_indexes[par_name] for par_name in par_names
+                      if par_name in nl_par_indexes)
+
+        if linear_par_name is not None:
+            indexes = index_sets_linear.setdefault(linear_par_name, set())
+            indexes.update(nl_par_indexes[par_name] for par_name in par_names
+                           if par_name in nl_par_indexes)
+
+        index_sets.append(indexes)
+
+    return [sorted(indexes) for indexes in index_sets]
+
+
+def make_calc_residuals(data, linear_par_names, verbose=True,
+                        threshold=1e-3):
+    """
+    Factory to make the "calc_residuals" function of the projected problem.
+    Its arguments are the non-linear parameters (see split_par). The values
+    of the linear parameters computed during the last call are available in
+    calc_residuals.linear_par.
+    """
+
+    names = sorted(set(linear_par_names) - {None})
+    groups = dict((par_name, index) for index, par_name in enumerate(names))
+    groups = sp.asarray([groups.get(par_name, -1)
+                         for par_name in linear_par_names])
+    projected = groups >= 0
+    groups_projected = groups[projected]
+
+    vals = sp.asarray([data_pt.val for data_pt in data])
+    weights = sp.asarray([data_pt.err for data_pt in data]) ** -2
+
+    par_nb_linear = len(names)
+
+    calc_vals = make_calc_vals(data)
+
+    def calc_residuals(par, par_indexes, par_fixed, data):
+        """
+        Calculate the residuals for all values knowing the non-linear
+        parameters par
+        """
+
+        try:
+            cals = calc_vals(par, par_indexes, par_fixed)
+
+        except KeyboardInterrupt:
+            sys.stderr.write("\n -- Keyboard Interrupt: calculation stopped")
+            sys.exit()
+
+        cals_projected = cals[projected]
+        num = sp.bincount(groups_projected,
+                          weights=(vals * cals * weights)[projected],
+                          minlength=par_nb_linear)
+        den = sp.bincount(groups_projected,
+                          weights=(cals ** 2 * weights)[projected],
+                          minlength=par_nb_linear)
+
+        linear_par = num / sp.where(den > 0.0, den, 1.0)
+        cals[projected] = linear_par[groups_projected] * cals_projected
+
+        for data_pt, cal in zip(data, cals):
+            data_pt.cal = cal
+
+        calc_residuals.linear_par = dict(zip(names, linear_par))
+
+        residuals = (vals - cals) * sp.sqrt(weights)
+
+        if verbose:
+
+            chi2 = sum(residuals ** 2)
+
+            if (calc_residuals.old_chi2 - chi2) / calc_residuals.old_chi2 > \
+                    threshold:
+                reduced_chi2 = chi2 / (len(data) - len(par) - par_nb_linear)
+                sys.stdout.write('  * {:.3e} / {:.3e}\n'.format(chi2,
+                                                                reduced_chi2))
+                sys.stdout.flush()
+                calc_residuals.old_chi2 = chi2
+
+        return residuals
+
+    calc_residuals.old_chi2 = sys.float_info.max
+    calc_residuals.linear_par = {}
+
+    return calc_residuals
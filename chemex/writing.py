@@ -5,6 +5,8 @@ import scipy as sc
 import scipy.stats as st
 
 from chemex.experiments import plotting
+from chemex.experiments.misc import B1_INH_RES_REF, make_data_ref
+from chemex.experiments.profile import make_calc_vals
 
 
 def write_dat(data, output_dir='./'):
@@ -121,6 +123,103 @@ def write_chi2(par, par_indexes, par_fixed, data, output_dir='./'):
         )
 
 
+def write_b1_inh_error(par, par_indexes, par_fixed, data, output_dir='./'):
+    """
+    Write, for the experiments sampling the B1 inhomogeneity with a
+    quadrature, the deviation of the back-calculated intensities from those
+    obtained with the dense linspace grid. Both are calculated in batches of
+    profiles (see chemex.experiments.profile.make_calc_vals).
+    """
+
+    data = [data_point for data_point in data
+            if getattr(data_point, 'calc_observable_ref', None) is not None]
+
+    if not data:
+        return
+
+    cals = make_calc_vals(data)(par, par_indexes, par_fixed)
+    cals_ref = make_calc_vals(make_data_ref(data))(par, par_indexes,
+                                                   par_fixed)
+
+    datasets = dict()
+
+    for index, data_point in enumerate(data):
+        experiment_name = data_point.par['experiment_name']
+        datasets.setdefault(experiment_name, list()).append(index)
+
+    filename = os.path.join(output_dir, 'b1_inh_error.fit')
+
+    with open(filename, 'w') as f:
+        print("  * {}".format(filename))
+
+        f.write(
+            '# {:>15s} {:>15s} {:>15s} {:>15s} {:>15s} {:>15s}  {:s}\n'
+            .format('scheme', 'b1_inh_res', 'b1_inh_res_ref', 'max(|dI|)',
+                    'rms(dI)', 'max(|dI|/err)', 'experiment')
+        )
+
+        for experiment_name, indexes in sorted(datasets.items()):
+
+            deviations = cals[indexes] - cals_ref[indexes]
+            errs = sc.asarray([data[index].err for index in indexes])
+            par_exp = data[indexes[0]].par
+
+            f.write(
+                '  {:>15s} {: 15d} {: 15d} {: 15.5e} {: 15.5e} {: 15.5e}  '
+                '{:s}\n'
+                .format(par_exp['b1_inh_scheme'],
+                        par_exp['b1_inh_res'],
+                        B1_INH_RES_REF,
+                        max(abs(deviations)),
+                        sc.sqrt(sc.mean(deviations ** 2)),
+                        max(abs(deviations) / errs),
+                        experiment_name)
+            )
+
+
+def write_statistics(aggregator, simulation, seed, output_dir='./'):
+    """
+    Write the statistics over the bootstrap/Monte-Carlo replicates: mean,
+    standard deviation and quantiles of every fitted parameter, followed by
+    their covariance matrix.
+    """
+
+    filename = os.path.join(output_dir, '{}.fit'.format(simulation))
+
+    percents = (2.5, 50.0, 97.5)
+    quantiles = aggregator.get_quantiles(percents)
+    std = aggregator.get_std()
+    covariance = aggregator.get_covariance()
+
+    with open(filename, 'w') as f:
+        print("  * {}".format(filename))
+
+        f.write('# {} replicates, seed {}\n'.format(aggregator.count, seed))
+
+        f.write(
+            '# {:>4s} {:>15s} {:>15s} {:>15s} {:>15s} {:>15s}  {:s}\n'
+            .format('#', 'mean', 'std', '{}%'.format(percents[0]),
+                    '{}%'.format(percents[1]), '{}%'.format(percents[2]),
+                    'parameter')
+        )
+
+        for index, name in enumerate(aggregator.par_names):
+            f.write(
+                '  {:4d} {: 15.5e} {: 15.5e} {: 15.5e} {: 15.5e} {: 15.5e}  '
+                '{:s}\n'
+                .format(index, aggregator.mean[index], std[index],
+                        quantiles[0][index], quantiles[1][index],
+                        quantiles[2][index],
+                        ', '.join([str(_).upper() for _ in name]))
+            )
+
+        f.write('\n# covariance (rows and columns numbered as above)\n')
+
+        for row in covariance:
+            f.write(' '.join('{: .5e}'.format(val) for val in row))
+            f.write('\n')
+
+
 def dump_parameters(par, par_indexes, par_fixed, data):
     """ The program has failed. Dump parameters to chemex_dump """
 